@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import zlib
+import base64
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ItemProperty as iprop
+
+import logging
+logger = logging.getLogger("PySel.ContentHash")
+
+# block sizes as in lib/protocol of Syncthing
+MIN_BLOCK_SIZE = 128 << 10
+MAX_BLOCK_SIZE = 16 << 20
+DESIRED_PER_FILE_BLOCKS = 2000
+
+
+def blockSize(size):
+    bs = MIN_BLOCK_SIZE
+    while bs < MAX_BLOCK_SIZE and size >= DESIRED_PER_FILE_BLOCKS * bs:
+        bs <<= 1
+    return bs
+
+
+def hashBlocks(path, size):
+    '''
+    (sha256, adler32) of every block, the file is mapped to memory instead of reading.
+    An empty file has one empty block without weak hash as in Syncthing.
+    '''
+    if size == 0:
+        return [(hashlib.sha256(b'').digest(), 0)]
+    bs = blockSize(size)
+    rv = []
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            mv = memoryview(mm)
+            try:
+                for off in range(0, len(mm), bs):
+                    with mv[off:off + bs] as block:
+                        rv.append((hashlib.sha256(block).digest(), zlib.adler32(block)))
+            finally:
+                mv.release()
+    return rv
+
+
+def blocksHash(blocks, weak=True):
+    '''
+    hash of the block list, the same as FileInfo.BlocksHash: sha256 over the hash and the big
+    endian uint32 weak hash of each block. Syncthing without weak hashes writes zeros, weak=False.
+    '''
+    h = hashlib.sha256()
+    for b, w in blocks:
+        h.update(b)
+        h.update((w if weak else 0).to_bytes(4, 'big'))
+    return h.digest()
+
+
+class HashCache:
+    '''
+    persistent blocks hashes keyed by (device, inode, size, mtime), the hash with weak hashes
+    followed by the one without them
+    '''
+    def __init__(self, filename):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS blockshashes (dev INTEGER, ino INTEGER, '
+                         'size INTEGER, mtime INTEGER, hash BLOB, PRIMARY KEY (dev, ino))')
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT hash FROM blockshashes WHERE dev=? AND ino=? AND size=? AND mtime=?',
+                                   key).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, key, h):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO blockshashes VALUES (?, ?, ?, ?, ?)', key + (h,))
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+class ContentVerifier:
+    '''
+    Rechecks the conflicts found by size and modification time against the blocks hash
+    of the database, only files with changed metadata are hashed again.
+    '''
+    def __init__(self, cachefile, workers=None):
+        self._cache = HashCache(cachefile)
+        self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(),
+                                            thread_name_prefix="PySel.Hash")
+
+    def localBlocksHashes(self, path):
+        'the blocks hashes of the file with and without weak hashes'
+        st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        h = self._cache.get(key)
+        if h is None:
+            logger.debug("Hash {}".format(path))
+            blocks = hashBlocks(path, st.st_size)
+            h = blocksHash(blocks) + blocksHash(blocks, weak=False)
+            self._cache.put(key, h)
+        return h[:32], h[32:]
+
+    def _sameContent(self, path, remote):
+        try:
+            return remote in self.localBlocksHashes(path)
+        except OSError as e:
+            logger.warning("Cannot hash {}: {}".format(path, e))
+            return False
+
+    def refineConflicts(self, l, path):
+        'turns conflicted files of the list with the same content as in the database into existing'
+        cand = []
+        for v in l:
+            if v.syncstate is not iprop.SyncState.conflict or v.isDir() or not v.blockshash:
+                continue
+            fn = os.path.join(path, v.name)
+            try:
+                if os.path.getsize(fn) != v.size:
+                    continue  # differs for sure
+            except OSError as e:
+                logger.warning("Cannot verify {}: {}".format(fn, e))
+                continue  # stays a conflict
+            cand.append((v, fn, base64.b64decode(v.blockshash)))
+        if len(cand) == 0:
+            return
+        res = self._executor.map(lambda c: self._sameContent(c[1], c[2]), cand)
+        for (v, fn, remote), same in zip(cand, res):
+            if same:
+                logger.debug("item {} has the same content, not a conflict".format(v.name))
+                v.syncstate = iprop.SyncState.exists
+        self._cache.commit()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._cache.close()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hmac
+import json
+import socket
+import getpass
+import secrets
+import threading
+import socketserver
+import urllib.parse
+from collections import OrderedDict
+
+import requests
+
+from SyncthingAPI import SyncthingAPI
+
+import logging
+logger = logging.getLogger("PySel.Daemon")
+
+# the protocol is one json object per line, every request gets one response
+# {"op": "get", "suff": ...} -> {"ok": true, "data": ...} or {"ok": false, "error": ...}
+# {"op": "post", "suff": ..., "data": ...}
+# {"op": "snapshot"} -> version, folders and request counters
+# {"op": "subscribe"} -> the connection streams {"event": ..., "folder": ..., "invalidated": [...]}
+# over TCP every request carries "token", the one the daemon writes into tokenFile()
+
+# the endpoints the viewer reads, system/config is passed without the keys and devices
+GET_ENDPOINTS = ('svc/report', 'stats/folder', 'system/config', 'db/ignores', 'db/browse', 'db/file')
+POST_ENDPOINTS = ('db/ignores',)
+
+# events after which cached index data of the folder is outdated
+FOLDER_EVENTS = ('LocalIndexUpdated', 'RemoteIndexUpdated', 'ItemFinished')
+# .stignore can be edited outside Syncthing without an event, so it is always read again
+UNCACHED = ('db/ignores',)
+
+
+def privateDir():
+    'the runtime directory of the user or ~/.pysel which only the user can enter'
+    rundir = os.environ.get('XDG_RUNTIME_DIR')
+    if rundir:
+        return rundir
+    rundir = os.path.join(os.path.expanduser('~'), '.pysel')
+    os.makedirs(rundir, mode=0o700, exist_ok=True)
+    return rundir
+
+
+def defaultAddress():
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(privateDir(), 'pysel-{}.sock'.format(getpass.getuser()))
+    return ('127.0.0.1', 18384)
+
+
+def tokenFile():
+    return os.path.join(privateDir(), 'pysel-{}.token'.format(getpass.getuser()))
+
+
+def readToken():
+    try:
+        with open(tokenFile()) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+def isListening(address):
+    'something accepts connections at the address, e.g. another daemon'
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(address)
+        except OSError:
+            return False
+    return True
+
+
+def _splitSuffix(suff):
+    u = urllib.parse.urlsplit(suff)
+    return u.path, dict(urllib.parse.parse_qsl(u.query))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.syncdaemon
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+            except ValueError:
+                logger.warning("Wrong request: {}".format(line))
+                return
+            if not daemon.authorized(req):
+                logger.warning("Request without the token")
+                self.wfile.write(json.dumps({'ok': False, 'error': 'Wrong token'}).encode('utf-8') + b'\n')
+                return
+            if req.get('op') == 'subscribe':
+                daemon._subscribe(self.wfile)
+                try:
+                    for _ in self.rfile:  # wait until the viewer goes away
+                        pass
+                finally:
+                    daemon._unsubscribe(self.wfile)
+                return
+            self.wfile.write(json.dumps(daemon.handle(req)).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class SyncthingDaemon(SyncthingAPI):
+    '''
+    Long-lived owner of the Syncthing session. Responses are cached until an event
+    of Syncthing outdates them, so attached viewers (see DaemonAPI) share one warm cache.
+    The least recently used responses beyond maxcached are dropped.
+    '''
+    def __init__(self, maxcached=1024):
+        SyncthingAPI.__init__(self)
+        self._cache = OrderedDict()  # suffix -> response
+        self._maxcached = maxcached
+        self._cacheLock = threading.Lock()
+        self._subscribers = []
+        self._subLock = threading.Lock()
+        self._lastEventId = 0
+        self._stop = threading.Event()
+        self._token = None  # required over TCP
+
+    def _getRequest(self, suff):
+        if _splitSuffix(suff)[0] in UNCACHED:
+            return SyncthingAPI._getRequest(self, suff)
+        with self._cacheLock:
+            if suff in self._cache:
+                self._cache.move_to_end(suff)
+                return self._cache[suff]
+        rv = SyncthingAPI._getRequest(self, suff)
+        with self._cacheLock:
+            self._cache[suff] = rv
+            while len(self._cache) > self._maxcached:
+                self._cache.popitem(last=False)
+        return rv
+
+    def _getRequestCached(self, suff):
+        # the config is dropped on ConfigSaved, no need to revalidate
+        return self._getRequest(suff)
+
+    def _invalidate(self, pred):
+        'drops cached responses for which pred(endpoint, query) is True, returns their suffixes'
+        with self._cacheLock:
+            dropped = [s for s in self._cache if pred(*_splitSuffix(s))]
+            for s in dropped:
+                del self._cache[s]
+        return dropped
+
+    def authorized(self, req):
+        return self._token is None or hmac.compare_digest(str(req.get('token', '')), self._token)
+
+    def handle(self, req):
+        try:
+            op = req.get('op')
+            if op == 'get':
+                ep = _splitSuffix(req['suff'])[0]
+                if ep not in GET_ENDPOINTS:
+                    return {'ok': False, 'error': 'Endpoint {} is not allowed'.format(ep)}
+                rv = self._getRequest(req['suff'])
+                if ep == 'system/config':
+                    rv = {'folders': [{k: f.get(k) for k in ('id', 'label', 'path')} for f in rv.get('folders', [])]}
+                return {'ok': True, 'data': rv}
+            elif op == 'post':
+                ep = _splitSuffix(req['suff'])[0]
+                if ep not in POST_ENDPOINTS:
+                    return {'ok': False, 'error': 'Endpoint {} is not allowed'.format(ep)}
+                self._postRequest(req['suff'], req['data'])
+                fid = _splitSuffix(req['suff'])[1].get('folder')
+                dropped = self._invalidate(lambda ep, q: q.get('folder') == fid)
+                self._broadcast({'event': 'IgnoresPosted', 'folder': fid, 'invalidated': dropped})
+                return {'ok': True, 'data': None}
+            elif op == 'snapshot':
+                return {'ok': True, 'data': {'version': self.getVersion(), 'folders': self.getFoldersDict(),
+                                             'requests': self.requestCounters()}}
+            return {'ok': False, 'error': 'Unknown operation {}'.format(op)}
+        except Exception as e:
+            logger.info("Request {} failed: {}".format(req, e))
+            return {'ok': False, 'error': str(e)}
+
+    def _subscribe(self, wfile):
+        with self._subLock:
+            self._subscribers.append(wfile)
+        logger.info("Viewer subscribed, {} in total".format(len(self._subscribers)))
+
+    def _unsubscribe(self, wfile):
+        with self._subLock:
+            if wfile in self._subscribers:
+                self._subscribers.remove(wfile)
+
+    def _broadcast(self, delta):
+        line = json.dumps(delta).encode('utf-8') + b'\n'
+        with self._subLock:
+            for wfile in self._subscribers[:]:
+                try:
+                    wfile.write(line)
+                    wfile.flush()
+                except OSError:
+                    self._subscribers.remove(wfile)
+
+    def _applyEvent(self, ev):
+        data = ev.get('data') or {}
+        if ev.get('type') in FOLDER_EVENTS:
+            fid = data.get('folder')
+            return self._invalidate(lambda ep, q: ep in ('db/browse', 'db/file') and q.get('folder') == fid)
+        if ev.get('type') == 'ConfigSaved':
+            return self._invalidate(lambda ep, q: ep in ('system/config', 'stats/folder'))
+        return []
+
+    def _eventLoop(self):
+        while not self._stop.is_set():
+            try:
+                # long polling, not cached
+                evs = self._longPoll('events?since={}&timeout=60'.format(self._lastEventId), 60)
+            except Exception as e:
+                logger.warning("Cannot read events: {}".format(e))
+                self._stop.wait(5)
+                continue
+            if not isinstance(evs, list):  # no events in this syncthing
+                self._stop.wait(5)
+                continue
+            for ev in evs:
+                self._lastEventId = max(self._lastEventId, ev.get('id', 0))
+                dropped = self._applyEvent(ev)
+                if len(dropped) > 0:
+                    self._broadcast({'event': ev.get('type'), 'folder': (ev.get('data') or {}).get('folder'),
+                                     'invalidated': dropped})
+
+    def serve(self, address=None):
+        address = address or defaultAddress()
+        if isListening(address):
+            raise RuntimeError("Another daemon listens on {}".format(address))
+        # the socket and the token are created for the user only
+        umask = os.umask(0o077)
+        try:
+            if isinstance(address, str):
+                if os.path.exists(address):
+                    os.remove(address)  # stale socket of a previous run
+                server = socketserver.ThreadingUnixStreamServer(address, _Handler)
+            else:
+                # any local user can connect to the port
+                self._token = secrets.token_urlsafe(32)
+                if os.path.exists(tokenFile()):
+                    os.remove(tokenFile())
+                with open(tokenFile(), 'w') as f:
+                    f.write(self._token)
+                server = _TCPServer(address, _Handler)
+        finally:
+            os.umask(umask)
+        server.daemon_threads = True
+        server.syncdaemon = self
+        logger.info("Daemon listens on {}".format(address))
+        threading.Thread(target=self._eventLoop, name="PySel.Events", daemon=True).start()
+        try:
+            self.getVersion()
+            self.prewarmFolders(self.getFoldersDict().keys())
+        except Exception as e:
+            logger.warning("Cannot prewarm: {}".format(e))
+        try:
+            server.serve_forever()
+        finally:
+            self._stop.set()
+            server.server_close()
+            if isinstance(address, str) and os.path.exists(address):
+                os.remove(address)
+            if self._token is not None and os.path.exists(tokenFile()):
+                os.remove(tokenFile())
+            self.close()
+
+
+class DaemonAPI(SyncthingAPI):
+    'SyncthingAPI which sends the requests through a running SyncthingDaemon'
+    def __init__(self, address=None):
+        SyncthingAPI.__init__(self)
+        self.address = address or defaultAddress()
+        self._local = threading.local()
+
+    def startSession(self):
+        # the daemon owns the session, the connections are reopened lazily
+        self._local = threading.local()
+
+    def _connect(self):
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+        s = socket.socket(family, socket.SOCK_STREAM)
+        s.connect(self.address)
+        return s.makefile('rwb')
+
+    def _withToken(self, req):
+        if not isinstance(self.address, str):
+            req['token'] = readToken()
+        return req
+
+    def _call(self, req):
+        f = getattr(self._local, 'conn', None)
+        req = self._withToken(req)
+        try:
+            if f is None:
+                f = self._local.conn = self._connect()
+            f.write(json.dumps(req).encode('utf-8') + b'\n')
+            f.flush()
+            line = f.readline()
+        except OSError as e:
+            self._local.conn = None
+            raise requests.RequestException('Daemon is not available: {}'.format(e))
+        if not line:
+            self._local.conn = None
+            raise requests.RequestException('Daemon closed the connection')
+        rv = json.loads(line)
+        if not rv['ok']:
+            raise requests.RequestException(rv['error'])
+        return rv['data']
+
+    def _getRequest(self, suff):
+        return self._call({'op': 'get', 'suff': suff})
+
+    def _getRequestCached(self, suff):
+        return self._getRequest(suff)
+
+    def _postRequest(self, suff, d):
+        self._call({'op': 'post', 'suff': suff, 'data': d})
+
+    def snapshot(self):
+        return self._call({'op': 'snapshot'})
+
+    def subscribe(self, callback=None):
+        'local caches follow the daemon, callback(delta) is called from a background thread'
+        def loop():
+            try:
+                f = self._connect()
+                f.write(json.dumps(self._withToken({'op': 'subscribe'})).encode('utf-8') + b'\n')
+                f.flush()
+                for line in f:
+                    delta = json.loads(line)
+                    logger.debug("Delta from daemon: {}".format(delta))
+                    self.clearCache()
+                    if callback is not None:
+                        callback(delta)
+            except OSError as e:
+                logger.warning("Subscription to the daemon is lost: {}".format(e))
+        t = threading.Thread(target=loop, name="PySel.Subscription", daemon=True)
+        t.start()
+        return t
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 
-try:
-    from PySide2 import QtCore
-except:
-    from PyQt5 import QtCore
+import os
+import json
+import stat
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
 
 import ItemProperty as iprop
 
@@ -11,11 +14,149 @@ import logging
 logger = logging.getLogger("PySel.FileSystem")
 
 
+# a directory changed within this time can change again in the same mtime tick
+RACY_NS = 2000000000
+# the listings not used for this time in seconds are dropped when the cache is opened
+MAX_AGE = 30 * 24 * 3600
+
+
+def _listDir(path):
+    '''
+    name -> (isdir, size, mtime in ns) of the directory entries sorted as QDir does,
+    hidden entries are skipped, links are followed, empty if the directory cannot be read
+    '''
+    rv = []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                if e.name.startswith('.'):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:  # broken link
+                    continue
+                rv.append((e.name, (stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime_ns)))
+    except OSError as e:
+        logger.debug("Cannot list {}: {}".format(path, e))
+    rv.sort(key=lambda v: v[0].casefold())
+    return dict(rv)
+
+
+class ScanCache:
+    '''
+    persistent listings of directories keyed by the path and validated by (device, inode, mtime)
+    of the directory, the recently used ones are kept decoded in memory, the listings unused
+    for maxage seconds and the least recently used ones above maxrows are dropped on opening
+    '''
+    def __init__(self, filename, maxmem=1024, maxrows=100000, maxage=MAX_AGE):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, dev INTEGER, '
+                         'ino INTEGER, mtime INTEGER, used INTEGER, entries TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS dirs_used ON dirs (used)')
+        self._prune(maxrows, maxage)
+        self._mem = OrderedDict()  # path -> (key, entries)
+        self._maxmem = maxmem
+
+    def _prune(self, maxrows, maxage):
+        self._db.execute('DELETE FROM dirs WHERE used < ?', (int(time.time()) - maxage,))
+        self._db.execute('DELETE FROM dirs WHERE path NOT IN '
+                         '(SELECT path FROM dirs ORDER BY used DESC LIMIT ?)', (maxrows,))
+        self._db.commit()
+
+    def get(self, path, key):
+        with self._lock:
+            if path in self._mem:
+                self._mem.move_to_end(path)
+                k, entries = self._mem[path]
+                return entries if k == key else None
+            row = self._db.execute('SELECT entries FROM dirs WHERE path=? AND dev=? AND ino=? AND mtime=?',
+                                   (path,) + key).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE dirs SET used=? WHERE path=?', (int(time.time()), path))
+            entries = {v[0]: tuple(v[1:]) for v in json.loads(row[0])}
+            self._remember(path, key, entries)
+            return entries
+
+    def put(self, path, key, entries):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?)', (path,) + key +
+                             (int(time.time()), json.dumps([(fn,) + v for fn, v in entries.items()]),))
+            self._remember(path, key, entries)
+
+    def invalidate(self, path):
+        with self._lock:
+            self._mem.pop(path, None)
+            self._db.execute('DELETE FROM dirs WHERE path=?', (path,))
+
+    def _remember(self, path, key, entries):
+        self._mem[path] = (key, entries)
+        self._mem.move_to_end(path)
+        while len(self._mem) > self._maxmem:
+            self._mem.popitem(last=False)
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
 class FileSystem:
-    def __init__(self):
-        pass
+    def __init__(self, cachefile=None):
+        'the cache file and its directory are opened by the first listing, not at the startup'
+        self._cachefile = cachefile
+        self._cache = None
+        self._cacheLock = threading.Lock()
+
+    def _openCache(self):
+        with self._cacheLock:
+            if self._cache is None and self._cachefile is not None:
+                os.makedirs(os.path.dirname(self._cachefile), exist_ok=True)
+                self._cache = ScanCache(self._cachefile)
+            return self._cache
 
-    def extendByLocal(self, l, path, psyncstate=iprop.SyncState.unknown):
+    def listDir(self, path):
+        '''
+        _listDir answered from the cache when the directory itself is not changed,
+        the second value is True if the entries come from the cache
+        '''
+        cache = self._openCache()
+        if cache is None:
+            return _listDir(path), False
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return {}, False
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        entries = cache.get(path, key)
+        if entries is not None:
+            return entries, True
+        entries = _listDir(path)
+        # a listing of the directory changed just now may miss the changes of the same tick
+        if time.time_ns() - st.st_mtime_ns > RACY_NS:
+            cache.put(path, key, entries)
+        return entries, False
+
+    def invalidate(self, path):
+        'forgets the listing of the directory, e.g. after the watcher reports a change'
+        cache = self._openCache()
+        if cache is not None:
+            cache.invalidate(os.path.abspath(path))
+
+    def close(self):
+        with self._cacheLock:
+            self._cachefile = None
+            if self._cache is not None:
+                self._cache.close()
+                self._cache = None
+
+    def extendByLocal(self, l, path, psyncstate=iprop.SyncState.unknown, globalignored=None):
         '''
         There are four cases for extension of remote file tree:
             1. none - 'syncstate' = syncing
@@ -23,123 +164,118 @@ class FileSystem:
             3. conflict - local file differs from a remote
             4. exists -  local file is the same as remote
         Besides the function lockup the children of the each item
+        globalignored: function which takes the list of names and returns the list of flags
+            if the items are ignored by global patterns, the parent state is used if it is None
         '''
         logger.debug("extendByLocal path: {}".format(path))
-        d = QtCore.QDir(path)
-        # d.setFilter(QtCore.QDir.NoDotAndDotDot)
-        dl = d.entryList()
-
-        # dirty hack as NoDotAndDotDot do not work in PyQt5 5.12.8
-        if '.' in dl:
-            dl.remove('.')
-        if '..' in dl:
-            dl.remove('..')
-
-        newfiles = dl[:]
+        dlset, cached = self.listDir(path)
 
         # looking for new local files, works only for the root directory
         # as further all new files has unknown syncstats
-        for val in l:
-            if val['name'] in dl:
-                newfiles.remove(val['name'])
+        known = {val.name for val in l}
+        newfiles = [fn for fn in dlset if fn not in known]
 
-        itemstoremove = []
+        itemstoremove = set()
         for item in l:
             # update existing items
-            if ('syncstate' not in item or \
-                    item['syncstate'] is iprop.SyncState.unknown or \
-                    item['syncstate'] is iprop.SyncState.newlocal or \
-                    item['syncstate'] is iprop.SyncState.partial) and \
-                    item['name'] in dl:
-                fi = QtCore.QFileInfo(d.filePath(item['name']))
-                if fi.isDir():
-                    logger.debug("Update dir: {}".format(item['name']))
-                    cil = QtCore.QDir(d.filePath(item['name'])).entryInfoList()
-                    if 'children' in item:
-                        cont = item['children']
-                    else:
-                        cont = []
-                    for fic in cil:
-                        if fic.fileName() == '.' or fic.fileName() == '..':
+            if (item.syncstate is None or \
+                    item.syncstate is iprop.SyncState.unknown or \
+                    item.syncstate is iprop.SyncState.newlocal or \
+                    item.syncstate is iprop.SyncState.partial) and \
+                    item.name in dlset:
+                isdir, size, mtime = dlset[item.name]
+                if isdir:
+                    logger.debug("Update dir: {}".format(item.name))
+                    cont = item.children if item.children is not None else []
+                    contnames = {ch.name for ch in cont}
+                    for fn, (cisdir, _, _) in self.listDir(os.path.join(path, item.name))[0].items():
+                        if fn in contnames:
                             continue
-
-                        iscont = False
-                        for ch in cont:  # TODO dict of dicts to avoid for
-                            if ch['name'] == fic.fileName():
-                                iscont = True
-                                break
-                        if iscont:
-                            continue
-
-                        cont.append({'name': fic.fileName(),
-                                    'type':
-                                        iprop.Type.DIRECTORY.name if fic.isDir() \
-                                            else iprop.Type.FILE.name,
-                                    'syncstate': iprop.SyncState.unknown})
-                    item['children'] = cont
+                        cont.append(self._childEntry(fn, cisdir))
+                    item.children = cont
                     logger.debug("    Children: {}".format(cont))
                 else:
-                    logger.debug("Update file: {}".format(item['name']))
-                if item['syncstate'] is iprop.SyncState.unknown:
-                    item['size'] = int(fi.size())
-                    item['modified'] = fi.lastModified()
-                    item['syncstate'] = iprop.SyncState.newlocal
+                    logger.debug("Update file: {}".format(item.name))
+                if item.syncstate is iprop.SyncState.unknown:
+                    if cached and not isdir:
+                        size, mtime = self._fileStat(os.path.join(path, item.name), size, mtime)
+                    item.size = size
+                    item.modified = mtime
+                    item.syncstate = iprop.SyncState.newlocal
 
             # check files ignored remotely but exists locally
-            elif 'syncstate' in item and \
-                    item['syncstate'] is iprop.SyncState.ignored and \
-                    item['name'] in dl:
-                fi = QtCore.QFileInfo(d.filePath(item['name']))
-                if iprop.Type[item['type']] is iprop.Type.DIRECTORY:
-                    item['syncstate'] = iprop.SyncState.exists
-                elif item['size'] == fi.size() and \
-                        item['modified'].secsTo(fi.lastModified()) == 0:
-                    item['syncstate'] = iprop.SyncState.exists
+            elif item.syncstate is iprop.SyncState.ignored and \
+                    item.name in dlset:
+                isdir, size, mtime = dlset[item.name]
+                if cached and not isdir:
+                    # writing into a file does not change the mtime of its directory
+                    size, mtime = self._fileStat(os.path.join(path, item.name), size, mtime)
+                # the times are compared with the precision of seconds
+                remote = iprop.epochNs(item.modified)
+                if item.isDir():
+                    item.syncstate = iprop.SyncState.exists
+                elif item.size == size and remote is not None and \
+                        abs(mtime - remote) < 1000000000:
+                    item.syncstate = iprop.SyncState.exists
                 else:
-                    item['syncstate'] = iprop.SyncState.conflict
-                    logger.debug("item {} considered as conflicted:\n\t{} != {} or {} != 0".format(item['name'], item['size'], fi.size(), item['modified'].secsTo(fi.lastModified())))
+                    item.syncstate = iprop.SyncState.conflict
+                    logger.debug("item {} considered as conflicted:\n\t{} != {} or {} != {}".format(item.name, item.size, size, remote, mtime))
 
             # fill list of locally removed files
-            elif 'syncstate' in item and \
-                    (item['syncstate'] is iprop.SyncState.unknown or \
-                    item['syncstate'] is iprop.SyncState.newlocal) and \
-                    item['name'] not in dl:
-                itemstoremove.append(item)
+            elif (item.syncstate is iprop.SyncState.unknown or \
+                    item.syncstate is iprop.SyncState.newlocal) and \
+                    item.name not in dlset:
+                itemstoremove.add(item.name)
 
         # remove removed files from the list
-        for item in itemstoremove:
-            l.remove(item)
-        del(itemstoremove)
+        if len(itemstoremove) > 0:
+            l[:] = [item for item in l if item.name not in itemstoremove]
+
+        # classify all new files at once
+        if globalignored is not None and len(newfiles) > 0:
+            gign = dict(zip(newfiles, globalignored(newfiles)))
+        else:
+            gign = None
 
         # add new files into the list
         for fn in newfiles:
-            fi = QtCore.QFileInfo(d.filePath(fn))
-            item = {'name': fn}
-            if fi.isDir():
+            isdir, size, mtime = dlset[fn]
+            if isdir:
                 logger.debug("New dir: {}".format(fn))
-                item['type'] = iprop.Type.DIRECTORY.name
-                cil = QtCore.QDir(d.filePath(fn)).entryInfoList()
-                cont = []
-                for fic in cil:
-                    if fic.fileName() == '.' or fic.fileName() == '..':
-                        continue
-                    cont.append({'name': fic.fileName(),
-                                'type':
-                                    iprop.Type.DIRECTORY.name if fic.isDir() \
-                                        else iprop.Type.FILE.name,
-                                'syncstate': iprop.SyncState.unknown})
-                item['children'] = cont
+                cont = [self._childEntry(cfn, cisdir)
+                        for cfn, (cisdir, _, _) in self.listDir(os.path.join(path, fn))[0].items()]
+                item = iprop.FileEntry(fn, iprop.Type.DIRECTORY, cont)
                 logger.debug("    Children: {}".format(cont))
             else:
                 logger.debug("New file: {}".format(fn))
-                item['type'] = iprop.Type.FILE.name
-            item['size'] = int(fi.size())
-            item['modified'] = fi.lastModified()
+                item = iprop.FileEntry(fn, iprop.Type.FILE)
+                if cached:
+                    size, mtime = self._fileStat(os.path.join(path, fn), size, mtime)
+            item.size = size
+            item.modified = mtime
+            if gign is not None:
+                item.syncstate = iprop.SyncState.globalignore if gign[fn] else \
+                                 iprop.SyncState.newlocal
             # parent checked but the file absents in the database
             # so, it is ignored globally by other patterns
-            if psyncstate == iprop.SyncState.syncing:
-                item['syncstate'] = iprop.SyncState.globalignore
-            else: # TODO, it can also be ignored globally in other states
-                item['syncstate'] = iprop.SyncState.newlocal
+            elif psyncstate == iprop.SyncState.syncing:
+                item.syncstate = iprop.SyncState.globalignore
+            else:
+                item.syncstate = iprop.SyncState.newlocal
             l.append(item)
 
+        cache = self._cache
+        if cache is not None:
+            cache.commit()
+
+    def _fileStat(self, path, size, mtime):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return size, mtime
+        return st.st_size, st.st_mtime_ns
+
+    def _childEntry(self, name, isdir):
+        return iprop.FileEntry(name,
+                iprop.Type.DIRECTORY if isdir else iprop.Type.FILE,
+                syncstate=iprop.SyncState.unknown)
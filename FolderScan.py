@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PySide2 import QtCore
+    from PySide2.QtCore import Signal
+except:
+    from PyQt5 import QtCore
+    from PyQt5.QtCore import pyqtSignal as Signal
+
+import ItemProperty as iprop
+
+import logging
+logger = logging.getLogger("PySel.FolderScan")
+
+
+def _placeholders(children):
+    'entries of the names as TreeModel.rowNamesList gives them before the first expand'
+    rv = []
+    for c in children or []:
+        ch = iprop.FileEntry(c.name, c.type, [], iprop.SyncState.unknown)
+        ch.size = 0
+        ch.ignored = True
+        ch.partial = False
+        rv.append(ch)
+    return rv
+
+
+class FolderScan(QtCore.QObject):
+    '''
+    Walks the whole folder in background and computes the state of every directory by
+    scandir(path, entries, psyncstate) which returns the extended entries. The results come
+    to the GUI thread in batches by resultsReady, a directory always comes after its parent.
+    A cancelled scan resumes from the directories which are not done yet, the done ones
+    are passed again by resultsReady first.
+    '''
+    resultsReady = Signal(list)  # [(path, entries)]
+    progress = Signal(int, int)  # done and known directories
+    finished = Signal(int)  # number of failed directories
+
+    def __init__(self, scandir, parent=None, workers=4, interval=200):
+        QtCore.QObject.__init__(self, parent)
+        self._scandir = scandir
+        self._workers = workers
+        self._executor = None
+        # a done callback runs at once in the submitting thread if the task is already done
+        self._lock = threading.RLock()
+        self._todo = OrderedDict()  # path -> (entries, psyncstate) to scan
+        self._done = OrderedDict()  # path -> (entries, psyncstate) scanned
+        self._failed = set()
+        self._ready = []
+        self._running = 0
+        self._cancelled = True
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._flush)
+
+    def isRunning(self):
+        return not self._cancelled
+
+    def isComplete(self):
+        with self._lock:
+            return len(self._todo) == 0 and len(self._done) > 0
+
+    def start(self, entries):
+        'entries: the root list, it is used if nothing has been scanned yet'
+        if self.isRunning():
+            return
+        with self._lock:
+            if len(self._todo) == 0 and len(self._done) == 0:
+                self._todo[''] = (entries, iprop.SyncState.unknown)
+            self._failed.clear()
+            self._ready = [(path, rv) for path, (rv, _) in self._done.items()]
+            self._cancelled = False
+            self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                thread_name_prefix="PySel.Scan")
+            for path, (l, psyncstate) in self._todo.items():
+                self._submit(path, l, psyncstate)
+        logger.info("Folder scan started: {} done, {} to do".format(len(self._done), len(self._todo)))
+        self._timer.start()
+
+    def cancel(self):
+        if not self.isRunning():
+            return
+        with self._lock:
+            self._cancelled = True
+            self._ready = []
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._timer.stop()
+        logger.info("Folder scan cancelled: {} done, {} to do".format(len(self._done), len(self._todo)))
+
+    def invalidate(self, paths):
+        'the directories and everything inside them are scanned again'
+        with self._lock:
+            for path in paths:
+                pref = path + '/' if path != '' else ''
+                if path not in self._done:
+                    continue
+                rv, psyncstate = self._done[path]
+                for p in [p for p in self._done if p == path or p.startswith(pref)]:
+                    del self._done[p]
+                for p in [p for p in self._todo if p.startswith(pref) and p != path]:
+                    del self._todo[p]
+                entries = _placeholders(rv)
+                self._todo[path] = (entries, psyncstate)
+                if not self._cancelled:
+                    self._submit(path, entries, psyncstate)
+
+    def _submit(self, path, entries, psyncstate):
+        self._running += 1
+        fut = self._executor.submit(self._scan, path, entries, psyncstate)
+        fut.add_done_callback(self._taskDone)
+
+    def _taskDone(self, fut):
+        with self._lock:
+            self._running -= 1
+
+    def _scan(self, path, entries, psyncstate):
+        if self._cancelled:
+            return
+        try:
+            rv = self._scandir(path, entries, psyncstate)
+        except Exception as e:
+            logger.warning("Cannot scan '{}': {}".format(path, e))
+            with self._lock:
+                self._failed.add(path)
+                if self._todo.get(path, (None,))[0] is entries:
+                    # the entries can be extended partially, a resumed scan starts over
+                    self._todo[path] = (_placeholders(entries), psyncstate)
+            return
+        with self._lock:
+            if self._todo.get(path, (None,))[0] is not entries:
+                return  # invalidated meanwhile
+            del self._todo[path]
+            self._done[path] = (rv, psyncstate)
+            if not self._cancelled:
+                self._ready.append((path, rv))
+            pref = path + '/' if path != '' else ''
+            for v in rv:
+                if not v.isDir() or pref + v.name in self._todo:
+                    continue
+                chentries = _placeholders(v.children)
+                self._todo[pref + v.name] = (chentries, v.syncstate)
+                if not self._cancelled:
+                    self._submit(pref + v.name, chentries, v.syncstate)
+
+    def _flush(self):
+        with self._lock:
+            batch, self._ready = self._ready, []
+            done, total = len(self._done), len(self._done) + len(self._todo)
+            idle = self._running == 0
+            failed = len(self._failed)
+        if len(batch) > 0:
+            self.resultsReady.emit(batch)
+        self.progress.emit(done, total)
+        if idle and not self._cancelled:
+            self._cancelled = True
+            self._executor.shutdown(wait=False)
+            self._timer.stop()
+            logger.info("Folder scan finished: {} directories, {} failed".format(done, failed))
+            self.finished.emit(failed)
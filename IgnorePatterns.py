@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+
+import logging
+logger = logging.getLogger("PySel.IgnorePatterns")
+
+# https://docs.syncthing.net/users/ignoring.html
+
+
+def _depth(path):
+    return path.count('/') + 1 if path else 0
+
+
+def _mayMatchUnder(line, path):
+    'the pattern can match the path or something inside it, it is not sure only for rooted literal prefixes'
+    line = line.rstrip()
+    if line == '' or line.startswith('//') or line.startswith('#include'):
+        return line.startswith('#include')
+    icase = False
+    while True:
+        if line.startswith('!'):
+            line = line[1:]
+        elif line.startswith('(?i)'):
+            icase = True
+            line = line[4:]
+        elif line.startswith('(?d)'):
+            line = line[4:]
+        else:
+            break
+    if not line.startswith('/'):
+        return True
+    prefix = re.split(r'[*?\[{\\]', line.strip('/'), maxsplit=1)[0]
+    if icase:
+        prefix, path = prefix.casefold(), path.casefold()
+    if prefix == line.strip('/'):
+        # literal: the path itself, one of its parents or something inside it
+        return prefix == path or prefix.startswith(path + '/') or path.startswith(prefix + '/')
+    return prefix.startswith(path) or path.startswith(prefix)
+
+
+def compactSelective(lines, children):
+    '''
+    Collapses !/dir/child lines covering every child of dir into !/dir and drops the lines
+    under an included parent. children(path) gives the child names known for the path,
+    None or an empty list if they are not loaded. A line is moved or dropped only if no other
+    pattern between it and the line which covers it now can match its path or the content,
+    e.g. the /dir/** line which Syncthing before 1.6 needs after the included children.
+    Other lines are kept in place.
+    '''
+    literal = re.compile(r'!/[^*?\[{\\]+$')
+    origpath = {}  # line index -> path of the literal include
+    pos = {}  # path -> index of its line
+    for i, line in enumerate(lines):
+        line = line.rstrip()
+        if literal.match(line) and line.strip('!/') != '':
+            origpath[i] = line[2:].rstrip('/')
+            pos.setdefault(origpath[i], i)
+    if len(pos) == 0:
+        return list(lines)
+    # the lines which may decide otherwise than an include
+    others = [(i, line) for i, line in enumerate(lines) if i not in origpath and not line.startswith('!')]
+
+    def blocked(path, first, last):
+        'a pattern between the lines first and last may match the path or its content'
+        return any(first < i < last and _mayMatchUnder(line, path) for i, line in others)
+
+    included = set(pos)
+    bydir = {}
+    for p in included:
+        parent, _, name = p.rpartition('/')
+        bydir.setdefault(parent, set()).add(name)
+    for depth in range(max(_depth(d) for d in bydir), 0, -1):
+        for d in [d for d in bydir if _depth(d) == depth]:
+            names = children(d)
+            if not names or d in included or not bydir[d].issuperset(names):
+                continue
+            first = min(pos[d + '/' + n] for n in names)
+            if any(blocked(d + '/' + n, first, pos[d + '/' + n]) for n in names):
+                continue
+            logger.debug("All {} children of {} are included".format(len(names), d))
+            included.add(d)
+            pos[d] = first
+            parent, _, name = d.rpartition('/')
+            bydir.setdefault(parent, set()).add(name)
+
+    emit = {}  # line index -> path
+    covered = []  # (path, index of its line, the top included parent)
+    literals = set(origpath.values())
+    for p in included:
+        top = None
+        parent = p.rpartition('/')[0]
+        while parent:
+            if parent in included:
+                top = parent
+            parent = parent.rpartition('/')[0]
+        if top is None:
+            emit[pos[p]] = p
+        elif p in literals:
+            covered.append((p, pos[p], top))
+    for p, i, top in covered:
+        if pos[top] > i and blocked(p, i, pos[top]):
+            emit.setdefault(i, p)
+
+    rv = []
+    for i, line in enumerate(lines):
+        if i not in origpath:
+            rv.append(line)
+        elif i in emit:
+            rv.append(line if emit[i] == origpath[i] else '!/' + emit[i])
+    return rv
+
+
+def mergeSelective(lines, changed, checked, partial, legacy=False):
+    '''
+    The selective section lines with the changed paths applied, paths start with a slash.
+    The lines of a changed path are dropped, the lines under a changed path are dropped too
+    unless it is partially checked, then the changed paths which are checked and are not under
+    another cleared one are included at the top. legacy adds the lines Syncthing before 1.6
+    needs to sync a partially checked directory. Linear in the number of lines and paths.
+    '''
+    checked = set(checked)
+    partial = set(partial)
+    exact = set()
+    for v in changed:
+        exact.add('!' + v)
+        exact.add(v + '/**')
+    cleared = {v for v in changed if v in checked or v not in partial}
+
+    def under(line):
+        'a cleared path is a proper prefix of the line up to a slash'
+        p = line.rpartition('/')[0]
+        while p:
+            if p in cleared or (p[0] == '!' and p[1:] in cleared):
+                return True
+            p = p.rpartition('/')[0]
+        return False
+
+    rv = ['!' + v for v in reversed(changed) if v in checked and not under(v)]
+    rv.extend(line for line in lines if line not in exact and not under(line))
+    if legacy:
+        for v in changed:
+            if v in partial:
+                rv.append(v + '/**')
+                rv.append('!' + v)
+    return [line for line in rv if line != '']
+
+
+def selectiveIncludes(lines):
+    '''
+    The included and partially included paths of the selective section sorted, paths start
+    with a slash. The included ones are the literal !/path lines, the partial ones are their
+    parents which are not included themselves.
+    '''
+    literal = re.compile(r'!/[^*?\[{\\]+$')
+    included = {line.rstrip().rstrip('/')[1:] for line in lines if literal.match(line.rstrip())}
+    included.discard('')
+    partial = set()
+    for p in included:
+        parent = p.rpartition('/')[0]
+        while parent and parent not in included and parent not in partial:
+            partial.add(parent)
+            parent = parent.rpartition('/')[0]
+    return sorted(included), sorted(partial)
+
+
+def globToRegex(glob):
+    'translates the glob syntax of .stignore: *, **, ?, [...], [!...], {a,b} and \\ escapes'
+    res = []
+    i = 0
+    n = len(glob)
+    depth = 0  # level of {} alternatives
+    while i < n:
+        c = glob[i]
+        if c == '*':
+            if i + 1 < n and glob[i + 1] == '*':
+                res.append('.*')
+                i += 2
+                continue
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '[' and glob.find(']', i + 2) != -1:
+            j = glob.find(']', i + 2)
+            body = glob[i + 1:j]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            res.append('[' + body.replace('\\', '\\\\') + ']')
+            i = j + 1
+            continue
+        elif c == '{':
+            res.append('(?:')
+            depth += 1
+        elif c == '}' and depth > 0:
+            res.append(')')
+            depth -= 1
+        elif c == ',' and depth > 0:
+            res.append('|')
+        elif c == '\\' and i + 1 < n:
+            res.append(re.escape(glob[i + 1]))
+            i += 2
+            continue
+        else:
+            res.append(re.escape(c))
+        i += 1
+    if depth > 0:
+        raise re.error("unbalanced braces in {}".format(glob))
+    return ''.join(res)
+
+
+def compileGlob(glob):
+    'regex for relative paths matched by the glob as by an ignore pattern, without the content of directories'
+    rooted = glob.startswith('/')
+    return re.compile(('' if rooted else '(?:.*/)?') + globToRegex(glob.strip('/')))
+
+
+class IgnoreMatcher:
+    '''
+    Compiled .stignore list, the first matching pattern decides as in Syncthing.
+    Rooted literal patterns (the whole selective section) are looked up in a dict,
+    all others are joined into one regex with a named group per pattern.
+    Paths are relative to the folder root without leading slash.
+    '''
+    def __init__(self, lines, root=None):
+        self._patterns = []  # (line index in lines, negated)
+        self._literals = {}  # path -> pattern index
+        self._regex = None
+        self._groups = {}  # group name -> pattern index
+        parts = []
+        for lineind, line in enumerate(lines):
+            if line.startswith('#include'):
+                fn = line[len('#include'):].strip()
+                for incl in self._readInclude(fn, root, set()):
+                    self._addPattern(incl, lineind, parts)
+            else:
+                self._addPattern(line, lineind, parts)
+        if len(parts) > 0:
+            self._regex = re.compile('|'.join(parts))
+        logger.debug("{} patterns, {} literal".format(len(self._patterns), len(self._literals)))
+
+    def _readInclude(self, fn, root, seen):
+        if root is None:
+            logger.warning("Cannot include {} without the local folder path".format(fn))
+            return []
+        path = os.path.normpath(os.path.join(root, fn))
+        if path in seen:
+            logger.warning("Include loop at {}".format(path))
+            return []
+        seen.add(path)
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            logger.warning("Cannot read included file {}: {}".format(path, e))
+            return []
+        rv = []
+        for line in lines:
+            if line.startswith('#include'):
+                rv.extend(self._readInclude(line[len('#include'):].strip(), os.path.dirname(path), seen))
+            else:
+                rv.append(line)
+        return rv
+
+    def _addPattern(self, line, lineind, parts):
+        line = line.rstrip()
+        if line == '' or line.startswith('//'):
+            return
+        negated = icase = False
+        while True:
+            if line.startswith('!') and not negated:
+                negated = True
+                line = line[1:]
+            elif line.startswith('(?i)') and not icase:
+                icase = True
+                line = line[4:]
+            elif line.startswith('(?d)'):  # deletable, does not affect matching
+                line = line[4:]
+            else:
+                break
+        rooted = line.startswith('/')
+        line = line.strip('/')
+        if line == '':
+            return
+
+        pind = len(self._patterns)
+        if rooted and not icase and not re.search(r'[*?\[{\\]', line):
+            self._patterns.append((lineind, negated))
+            self._literals.setdefault(line, pind)
+            return
+        try:
+            body = globToRegex(line)
+            if icase:
+                body = '(?i:' + body + ')'
+            body = ('' if rooted else '(?:.*/)?') + body + '(?:/.*)?'
+            re.compile(body)
+        except re.error as e:
+            logger.warning("Skip invalid pattern {}: {}".format(line, e))
+            return
+        self._patterns.append((lineind, negated))
+        self._groups['p{}'.format(pind)] = pind
+        parts.append('(?P<p{}>{})'.format(pind, body))
+
+    def _firstMatch(self, path):
+        best = -1
+        if self._literals:
+            p = path
+            while p:
+                pind = self._literals.get(p)
+                if pind is not None and (best == -1 or pind < best):
+                    best = pind
+                p = p.rpartition('/')[0]
+        if self._regex is not None:
+            m = self._regex.fullmatch(path)
+            if m is not None:
+                pind = self._groups[m.lastgroup]
+                if best == -1 or pind < best:
+                    best = pind
+        return best
+
+    def classify(self, paths):
+        'list of (line index, negated) of the first matching pattern for each path, (-1, False) if none'
+        rv = []
+        for p in paths:
+            pind = self._firstMatch(p)
+            rv.append(self._patterns[pind] if pind != -1 else (-1, False))
+        return rv
+
+    def ignoredList(self, paths):
+        'True for each ignored path'
+        return [lineind != -1 and not negated for lineind, negated in self.classify(paths)]
+
+    def isIgnored(self, path):
+        lineind, negated = self.classify([path])[0]
+        return lineind != -1 and not negated
+
+    def ignoredBefore(self, paths, end):
+        'True for each path ignored by a pattern from the lines before end'
+        return [lineind != -1 and lineind < end and not negated
+                for lineind, negated in self.classify(paths)]
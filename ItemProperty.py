@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import re
 import enum
+import calendar
 
 
 class SyncState(enum.Enum):
@@ -29,6 +31,74 @@ class Type(enum.Enum):
     FILE_INFO_TYPE_SYMLINK = 0  # consider symlinks as files
 
 
+class FileEntry:
+    '''
+    Item of a file tree passed from SyncthingAPI through FileSystem into TreeModel.
+    None in a field means that the value is unknown yet, modified is kept raw:
+    ISO 8601 string of Syncthing or nanoseconds since epoch of a local file, see epochNs.
+    '''
+    __slots__ = ('name', 'type', 'size', 'modified', 'ignored', 'partial', 'invalid',
+                 'syncstate', 'children', 'blockshash')
+
+    def __init__(self, name, type=Type.FILE, children=None, syncstate=None):
+        self.name = name
+        # Syncthing type names are resolved once here
+        self.type = type if isinstance(type, Type) else Type[type]
+        self.size = None
+        self.modified = None
+        self.ignored = None
+        self.partial = None
+        self.invalid = None
+        self.syncstate = syncstate
+        self.children = children
+        self.blockshash = None
+
+    @classmethod
+    def fromBrowse(cls, d):
+        'entry of db/browse result with children, size and modTime are taken if Syncthing gives them'
+        rv = cls(d['name'], d['type'],
+                 [cls.fromBrowse(c) for c in d['children']] if 'children' in d else None)
+        rv.size = d.get('size')
+        rv.modified = d.get('modTime')
+        return rv
+
+    def isDir(self):
+        return self.type is Type.DIRECTORY
+
+    def toDict(self):
+        return {k: getattr(self, k) for k in self.__slots__ if getattr(self, k) is not None}
+
+    def __repr__(self):
+        return "FileEntry({}, {}, {})".format(self.name, self.type.name,
+                self.syncstate.name if self.syncstate is not None else None)
+
+
+_isoTime = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:[.,](\d+))?(Z|[+-]\d\d:?\d\d)?$')
+
+
+def epochNs(modified):
+    'nanoseconds since epoch of the raw modification time, None if it is unknown'
+    if modified is None or isinstance(modified, int):
+        return modified
+    m = _isoTime.match(modified)
+    if m is None:
+        return None
+    year, month, day, hour, minute, sec, frac, tz = m.groups()
+    secs = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(sec)))
+    if tz and tz != 'Z':
+        offset = int(tz[1:3]) * 3600 + int(tz[-2:]) * 60
+        secs += -offset if tz[0] == '+' else offset
+    return secs * 1000000000 + int((frac or '0')[:9].ljust(9, '0'))
+
+
+def humanSize(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if abs(size) < 1024 or unit == 'TiB':
+            break
+        size /= 1024
+    return "{} {}".format(size, unit) if unit == 'B' else "{:.1f} {}".format(size, unit)
+
+
 class ItemProperty:
     def __init__(self):
         pass
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+try:
+    from PySide2 import QtCore
+    from PySide2.QtCore import Signal
+except:
+    from PyQt5 import QtCore
+    from PyQt5.QtCore import pyqtSignal as Signal
+
+import logging
+logger = logging.getLogger("PySel.LocalRemoval")
+
+
+class LocalRemoval(QtCore.QObject):
+    '''
+    Removes local files and directories in background. The paths are walked one by one
+    bottom up, their files are unlinked by the workers in batches and then the directories
+    are removed. removed comes for each path when it is done, the error is empty if the path
+    is gone. A cancelled removal leaves what is not deleted yet.
+    '''
+    removed = Signal(str, str)  # path and the first error
+    progress = Signal(int, int)  # removed and known entries
+    finished = Signal(bool)  # True if cancelled
+
+    def __init__(self, paths, parent=None, workers=4, batch=256, interval=200):
+        QtCore.QObject.__init__(self, parent)
+        self._paths = list(paths)
+        self._workers = workers
+        self._batch = batch
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._thread = None
+        self._done = 0
+        self._total = 0
+        self._ready = []  # (path, error)
+        self._running = False
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._flush)
+
+    def isRunning(self):
+        return self._running
+
+    def paths(self):
+        return self._paths
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="PySel.Remove", daemon=True)
+        self._thread.start()
+        self._timer.start()
+        logger.info("Removal of {} paths started".format(len(self._paths)))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="PySel.Remove") as executor:
+                for path in self._paths:
+                    if self._cancelled.is_set():
+                        break
+                    error = self._remove(executor, path)
+                    if self._cancelled.is_set() and error == '' and os.path.lexists(path):
+                        error = 'Cancelled'
+                    with self._lock:
+                        self._ready.append((path, error))
+        except Exception:
+            logger.exception("Removal failed")
+        finally:
+            with self._lock:
+                self._running = False
+
+    def _remove(self, executor, path):
+        'the first error while removing the path, empty if it is removed'
+        errors = []
+        if os.path.islink(path) or not os.path.isdir(path):
+            self._count(1)
+            self._unlink([path], errors)
+            return errors[0] if errors else ''
+
+        dirs = []
+        futures = []
+        batch = []
+        # children come before their parent, the links to directories are removed as files
+        for dirpath, dirnames, filenames in os.walk(path, topdown=False, onerror=lambda e: errors.append(str(e))):
+            if self._cancelled.is_set():
+                break
+            files = [os.path.join(dirpath, fn) for fn in filenames]
+            files.extend(p for p in (os.path.join(dirpath, dn) for dn in dirnames) if os.path.islink(p))
+            batch.extend(files)
+            dirs.append(dirpath)
+            self._count(len(files) + 1)
+            while len(batch) >= self._batch:
+                futures.append(executor.submit(self._unlink, batch[:self._batch], errors))
+                del batch[:self._batch]
+        if len(batch) > 0:
+            futures.append(executor.submit(self._unlink, batch, errors))
+        wait(futures)
+        for d in dirs:
+            if self._cancelled.is_set():
+                break
+            try:
+                os.rmdir(d)
+            except OSError as e:
+                errors.append(str(e))
+            self._count(0, 1)
+        if len(errors) > 0:
+            logger.warning("Cannot remove {} entries of {}: {}".format(len(errors), path, errors[0]))
+        return errors[0] if errors else ''
+
+    def _unlink(self, paths, errors):
+        done = 0
+        for p in paths:
+            if self._cancelled.is_set():
+                break
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors.append(str(e))
+            done += 1
+        self._count(0, done)
+
+    def _count(self, known, done=0):
+        with self._lock:
+            self._total += known
+            self._done += done
+
+    def _flush(self):
+        with self._lock:
+            ready, self._ready = self._ready, []
+            done, total = self._done, self._total
+            running = self._running
+        for path, error in ready:
+            self.removed.emit(path, error)
+        self.progress.emit(done, total)
+        if not running:
+            self._timer.stop()
+            cancelled = self._cancelled.is_set()
+            logger.info("Removal {}: {} of {} entries".format("cancelled" if cancelled else "finished", done, total))
+            self.finished.emit(cancelled)
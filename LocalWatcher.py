@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import os
+from collections import OrderedDict
+
+try:
+    from PySide2 import QtCore
+    from PySide2.QtCore import Signal
+except:
+    from PyQt5 import QtCore
+    from PyQt5.QtCore import pyqtSignal as Signal
+
+import logging
+logger = logging.getLogger("PySel.LocalWatcher")
+
+
+class LocalWatcher(QtCore.QObject):
+    '''
+    Watches the expanded directories of the current folder. Bursts of events are
+    coalesced and reported once as the list of changed paths relative to the root.
+    The least recently used watches are dropped to keep their count bounded.
+    '''
+    directoriesChanged = Signal(list)
+
+    def __init__(self, parent=None, maxwatches=4096, delay=300):
+        QtCore.QObject.__init__(self, parent)
+        self._root = None
+        self._watched = OrderedDict()  # relative path -> absolute path
+        self._pending = set()
+        self._maxwatches = maxwatches
+        self._fsw = QtCore.QFileSystemWatcher(self)
+        self._fsw.directoryChanged.connect(self._directoryChanged)
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._flush)
+
+    def setRoot(self, root):
+        self.clear()
+        self._root = root
+
+    def clear(self):
+        if len(self._watched) > 0:
+            self._fsw.removePaths(list(self._watched.values()))
+        self._watched.clear()
+        self._pending.clear()
+        self._timer.stop()
+
+    def watchCount(self):
+        return len(self._watched)
+
+    def watch(self, relpath):
+        if self._root is None:
+            return
+        if relpath in self._watched:
+            self._watched.move_to_end(relpath)
+            return
+        path = os.path.join(self._root, relpath) if relpath != '' else self._root
+        if not os.path.isdir(path):
+            return
+        if not self._fsw.addPath(path):
+            logger.info("Cannot watch {}".format(path))
+            return
+        self._watched[relpath] = path
+        while len(self._watched) > self._maxwatches:
+            _, oldpath = self._watched.popitem(last=False)
+            self._fsw.removePath(oldpath)
+
+    def unwatch(self, relpath):
+        'stop watching the path and everything below'
+        pref = relpath + '/'
+        for rp in [rp for rp in self._watched if rp == relpath or relpath == '' or rp.startswith(pref)]:
+            self._fsw.removePath(self._watched.pop(rp))
+
+    def _directoryChanged(self, path):
+        relpath = os.path.relpath(path, self._root).replace(os.sep, '/')
+        if relpath == '.':
+            relpath = ''
+        logger.debug("Directory changed: {}".format(relpath))
+        self._pending.add(relpath)
+        self._timer.start()
+
+    def _flush(self):
+        paths = sorted(self._pending)
+        self._pending.clear()
+        self.directoriesChanged.emit(paths)
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
+import copy
 import json
-import shutil
 
 try:
     from PySide2 import QtCore
@@ -14,9 +15,15 @@ except:
     from PyQt5 import QtGui
     from PyQt5 import QtWidgets
 
-from SyncthingAPI import SyncthingAPI
+from SyncthingAPI import SyncthingAPI, MAX_CONCURRENCY
 from FileSystem import FileSystem
-from TreeModel import TreeModel
+from TreeModel import TreeModel, ITEM_BUDGET
+from SearchIndex import SearchIndex, TreeFilterModel
+from Worker import Worker, WorkerSignals
+from LocalWatcher import LocalWatcher
+from FolderScan import FolderScan
+from LocalRemoval import LocalRemoval
+from IgnorePatterns import IgnoreMatcher, compactSelective, compileGlob, mergeSelective, selectiveIncludes
 import ItemProperty as iprop
 
 import logging
@@ -24,7 +31,8 @@ logger = logging.getLogger("PySel.MainWindow")
 
 # use helloword from https://evileg.com/ru/post/63/
 class MainWindow(QtWidgets.QMainWindow):
-    def __init__(self):
+    def __init__(self, syncapi=None):
+        'syncapi: DaemonAPI to attach to a running daemon, a direct SyncthingAPI by default'
         QtWidgets.QMainWindow.__init__(self)
         self._qtver = \
                 (int(QtCore.qVersion().split('.')[0]) << 16) + \
@@ -66,6 +74,22 @@ class MainWindow(QtWidgets.QMainWindow):
         row, column, cols, rows = grid_layout.getItemPosition(index)
         logger.debug(index)
 
+        widget = QtWidgets.QLineEdit(central_widget)
+        widget.setPlaceholderText("Search, press Enter to reveal the next match")
+        widget.setClearButtonEnabled(True)
+        widget.textChanged.connect(self.leFilterChanged)
+        widget.returnPressed.connect(self.revealNextMatch)
+        grid_layout.addWidget( widget, row+1, column, cols, rows)
+        index = grid_layout.indexOf(widget)
+        row, column, cols, rows = grid_layout.getItemPosition(index)
+        logger.debug(index)
+        self.leFilter = widget
+        # coalesce fast typing into one filter pass
+        self._filterTimer = QtCore.QTimer(self)
+        self._filterTimer.setSingleShot(True)
+        self._filterTimer.setInterval(30)
+        self._filterTimer.timeout.connect(self.applyFilter)
+
         widget = QtWidgets.QTreeView(central_widget)
         grid_layout.addWidget( widget, row+1, column, cols, rows)
         index = grid_layout.indexOf(widget)
@@ -73,11 +97,19 @@ class MainWindow(QtWidgets.QMainWindow):
         logger.debug(index)
         self.tv = widget
         self.tm = TreeModel(parent=self.tv)
-        self.tv.setModel(self.tm)
+        self.pm = TreeFilterModel(self.tv)
+        self.pm.setSourceModel(self.tm)
+        self.tv.setModel(self.pm)
         self.tv.header().setSectionsMovable(True)
         if self._qtver >= 0x050B00: # >= 5.11
             self.tv.header().setFirstSectionMovable(True)
-        self.tv.expanded.connect(self.updateSectionInfo)
+        # no sorting until the user clicks a header
+        self.tv.header().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        self.tv.setSortingEnabled(True)
+        # several paths can be removed at once
+        self.tv.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.tv.expanded.connect(self.tvExpanded)
+        self.tv.collapsed.connect(self.tvCollapsed)
 
         # create context menu
         self.cm = QtWidgets.QMenu(self)
@@ -86,6 +118,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.rmAct = self.cm.addAction("Remove")
         self.rmAct.setEnabled(False)
         self.rmAct.triggered.connect(self.actRemove)
+        self.rmCancelAct = self.cm.addAction("Cancel removal")
+        self.rmCancelAct.setEnabled(False)
+        self.rmCancelAct.triggered.connect(self.actCancelRemoval)
 
         widget = QtWidgets.QPushButton("Get file tree", central_widget)
         widget.clicked.connect(self.btGetClicked)
@@ -94,8 +129,41 @@ class MainWindow(QtWidgets.QMainWindow):
         row, column, cols, rows = grid_layout.getItemPosition(index)
         logger.debug(index)
 
+        widget = QtWidgets.QPushButton("Scan whole folder", central_widget)
+        widget.setToolTip("Compute the state of all items of the folder in background")
+        widget.clicked.connect(self.btScanClicked)
+        grid_layout.addWidget( widget, row+1, column, cols, rows)
+        index = grid_layout.indexOf(widget)
+        row, column, cols, rows = grid_layout.getItemPosition(index)
+        logger.debug(index)
+        self.btScan = widget
+
+        widget = QtWidgets.QPushButton("Select by pattern...", central_widget)
+        widget.clicked.connect(self.btPatternClicked)
+        grid_layout.addWidget( widget, row+1, column, cols, rows)
+        index = grid_layout.indexOf(widget)
+        row, column, cols, rows = grid_layout.getItemPosition(index)
+        logger.debug(index)
+
+        widget = QtWidgets.QPushButton("Export selection...", central_widget)
+        widget.setToolTip("Save the checked and changed paths to apply them on another machine")
+        widget.clicked.connect(self.btExportClicked)
+        grid_layout.addWidget( widget, row+1, column, cols, rows)
+        index = grid_layout.indexOf(widget)
+        row, column, cols, rows = grid_layout.getItemPosition(index)
+        logger.debug(index)
+
+        widget = QtWidgets.QPushButton("Import selection...", central_widget)
+        widget.setToolTip("Submit the saved selection to the folder without loading its tree")
+        widget.clicked.connect(self.btImportClicked)
+        grid_layout.addWidget( widget, row+1, column, cols, rows)
+        index = grid_layout.indexOf(widget)
+        row, column, cols, rows = grid_layout.getItemPosition(index)
+        logger.debug(index)
+
         widget = QtWidgets.QPushButton("Submit changes", central_widget)
         widget.clicked.connect(self.btSubmitClicked)
+        self.btSubmit = widget
         grid_layout.addWidget( widget, row+1, column, cols, rows)
         index = grid_layout.indexOf(widget)
         row, column, cols, rows = grid_layout.getItemPosition(index)
@@ -131,6 +199,26 @@ class MainWindow(QtWidgets.QMainWindow):
         self.lver = QtWidgets.QLabel("None", self)
         grid_layout.addWidget(self.lver, row, column+1, cols, rows)
 
+        widget = QtWidgets.QCheckBox("Verify conflicts by content", central_widget)
+        widget.setToolTip("Compare hashes of local files with the database when their size is the same")
+        widget.toggled.connect(self.cbSaveVerify)
+        grid_layout.addWidget( widget, row+1, column, cols, rows)
+        index = grid_layout.indexOf(widget)
+        row, column, cols, rows = grid_layout.getItemPosition(index)
+        logger.debug(index)
+        self.cbVerify = widget
+
+        widget = QtWidgets.QLabel("Max requests:", self)
+        grid_layout.addWidget( widget, row+1, column, cols, rows)
+        index = grid_layout.indexOf(widget)
+        row, column, cols, rows = grid_layout.getItemPosition(index)
+        logger.debug(index)
+        self.sbRequests = QtWidgets.QSpinBox(central_widget)
+        self.sbRequests.setRange(1, MAX_CONCURRENCY)
+        self.sbRequests.setToolTip("Ceiling of concurrent requests to Syncthing, "
+                                   "the actual limit follows its response time")
+        grid_layout.addWidget( self.sbRequests, row, column+1, cols, rows)
+
         #self.te = QtWidgets.QTextEdit(central_widget)
         #grid_layout.addWidget( self.te, 5, 0)
 
@@ -140,9 +228,37 @@ class MainWindow(QtWidgets.QMainWindow):
         #file_menu = self.menuBar()
         #file_menu.addAction(exit_action)
 
+        self.lselected = QtWidgets.QLabel(self)
+        self.lselected.setToolTip("Counted over the loaded part of the tree")
+        self.statusBar().addPermanentWidget(self.lselected)
+        self.tm.selectedSizeChanged.connect(self.selectedSizeChanged)
+        self.llimit = QtWidgets.QLabel(self)
+        self.llimit.setToolTip("Concurrent requests to Syncthing allowed now")
+        self.statusBar().addPermanentWidget(self.llimit)
+        self._limitTimer = QtCore.QTimer(self)
+        self._limitTimer.timeout.connect(self.showRequestLimit)
+        self._limitTimer.start(1000)
+
+        self.watcher = LocalWatcher(self)
+        self.watcher.directoriesChanged.connect(self.localDirsChanged)
+
         self.currentfid = None
-        self.syncapi = SyncthingAPI()
-        self.fs = FileSystem()
+        self.verifier = None
+        self._scans = {}  # fid -> FolderScan, kept to resume
+        self._removal = None
+        self._removalErrors = []
+        self.sindex = SearchIndex()
+        self._matches = []
+        self._matchPos = -1
+        self.syncapi = syncapi if syncapi is not None else SyncthingAPI()
+        # the cache is opened with the first listing of a folder, after the window is shown
+        self.fs = FileSystem(os.path.join(QtCore.QStandardPaths.writableLocation(
+                QtCore.QStandardPaths.CacheLocation), "scans.sqlite"))
+        if hasattr(self.syncapi, 'subscribe'):
+            # deltas of the daemon come from its thread, the signal brings them here
+            self._daemonSignals = WorkerSignals()
+            self._daemonSignals.finished.connect(self.daemonDelta)
+            self.syncapi.subscribe(self._daemonSignals.finished.emit)
 
         self.readSettings()
         settings = QtCore.QSettings("Syncthing-PySelective", "pysel");
@@ -150,78 +266,90 @@ class MainWindow(QtWidgets.QMainWindow):
         self.leURL.setText( settings.value("apiurl", self.syncapi.api_url_base))
         self.leKey.setText( settings.value("apikey", "None"))
         settings.endGroup();
+        settings.beginGroup("Options");
+        self.cbVerify.setChecked(settings.value("verifyhash", False, type=bool))
+        self.sbRequests.setValue(settings.value("maxrequests", self.syncapi.limiter.ceiling, type=int))
+        # no widget, the budget of the materialized rows is for huge folders only
+        self._itemBudget = settings.value("maxitems", ITEM_BUDGET, type=int)
+        settings.endGroup();
+        self.syncapi.limiter.setCeiling(self.sbRequests.value())
+        self.sbRequests.valueChanged.connect(self.sbSaveRequests)
         self.syncapi.api_url_base = self.leURL.text()
         self.syncapi.api_token = self.leKey.text()
-        self.syncapi.startSession()
-        # try set date format
-        try:
-            self.df = QtCore.Qt.ISODateWithMs
-        except AttributeError:
-            self.df = QtCore.Qt.ISODate
-            logger.warning("Your Qt version is too old, date conversion could be incomplete")
+        # the session loads requests, it is started after the first paint of the window
+        self._sessionStarted = False
 
     def extendFileInfo(self, fid, l, path = '', psyncstate=iprop.SyncState.unknown):
-        contents = self.syncapi.browseFolderPartial(fid, path, lev=1)
+        contents = {c.name: c for c in self.syncapi.browseFolderPartial(fid, path, lev=1)}
         if path != '' and path[-1] != '/':
             path = path + '/'
-        for v in l:
-            extd = self.syncapi.getFileInfoExtended( fid, path+v['name'])
-            if len(extd) == 0:  # there is no such file in database
-                continue
-            v['size'] = extd['global']['size']
-            v['modified'] = QtCore.QDateTime.fromString( extd['global']['modified'], self.df)
-            v['ignored'] = extd['local']['ignored']
-            v['invalid'] = extd['local']['invalid']
-
-            if iprop.Type[v['type']] is iprop.Type.DIRECTORY:
-                # TODO dict of dicts to avoid for
-                for c in contents:
-                    if c['name'] == v['name']:
-                        if 'children' in c:
-                            v['children'] = c['children']
-                        else:
-                            v['children'] = []
-
-            if iprop.Type[v['type']] is not iprop.Type.DIRECTORY:
-                pass
-            elif 'partial' in extd['local']:
-                v['partial'] = extd['local']['partial']
-            # seems the following case do not work at all as 'partial' exists forever
-            else: #do not believe 'ignore', check content
-                selcnt = 0
-                for v2 in v['children']:
-                    if self.syncapi.getFileInfoExtended( \
-                            fid, path+v['name']+'/' + v2['name'])['local']['ignored'] == False:
-                        selcnt += 1
-
-                if selcnt == 0:
-                    v['partial'] = False
-                elif selcnt == len(v['children']):
-                    v['ignored'] = False
-                    v['partial'] = False
-                else:
-                    v['ignored'] = False
-                    v['partial'] = True
-
-            if 'partial' in v and v['partial']:
-                v['syncstate'] = iprop.SyncState.partial
-            elif not v['ignored']:
-                v['syncstate'] = iprop.SyncState.syncing
-            elif psyncstate == iprop.SyncState.syncing:
-                # item ignored but the parent does not
-                # so it must be in global ignore patterns
-                v['syncstate'] = iprop.SyncState.globalignore
+        gign = self.syncapi.globalIgnoredList(fid, [path + v.name for v in l],
+                self.foldsdict[fid]['path'])
+        # newer Syncthing gives size and modification time in db/browse,
+        # so db/file is requested only if they are missing
+        fast = [v for v in l if v.name in contents and contents[v.name].size is not None]
+        states = dict(zip((v.name for v in fast), self.syncapi.localStates(fid,
+                [path + v.name for v in fast], [v.isDir() for v in fast], self.foldsdict[fid]['path'])))
+        for v, isgign in zip(l, gign):
+            if v.name in states:
+                c = contents[v.name]
+                v.size = c.size
+                v.modified = c.modified
+                v.ignored, v.partial = states[v.name]
+            else:
+                extd = self.syncapi.getFileInfoExtended( fid, path+v.name)
+                if len(extd) == 0:  # there is no such file in database
+                    continue
+                v.size = extd['global']['size']
+                v.modified = extd['global']['modified']  # parsed only if it is needed
+                v.ignored = extd['local']['ignored']
+                v.invalid = extd['local']['invalid']
+                v.blockshash = extd['global'].get('blocksHash')
+                if v.isDir():
+                    v.partial = extd['local']['partial']
+
+            if v.isDir():
+                if v.name in contents:
+                    c = contents[v.name]
+                    v.children = c.children if c.children is not None else []
+
+            if v.partial:
+                v.syncstate = iprop.SyncState.partial
+            elif not v.ignored:
+                v.syncstate = iprop.SyncState.syncing
+            elif isgign:
+                v.syncstate = iprop.SyncState.globalignore
             else:
-                v['syncstate'] = iprop.SyncState.ignored
+                v.syncstate = iprop.SyncState.ignored
+
+    def _globalIgnoredFunc(self, fid, path):
+        'classifier of the names inside the path for FileSystem.extendByLocal'
+        pref = path + '/' if path != '' else ''
+        root = self.foldsdict[fid]['path']
+        return lambda names: self.syncapi.globalIgnoredList(fid, [pref + n for n in names], root)
+
+    def paintEvent(self, event):
+        QtWidgets.QMainWindow.paintEvent(self, event)
+        if not self._sessionStarted:
+            QtCore.QTimer.singleShot(0, self.startSession)
+
+    def startSession(self):
+        if not self._sessionStarted:
+            self._sessionStarted = True
+            self.syncapi.startSession()
 
     def btGetClicked(self):
         self.setCursor(QtCore.Qt.WaitCursor)
         logger.info("Button get clicked")
+        self.startSession()
         try:
             self.lver.setText(self.syncapi.getVersion())
             self.syncapi.clearCache()
+            for fid in list(self._scans):
+                self.dropScan(fid)
             d = self.syncapi.getFoldersDict()
             self.foldsdict = d
+            self.syncapi.prewarmFolders(d.keys())
             self.cbfolder.clear()
             for k in d.keys():
                 self.cbfolder.addItem(d[k]['label'], k)
@@ -231,20 +359,154 @@ class MainWindow(QtWidgets.QMainWindow):
             self.unsetCursor()
 
     def btSubmitClicked(self):
+        if self.tm.isLoading(QtCore.QModelIndex()):
+            # unknown rows would be submitted as ignored
+            self.statusBar().showMessage("The folder is still loading, try again later", 5000)
+            return
         self.setCursor(QtCore.Qt.WaitCursor)
         logger.info("Button submit clicked")
         if self.currentfid is not None:
             nl = self.tm.checkedStatePathList() #new list
             pl = self.tm.checkedStatePathList(state = QtCore.Qt.PartiallyChecked)
             cl = self.tm.changedPathList() #changed list
-            il = self.syncapi.getIgnoreSelective(self.currentfid) #ignore list
+            il = self.syncapi.getIgnoreSelective(self.currentfid, fresh=True) #ignore list
             newignores = self.buildNewIgnoreList(cl, nl, pl, il)
-            if QtWidgets.QMessageBox.question( self, "Submit changes", "Are you sure?") == QtWidgets.QMessageBox.Yes:
-                logger.info("Changes accepted")
-                self.syncapi.setIgnoreSelective(self.currentfid, newignores)
+            compacted, roots = self.compactIgnoreList(self.currentfid, newignores)
+            if len(compacted) < len(newignores):
+                # the whole tree under the collapsed directories is compared in background
+                fid = self.currentfid
+                loaded = [p for r in roots for p in self.tm.loadedPaths(r)]
+                self.btSubmit.setEnabled(False)
+                self.statusBar().showMessage("Verifying the compacted selection...")
+                worker = Worker(self._verifyCompacted, fid, newignores, compacted, roots, loaded)
+                worker.signals.finished.connect(
+                        lambda same: self._confirmSubmit(fid, compacted if same else newignores, len(newignores)))
+                worker.signals.error.connect(lambda msg: self._confirmSubmit(fid, newignores, len(newignores)))
+                worker.start()
+                return
+            self._confirmSubmit(self.currentfid, newignores, len(newignores))
+            return
+        self.unsetCursor()
+
+    def _confirmSubmit(self, fid, newignores, full):
+        'full: the number of lines before the compaction'
+        self.btSubmit.setEnabled(True)
+        self.statusBar().clearMessage()
+        self.unsetCursor()
+        if fid != self.currentfid:
+            return
+        msg = "Are you sure?"
+        if len(newignores) < full:
+            msg += "\nThe selection is compacted from {} to {} lines.".format(full, len(newignores))
+        if QtWidgets.QMessageBox.question( self, "Submit changes", msg) == QtWidgets.QMessageBox.Yes:
+            logger.info("Changes accepted")
+            self.syncapi.setIgnoreSelective(fid, newignores)
+            self.dropScan(fid)  # the states are outdated
+        else:
+            logger.info("Changes rejected")
+
+    def btExportClicked(self):
+        if self.currentfid is None:
+            return
+        if self.tm.isLoading(QtCore.QModelIndex()):
+            self.statusBar().showMessage("The folder is still loading, try again later", 5000)
+            return
+        fn, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export selection",
+                self.foldsdict[self.currentfid]['label'] + ".pysel",
+                "Selection (*.pysel *.pysel.gz);;All files (*)")
+        if fn == '':
+            return
+        self.setCursor(QtCore.Qt.WaitCursor)
+        from SelectionSnapshot import writeSelection
+        try:
+            # the rows which are not loaded are known by the ignore list only,
+            # so the selection is the list as it would be submitted
+            cl = self.tm.changedPathList()
+            il = self.buildNewIgnoreList(cl, self.tm.checkedStatePathList(),
+                    self.tm.checkedStatePathList(state = QtCore.Qt.PartiallyChecked),
+                    self.syncapi.getIgnoreSelective(self.currentfid, fresh=True))
+            checked, partial = selectiveIncludes(il)
+            n = writeSelection(fn, checked, partial, cl)
+        except OSError as e:
+            QtWidgets.QMessageBox.warning(self, "Export selection", "Cannot write the file: {}".format(e))
+            return
+        except Exception as e:
+            QtWidgets.QMessageBox.warning(self, "Export selection", "Cannot read the ignore list: {}".format(e))
+            return
+        finally:
+            self.unsetCursor()
+        self.statusBar().showMessage("{} paths are exported".format(n), 5000)
+
+    def btImportClicked(self):
+        if self.currentfid is None:
+            return
+        fn, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Import selection", "",
+                "Selection (*.pysel *.pysel.gz);;All files (*)")
+        if fn == '':
+            return
+        from SelectionSnapshot import readSelection
+        try:
+            checked, partial, changed = readSelection(fn)
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self, "Import selection", "Cannot read the file: {}".format(e))
+            return
+        # every saved path is applied to roll the same layout out
+        paths = sorted(set(checked) | set(partial) | set(changed))
+        ans = QtWidgets.QMessageBox.question(self, "Import selection",
+                "Replace the selection of the folder by {} saved paths?\n"
+                "No merges them into the current selection.".format(len(paths)),
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No | QtWidgets.QMessageBox.Cancel)
+        if ans == QtWidgets.QMessageBox.Cancel:
+            return
+        self.setCursor(QtCore.Qt.WaitCursor)
+        try:
+            il = [] if ans == QtWidgets.QMessageBox.Yes else self.syncapi.getIgnoreSelective(self.currentfid, fresh=True)
+            newignores = self.buildNewIgnoreList(paths, checked, partial, il)
+            self.syncapi.setIgnoreSelective(self.currentfid, newignores)
+        except Exception as e:
+            QtWidgets.QMessageBox.warning(self, "Import selection", "Cannot submit the selection: {}".format(e))
+            return
+        finally:
+            self.unsetCursor()
+        logger.info("Selection of {} paths is imported from {}".format(len(paths), fn))
+        self.dropScan(self.currentfid)
+        self.folderSelected(self.cbfolder.currentIndex())
+
+    def btPatternClicked(self):
+        if self.currentfid is None:
+            return
+        dlg = QtWidgets.QDialog(self)
+        dlg.setWindowTitle("Select by pattern")
+        form = QtWidgets.QFormLayout(dlg)
+        lePattern = QtWidgets.QLineEdit(dlg)
+        lePattern.setPlaceholderText("**/*.mkv or /Photos/20*")
+        form.addRow("Pattern:", lePattern)
+        cbSyntax = QtWidgets.QComboBox(dlg)
+        cbSyntax.addItems(["Glob as in .stignore", "Regular expression"])
+        form.addRow("Syntax:", cbSyntax)
+        cbAction = QtWidgets.QComboBox(dlg)
+        cbAction.addItems(["Select", "Deselect"])
+        form.addRow("Action:", cbAction)
+        bb = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel, parent=dlg)
+        bb.accepted.connect(dlg.accept)
+        bb.rejected.connect(dlg.reject)
+        form.addRow(bb)
+        if dlg.exec_() != QtWidgets.QDialog.Accepted or lePattern.text() == '':
+            return
+
+        try:
+            if cbSyntax.currentIndex() == 0:
+                rx = compileGlob(lePattern.text())
             else:
-                logger.info("Changes rejected")
+                rx = re.compile(lePattern.text().lstrip('/'))
+        except re.error as e:
+            QtWidgets.QMessageBox.warning(self, "Select by pattern", "Wrong pattern: {}".format(e))
+            return
+        value = QtCore.Qt.Checked if cbAction.currentIndex() == 0 else QtCore.Qt.Unchecked
+        self.setCursor(QtCore.Qt.WaitCursor)
+        n = self.tm.setCheckStateByRegex(rx, value)
         self.unsetCursor()
+        self.statusBar().showMessage("{} items matched".format(n), 5000)
 
     def writeSettings(self):
         settings = QtCore.QSettings("Syncthing-PySelective", "pysel");
@@ -260,6 +522,73 @@ class MainWindow(QtWidgets.QMainWindow):
         self.move(settings.value("pos", QtCore.QPoint(200, 200)));
         settings.endGroup();
 
+    def cbSaveVerify(self, checked):
+        settings = QtCore.QSettings("Syncthing-PySelective", "pysel");
+        settings.beginGroup("Options");
+        settings.setValue("verifyhash", checked);
+        settings.endGroup();
+
+    def sbSaveRequests(self, value):
+        self.syncapi.limiter.setCeiling(value)
+        settings = QtCore.QSettings("Syncthing-PySelective", "pysel");
+        settings.beginGroup("Options");
+        settings.setValue("maxrequests", value);
+        settings.endGroup();
+
+    def showRequestLimit(self):
+        text = "Requests: {}/{}".format(self.syncapi.limiter.limit, self.syncapi.limiter.ceiling)
+        if self.llimit.text() != text:
+            self.llimit.setText(text)
+
+    def contentVerifier(self):
+        'the verifier if the content is verified, None otherwise, it is created in the GUI thread only'
+        if not self.cbVerify.isChecked():
+            return None
+        if self.verifier is None:
+            from ContentHash import ContentVerifier
+            cachedir = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.CacheLocation)
+            QtCore.QDir().mkpath(cachedir)
+            self.verifier = ContentVerifier(os.path.join(cachedir, "hashes.sqlite"))
+        return self.verifier
+
+    def refineConflicts(self, fid, l, path, verifier):
+        'can run in background, the verifier is taken from contentVerifier in the GUI thread'
+        if verifier is None:
+            return
+        rpath = os.path.relpath(path, self.foldsdict[fid]['path'])
+        rpath = '' if rpath == '.' else rpath.replace(os.sep, '/') + '/'
+        for v in l:
+            # the blocks hash is not in db/browse, it is requested for the conflicts only
+            if v.syncstate is iprop.SyncState.conflict and not v.isDir() and v.blockshash is None:
+                extd = self.syncapi.getFileInfoExtended(fid, rpath + v.name)
+                if len(extd) > 0:
+                    v.blockshash = extd['global'].get('blocksHash')
+        verifier.refineConflicts(l, path)
+
+    def refineConflictsLater(self, index, l, path):
+        'the conflicts of the rows under index are hashed in background, the row is patched then'
+        verifier = self.contentVerifier()
+        conflicts = [copy.copy(v) for v in l if v.syncstate is iprop.SyncState.conflict and not v.isDir()]
+        if verifier is None or len(conflicts) == 0:
+            return
+        tm, fid = self.tm, self.currentfid
+        pindex = QtCore.QPersistentModelIndex(index)
+        valid = index.isValid()
+        worker = Worker(self._refineStage, fid, conflicts, path, verifier)
+        worker.signals.finished.connect(lambda names: self._conflictsRefined(tm, fid, valid, pindex, names))
+        worker.start()
+
+    def _refineStage(self, fid, l, path, verifier):
+        'runs in background, returns the names of the conflicts with the same content'
+        self.refineConflicts(fid, l, path, verifier)
+        return {v.name for v in l if v.syncstate is not iprop.SyncState.conflict}
+
+    def _conflictsRefined(self, tm, fid, valid, pindex, names):
+        # the row may be gone or the folder may be changed meanwhile
+        if tm is not self.tm or fid != self.currentfid or valid != pindex.isValid() or len(names) == 0:
+            return
+        self.tm.resolveConflicts(QtCore.QModelIndex(pindex), names)
+
     def leSaveKeyAPI(self):
         settings = QtCore.QSettings("Syncthing-PySelective", "pysel");
         settings.beginGroup("Syncthing");
@@ -288,8 +617,22 @@ class MainWindow(QtWidgets.QMainWindow):
         self.leURL.setText( settings.value("apiurl", "None"))
         settings.endGroup();
 
+    def daemonDelta(self, delta):
+        logger.info("Daemon: {} in {}".format(delta['event'], delta['folder']))
+        if delta['folder'] == self.currentfid:
+            self.statusBar().showMessage("Folder {} has been changed, reload it to see the changes".format(
+                    delta['folder']), 10000)
+
     def closeEvent(self, event):
         self.writeSettings()
+        for scan in self._scans.values():
+            scan.cancel()
+        if self._removal is not None:
+            self._removal.cancel()
+        self.syncapi.close()
+        self.fs.close()
+        if self.verifier is not None:
+            self.verifier.close()
         event.accept()
 
     def folderSelected(self, index):
@@ -298,19 +641,237 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.setCursor(QtCore.Qt.WaitCursor)
         fid = self.cbfolder.itemData(index)
+        if self.currentfid in self._scans:
+            self._scans[self.currentfid].cancel()
+        self.btScan.setText("Scan whole folder")
         self.currentfid = fid
         logger.info("Folder with fid {0} selected".format(fid))
         logger.info("Path is {}".format(self.foldsdict[fid]['path']))
         l = self.syncapi.browseFolderPartial(fid)
         logger.debug("Items: {}".format(l))
-        self.extendFileInfo(self.currentfid, l)
+        # the names are shown at once, the state comes by stages in background
+        self.tm = TreeModel(l, self.tv, loading=True)
+        self.tm.setItemBudget(self._itemBudget)
+        self.watcher.setRoot(self.foldsdict[fid]['path'])
+        self.watcher.watch('')
+        self.tm.selectedSizeChanged.connect(self.selectedSizeChanged)
+        self.tm.sort(self.tv.header().sortIndicatorSection(), self.tv.header().sortIndicatorOrder())
+        self.pm.setSourceModel(self.tm)
+        self.selectedSizeChanged(*self.tm.selectedSize())
+        self.tv.resizeColumnToContents(0)
+        self.sindex = SearchIndex()
+        self.sindex.addEntries(l)
+        worker = Worker(self._buildSearchIndex, fid)
+        worker.signals.finished.connect(self._searchIndexReady)
+        worker.start()
+        self.applyFilter()
+        self._loadFolderStage(fid, 0)
+        self.unsetCursor()
+
+    def _loadFolderStage(self, fid, stage):
+        '''
+        the root rows are filled by the state from Syncthing in the stage 0 and by the local one
+        in the stage 1, the result of a folder which is not shown anymore is dropped
+        '''
+        tm = self.tm
+        if stage == 0:
+            worker = Worker(self._remoteStage, fid, tm.rowNamesList(QtCore.QModelIndex()))
+        else:
+            worker = Worker(self._localStage, fid, tm.rowNamesList(QtCore.QModelIndex()),
+                            self.foldsdict[fid]['path'], self.contentVerifier())
+        worker.signals.finished.connect(lambda l: self._folderStageReady(tm, fid, stage, l))
+        worker.signals.error.connect(lambda msg: self._folderStageFailed(tm, msg))
+        worker.start()
+        self.statusBar().showMessage("Loading the state of the folder...")
+
+    def _remoteStage(self, fid, l):
+        'runs in background'
+        self.extendFileInfo(fid, l)
         logger.debug("Extended items: {}".format(l))
-        self.fs.extendByLocal(l, self.foldsdict[fid]['path'])
+        return l
+
+    def _localStage(self, fid, l, path, verifier):
+        'runs in background, the same as refreshLocal for the root'
+        self.fs.extendByLocal(l, path, globalignored=self._globalIgnoredFunc(fid, ''))
+        self.refineConflicts(fid, l, path, verifier)
         logger.debug("Extended and local items: {}".format(l))
-        self.tm = TreeModel(l, self.tv)
-        self.tv.setModel(self.tm)
+        return l
+
+    def _folderStageReady(self, tm, fid, stage, l):
+        if tm is not self.tm or fid != self.currentfid:
+            return
+        self.tm.updateSubSection(QtCore.QModelIndex(), l)
+        if stage == 0:
+            self._loadFolderStage(fid, 1)
+            return
+        self.tm.setLoading(QtCore.QModelIndex(), False)
+        self.sindex.addEntries(l)
         self.tv.resizeColumnToContents(0)
-        self.unsetCursor()
+        self.statusBar().showMessage("The folder is loaded", 3000)
+
+    def _folderStageFailed(self, tm, msg):
+        if tm is not self.tm:
+            return
+        self.tm.setLoading(QtCore.QModelIndex(), False)
+        self.statusBar().showMessage("Cannot load the state of the folder: {}".format(msg), 10000)
+
+    def _buildSearchIndex(self, fid):
+        'runs in background, indexes the whole global tree of the folder'
+        idx = SearchIndex()
+        idx.addEntries(self.syncapi.browseFolderTree(fid))
+        return fid, idx
+
+    def _searchIndexReady(self, rv):
+        fid, idx = rv
+        if fid != self.currentfid:
+            return
+        # keep local items indexed during the loading
+        idx.addPaths(self.sindex.paths())
+        self.sindex = idx
+        logger.info("Search index is ready: {} paths".format(len(idx)))
+        if self.leFilter.text() != '':
+            self.applyFilter()
+
+    def btScanClicked(self):
+        if self.currentfid is None:
+            return
+        fid = self.currentfid
+        scan = self._scans.get(fid)
+        if scan is not None and scan.isRunning():
+            scan.cancel()
+            self.btScan.setText("Resume folder scan")
+            self.statusBar().showMessage("Folder scan is cancelled", 5000)
+            return
+        if scan is None or scan.isComplete():
+            scan = FolderScan(lambda path, l, psyncstate: self._scanDirectory(fid, path, l, psyncstate), self)
+            scan.resultsReady.connect(lambda batch: self._scanResults(fid, batch))
+            scan.progress.connect(lambda done, total: self._scanProgress(fid, done, total))
+            scan.finished.connect(lambda failed: self._scanFinished(fid, failed))
+            self._scans[fid] = scan
+        scan.start(self.tm.rowNamesList(QtCore.QModelIndex()))
+        self.btScan.setText("Cancel folder scan")
+
+    def dropScan(self, fid):
+        scan = self._scans.pop(fid, None)
+        if scan is not None:
+            scan.cancel()
+            scan.deleteLater()
+        if fid == self.currentfid:
+            self.btScan.setText("Scan whole folder")
+
+    def _scanDirectory(self, fid, path, l, psyncstate):
+        'runs in background, the same as updateSectionInfo for the item which is not loaded'
+        self.extendFileInfo(fid, l, path, psyncstate)
+        self.fs.extendByLocal(l, os.path.join(self.foldsdict[fid]['path'], path), psyncstate,
+                self._globalIgnoredFunc(fid, path))
+        return l
+
+    def _scanResults(self, fid, batch):
+        if fid != self.currentfid:
+            return
+        for path, l in batch:
+            # the pending and evicted rows take the state when they are loaded
+            index = self.tm.indexByPath(path, fetch=False)
+            if path != '' and not index.isValid():
+                continue
+            self.tm.updateSubSection(index, list(l))
+            self.sindex.addEntries(l, path + '/' if path != '' else '')
+
+    def _scanProgress(self, fid, done, total):
+        if fid == self.currentfid:
+            self.statusBar().showMessage("Scanning the folder: {} of {} directories".format(done, total))
+
+    def _scanFinished(self, fid, failed):
+        if fid != self.currentfid:
+            return
+        self.btScan.setText("Scan whole folder" if failed == 0 else "Resume folder scan")
+        if failed == 0:
+            self.statusBar().showMessage("The folder is scanned", 5000)
+        else:
+            self.statusBar().showMessage("The folder is scanned, {} directories failed".format(failed), 10000)
+
+    def selectedSizeChanged(self, size, files):
+        self.lselected.setText("Selected: {} in {} files".format(iprop.humanSize(size), files))
+
+    def leFilterChanged(self, text):
+        self._filterTimer.start()
+
+    def applyFilter(self):
+        text = self.leFilter.text()
+        self._matchPos = -1
+        if text == '':
+            self._matches = []
+            self.pm.setVisiblePaths(None)
+            self.statusBar().clearMessage()
+            return
+        self._matches = self.sindex.search(text)
+        self.pm.setVisiblePaths(SearchIndex.withAncestors(self._matches))
+        self.statusBar().showMessage("{} matches".format(len(self._matches)))
+
+    def revealNextMatch(self):
+        if len(self._matches) == 0:
+            return
+        self._matchPos = (self._matchPos + 1) % len(self._matches)
+        self.revealPath(self._matches[self._matchPos])
+
+    def revealPath(self, path):
+        'expand the ancestors of the path loading them on demand and select the deepest found item'
+        index = QtCore.QModelIndex()
+        names = path.split('/')
+        for i, name in enumerate(names):
+            chindex = self.tm.childIndex(index, name)
+            if not chindex.isValid():
+                break
+            index = chindex
+            if i < len(names) - 1:
+                self.tv.expand(self.pm.mapFromSource(index))
+        if index.isValid():
+            pindex = self.pm.mapFromSource(index)
+            self.tv.scrollTo(pindex)
+            self.tv.selectionModel().setCurrentIndex(pindex,
+                    QtCore.QItemSelectionModel.ClearAndSelect | QtCore.QItemSelectionModel.Rows)
+
+    def tvExpanded(self, pindex):
+        index = self.pm.mapToSource(pindex)
+        self.tm.setExpanded(index, True)
+        self.updateSectionInfo(index)
+        self.watcher.watch(self.tm.fullItemName(self.tm.getItem(index)))
+
+    def tvCollapsed(self, pindex):
+        index = self.pm.mapToSource(pindex)
+        self.tm.setExpanded(index, False)
+        self.watcher.unwatch(self.tm.fullItemName(self.tm.getItem(index)))
+
+    def localDirsChanged(self, paths):
+        if self.currentfid in self._scans:
+            self._scans[self.currentfid].invalidate(paths)
+        for path in paths:
+            self.fs.invalidate(os.path.join(self.foldsdict[self.currentfid]['path'], path))
+            index = self.tm.indexByPath(path, fetch=False)
+            if path != '' and (not index.isValid() or not self.tm.getItem(index).isexpanded):
+                continue
+            if self.tm.isLoading(index):
+                continue  # the local state is taken by the last stage of the loading
+            self.refreshLocal(index)
+
+    def refreshLocal(self, index):
+        'update the local state of the loaded children without requests to Syncthing'
+        item = self.tm.getItem(index)
+        path = self.tm.fullItemName(item)
+        logger.info("Refresh local state of '{}'".format(path))
+        l = self.tm.rowNamesList(index)
+        for v in l:
+            # compare with the local file again
+            if v.syncstate is iprop.SyncState.exists or v.syncstate is iprop.SyncState.conflict:
+                v.syncstate = iprop.SyncState.ignored
+        localpath = os.path.join(self.foldsdict[self.currentfid]['path'], path)
+        self.fs.extendByLocal(l, localpath, item.getSyncState(),
+                self._globalIgnoredFunc(self.currentfid, path))
+        self.tm.updateSubSection(index, l)
+        self.refineConflictsLater(index, l, localpath)
+
+    def currentSourceIndex(self):
+        return self.pm.mapToSource(self.tv.selectionModel().currentIndex())
 
     def updateSectionInfo(self, index):
         self.setCursor(QtCore.Qt.WaitCursor)
@@ -322,9 +883,13 @@ class MainWindow(QtWidgets.QMainWindow):
         logger.debug("Extended items: {}".format(l))
         self.fs.extendByLocal(l, os.path.join(
             self.foldsdict[self.currentfid]['path'], self.tm.fullItemName(self.tm.getItem(index))),
-            self.tm.getItem(index).getSyncState())
+            self.tm.getItem(index).getSyncState(),
+            self._globalIgnoredFunc(self.currentfid, self.tm.fullItemName(self.tm.getItem(index))))
         logger.debug("Extended and local items: {}".format(l))
         self.tm.updateSubSection(index, l)
+        self.refineConflictsLater(index, l, os.path.join(
+            self.foldsdict[self.currentfid]['path'], self.tm.fullItemName(self.tm.getItem(index))))
+        self.sindex.addEntries(l, self.tm.fullItemName(self.tm.getItem(index)) + '/')
         self.unsetCursor()
 
     def buildNewIgnoreList(self, changedlist, checkedlist, partiallist, ignorelist):
@@ -333,66 +898,92 @@ class MainWindow(QtWidgets.QMainWindow):
         logger.debug("Partially checked list:\n{0}".format(partiallist))
         logger.debug("Initial ignores:\n{0}".format(ignorelist))
 
-        # clean lists
-        for v in changedlist:
-            # clear exact matching
-            if ('!' + v) in ignorelist:
-                ignorelist.remove('!' + v)
-            # clear ignore (valid for partially synced dirs)
-            if (v + '/**') in ignorelist:
-                ignorelist.remove(v + '/**')
-            # remove subitems if parent is not partially checked
-            # add / to be sure that compare with subdirs
-            if (v in checkedlist) or (v not in partiallist):
-                for i in ignorelist[:]:
-                    if (i.startswith(v + '/') and i != v) or i.startswith('!' + v + '/'):
-                        ignorelist.remove(i)
-                for c in checkedlist[:]:
-                    if (c.startswith(v + '/') and c != v) or c.startswith('!' + v + '/'):
-                        checkedlist.remove(c)
-        logger.debug("Result of clean:\n{0}".format(ignorelist))
-
-        # exclude item from ignore if checked
-        for v in changedlist:
-            if v in checkedlist:
-                ignorelist.insert(0, '!' + v)
-        logger.debug("Result of exclude:\n{0}".format(ignorelist))
-
         # hack to sync parent folder, seems could be skipped for versions above 1.5
         # TODO: but it can be useful to keep dir partially sunced without selected items
-        if self.syncapi.api_version < self.syncapi.verStr2Num("1.6.0"):
-            for v in changedlist:
-                if v in partiallist:
-                    ignorelist.append(v + '/**')
-                    ignorelist.append('!' + v)
-            logger.debug("Result of hack:\n{0}".format(ignorelist))
-
+        legacy = self.syncapi.api_version < self.syncapi.verStr2Num("1.6.0")
+        ignorelist = mergeSelective(ignorelist, changedlist, checkedlist, partiallist, legacy)
         # TODO remove items ignored globally
 
-        while ignorelist.count(''):
-            ignorelist.remove('')
-
         logger.debug("Resulted ignores:\n{0}".format(ignorelist))
         return ignorelist
 
+    def compactIgnoreList(self, fid, il):
+        '''
+        compacted selective section by the loaded rows and the paths of the lines it changes,
+        see _verifyCompacted, il if nothing is compacted
+        '''
+        root = self.foldsdict[fid]['path']
+        def children(path):
+            index = self.tm.indexByPath(path, fetch=False)
+            if not index.isValid():
+                return None
+            names = self.tm.getItem(index).childNames()
+            gign = self.syncapi.globalIgnoredList(fid, [path + '/' + n for n in names], root)
+            return [n for n, ig in zip(names, gign) if not ig]
+
+        cl = compactSelective(il, children)
+        if len(cl) >= len(il):
+            return il, []
+        # only the literal includes are collapsed or dropped, the rest stays in place
+        roots = sorted({line[2:].rstrip('/') for line in set(il) ^ set(cl) if line.startswith('!/')})
+        roots = [r for i, r in enumerate(roots) if not any(r.startswith(q + '/') for q in roots[:i])]
+        return cl, roots
+
+    def _verifyCompacted(self, fid, il, cl, roots, loaded):
+        '''
+        runs in background, True if the compacted section ignores the same as il under the roots,
+        the remote tree is compared with the loaded paths as the local rows are in the tree only
+        '''
+        root = self.foldsdict[fid]['path']
+        paths = set(loaded)
+        tree = self.syncapi.browseFolderTree(fid)
+        for r in roots:
+            entries = tree
+            for name in r.split('/'):
+                entries = next((v.children or [] for v in entries if v.name == name), [])
+            paths.add(r)
+            stack = [(entries, r + '/')]
+            while stack:
+                entries, pref = stack.pop()
+                for v in entries:
+                    paths.add(pref + v.name)
+                    if v.children:
+                        stack.append((v.children, pref + v.name + '/'))
+        paths = list(paths)
+        def synced(lines):
+            ignored = IgnoreMatcher(self.syncapi.composeIgnoreList(fid, lines), root).ignoredList(paths)
+            rv = set()
+            for p, ig in zip(paths, ignored):
+                # the parents are synced to hold the item
+                while not ig and p and p not in rv:
+                    rv.add(p)
+                    p = p.rpartition('/')[0]
+            return rv
+
+        diff = synced(il) ^ synced(cl)
+        if len(diff) > 0:
+            logger.warning("Compacted ignores differ for {} items, the full list is used".format(len(diff)))
+            return False
+        logger.info("Ignores compacted from {} to {} lines".format(len(il), len(cl)))
+        return True
+
     def contextMenuEvent(self, e):
         logger.debug("Context menu event at position {} with {} selected rows".format(e.pos(), len(self.tv.selectionModel().selectedRows())))
+        self.rmCancelAct.setEnabled(self._removal is not None)
         if len(self.tv.selectionModel().selectedRows()) > 0:
-            item = self.tm.getItem(self.tv.selectionModel().currentIndex())
-            if item.getSyncState() == iprop.SyncState.newlocal or \
-                    item.getSyncState() == iprop.SyncState.conflict or \
-                    item.getSyncState() == iprop.SyncState.exists or \
-                    item.getSyncState() == iprop.SyncState.globalignore:
-                self.rmAct.setEnabled(True)
-            else:
-                self.rmAct.setEnabled(False)
+            self.rmAct.setEnabled(self._removal is None and len(self.removablePaths()) > 0)
             self.cm.popup(e.globalPos())
 
     def actInfo(self):
         'returns file info json string'
-        item = self.tm.getItem(self.tv.selectionModel().currentIndex())
+        index = self.currentSourceIndex()
+        item = self.tm.getItem(index)
         path = self.tm.fullItemName(item)
         d1 = self.syncapi.getFileInfoExtended( self.currentfid, path)
+        if len(d1) > 0 and not d1['local']['ignored'] and d1['local']['invalid'] != item.isinvalid:
+            # the flag is not in db/browse, it is known after the request only
+            item.setInvalid(d1['local']['invalid'])
+            self.tm.dataChanged.emit(index, index)
         d2 = item.toDict()
         s1 = json.dumps(d1, indent=4)
         s2 = json.dumps(d2, indent=4)
@@ -402,18 +993,78 @@ class MainWindow(QtWidgets.QMainWindow):
         msgBox.setInformativeText("Database:\n{}\n\nLocal:\n{}".format(s1, s2))
         msgBox.exec()
 
+    def removablePaths(self):
+        'selected paths with a local copy, the ones inside another selected path are skipped'
+        paths = set()
+        for index in self.tv.selectionModel().selectedRows():
+            item = self.tm.getItem(self.pm.mapToSource(index))
+            if item.getSyncState() == iprop.SyncState.newlocal or \
+                    item.getSyncState() == iprop.SyncState.conflict or \
+                    item.getSyncState() == iprop.SyncState.exists or \
+                    item.getSyncState() == iprop.SyncState.globalignore:
+                paths.add(self.tm.fullItemName(item))
+        rv = []
+        for path in sorted(paths):
+            parent = path.rpartition('/')[0]
+            while parent and parent not in paths:
+                parent = parent.rpartition('/')[0]
+            if not parent:
+                rv.append(path)
+        return rv
+
     def actRemove(self):
-        'remove selected path completely'
-        index = self.tv.selectionModel().currentIndex()
-        item = self.tm.getItem(index)
-        path = self.tm.fullItemName(item)
-        path = os.path.join( self.foldsdict[self.currentfid]['path'], path)
-        logger.debug("Remove the path {}".format(path))
-        try:
-            if os.path.isfile(path):
-                os.remove(path)
-            else:
-                shutil.rmtree(path)
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "Remove path error", "Path: {}\n\n{}".format(path, e))
-        self.updateSectionInfo(self.tm.parent(index))
+        'remove selected paths completely in background'
+        if self._removal is not None:
+            return
+        if self.tm.isLoading(QtCore.QModelIndex()):
+            self.statusBar().showMessage("The folder is still loading, try again later", 5000)
+            return
+        paths = self.removablePaths()
+        if len(paths) == 0:
+            return
+        if len(paths) > 1 and QtWidgets.QMessageBox.question(self, "Remove paths",
+                "Remove {} paths with everything inside them?".format(len(paths))) != QtWidgets.QMessageBox.Yes:
+            return
+        fid = self.currentfid
+        root = self.foldsdict[fid]['path']
+        relpaths = {os.path.join(root, p): p for p in paths}
+        logger.debug("Remove the paths {}".format(list(relpaths)))
+        self._removalErrors = []
+        self._removal = LocalRemoval(relpaths, self)
+        self._removal.removed.connect(lambda path, error: self._pathRemoved(fid, relpaths[path], error))
+        self._removal.progress.connect(self._removalProgress)
+        self._removal.finished.connect(self._removalFinished)
+        self._removal.start()
+
+    def actCancelRemoval(self):
+        if self._removal is not None:
+            self._removal.cancel()
+
+    def _pathRemoved(self, fid, path, error):
+        if error != '' and error != 'Cancelled':
+            self._removalErrors.append("{}: {}".format(path, error))
+        parent = path.rpartition('/')[0]
+        self.fs.invalidate(os.path.join(self.foldsdict[fid]['path'], parent))
+        if fid in self._scans:
+            self._scans[fid].invalidate([parent])
+        if fid != self.currentfid:
+            return
+        index = self.tm.indexByPath(path)
+        if not index.isValid():
+            return
+        if error == '':
+            # the row is patched in place, nothing is requested from Syncthing
+            self.tm.removeLocal(index)
+        else:
+            # a part is removed, the rest is taken from the disk
+            self.refreshLocal(self.tm.parent(index))
+
+    def _removalProgress(self, done, total):
+        self.statusBar().showMessage("Removing: {} of {} entries".format(done, total))
+
+    def _removalFinished(self, cancelled):
+        self.statusBar().showMessage("The removal is cancelled" if cancelled else "The paths are removed", 5000)
+        self._removal.deleteLater()
+        self._removal = None
+        if len(self._removalErrors) > 0:
+            QtWidgets.QMessageBox.critical(self, "Remove path error", "\n\n".join(self._removalErrors[:10]))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+
+try:
+    from PySide2 import QtCore
+except:
+    from PyQt5 import QtCore
+
+import logging
+logger = logging.getLogger("PySel.SearchIndex")
+
+
+class SearchIndex:
+    '''
+    Trigram index over full item paths (relative to the folder, without leading slash).
+    The rarest trigram of a query gives the candidates which are verified by substring search,
+    a refined query (the previous one is its part) filters the previous result only.
+    '''
+    def __init__(self):
+        self._paths = []
+        self._folded = []
+        self._ids = {}
+        self._trigrams = {}
+        self._lastQuery = None
+        self._lastResult = None
+
+    def __len__(self):
+        return len(self._paths)
+
+    def paths(self):
+        return self._paths
+
+    def addPath(self, path):
+        if path in self._ids:
+            return
+        pid = len(self._paths)
+        self._ids[path] = pid
+        self._paths.append(path)
+        f = path.casefold()
+        self._folded.append(f)
+        for tg in {f[i:i+3] for i in range(len(f) - 2)}:
+            pl = self._trigrams.get(tg)
+            if pl is None:
+                pl = self._trigrams[tg] = array('I')
+            pl.append(pid)
+        self._lastQuery = None
+
+    def addPaths(self, paths):
+        for p in paths:
+            self.addPath(p)
+
+    def addEntries(self, entries, prefix=''):
+        'add FileEntry list with children recursively, prefix ends with slash'
+        stack = [(entries, prefix)]
+        while stack:
+            l, pref = stack.pop()
+            for v in l:
+                p = pref + v.name
+                self.addPath(p)
+                if v.children:
+                    stack.append((v.children, p + '/'))
+
+    def search(self, query):
+        'returns the list of paths containing the query, case insensitive'
+        q = query.casefold()
+        if q == '':
+            return []
+        if self._lastQuery is not None and self._lastQuery in q:
+            cand = self._lastResult
+        elif len(q) < 3:
+            cand = range(len(self._folded))
+        else:
+            cand = min((self._trigrams.get(q[i:i+3], ()) for i in range(len(q) - 2)), key=len)
+        folded = self._folded
+        res = [pid for pid in cand if q in folded[pid]]
+        self._lastQuery = q
+        self._lastResult = res
+        return [self._paths[pid] for pid in res]
+
+    @staticmethod
+    def withAncestors(paths):
+        rv = set()
+        for p in paths:
+            while p and p not in rv:
+                rv.add(p)
+                p = p.rpartition('/')[0]
+        return rv
+
+
+class TreeFilterModel(QtCore.QSortFilterProxyModel):
+    'shows only the items whose paths are in the visible set, see SearchIndex.withAncestors'
+    def __init__(self, parent=None):
+        QtCore.QSortFilterProxyModel.__init__(self, parent)
+        self._visible = None
+
+    def setVisiblePaths(self, paths):
+        'None disables filtering'
+        self._visible = paths
+        self.invalidateFilter()
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        'TreeModel sorts natively by its keys, the proxy keeps the order of the source'
+        self.sourceModel().sort(column, order)
+
+    def filterAcceptsRow(self, row, parent):
+        if self._visible is None:
+            return True
+        src = self.sourceModel()
+        item = src.getItem(src.index(row, 0, parent))
+        return src.fullItemName(item) in self._visible
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+
+import logging
+logger = logging.getLogger("PySel.SelectionSnapshot")
+
+# The file is a header line and one line per path sorted by the path:
+#   <length of the prefix shared with the previous path> <flags> <rest of the path>
+# flags: c - checked, p - partially checked, x - changed by the user,
+# backslashes and line breaks in the rest are escaped, *.gz files are compressed
+MAGIC = 'pysel-selection'
+VERSION = 1
+
+CHECKED = 'c'
+PARTIAL = 'p'
+CHANGED = 'x'
+
+
+def _open(fn, mode):
+    return gzip.open(fn, mode + 't', encoding='utf-8') if fn.endswith('.gz') else \
+           open(fn, mode, encoding='utf-8', newline='\n')
+
+
+def _escape(s):
+    return s.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _unescape(s):
+    if '\\' not in s:
+        return s
+    return s.replace('\\\\', '\0').replace('\\n', '\n').replace('\0', '\\')
+
+
+def writeSelection(fn, checked, partial, changed):
+    'writes the path lists of TreeModel into the file fn, returns the number of paths'
+    flags = {}
+    for kind, paths in ((CHECKED, checked), (PARTIAL, partial), (CHANGED, changed)):
+        for p in paths:
+            flags[p] = flags.get(p, '') + kind
+    prev = ''
+    with _open(fn, 'w') as f:
+        f.write('{} {}\n'.format(MAGIC, VERSION))
+        for p in sorted(flags):
+            n = 0
+            limit = min(len(p), len(prev))
+            while n < limit and p[n] == prev[n]:
+                n += 1
+            f.write('{} {} {}\n'.format(n, flags[p], _escape(p[n:])))
+            prev = p
+    logger.info("{} paths are written into {}".format(len(flags), fn))
+    return len(flags)
+
+
+def readSelection(fn):
+    'the checked, partially checked and changed path lists of the file fn sorted by the path'
+    checked, partial, changed = [], [], []
+    with _open(fn, 'r') as f:
+        header = f.readline().split()
+        if len(header) != 2 or header[0] != MAGIC:
+            raise ValueError("{} is not a selection file".format(fn))
+        if not header[1].isdigit() or int(header[1]) > VERSION:
+            raise ValueError("Version {} of the selection file is not supported".format(header[1]))
+        prev = ''
+        for lineno, line in enumerate(f, 2):
+            try:
+                n, kinds, rest = line.rstrip('\n').split(' ', 2)
+                p = prev[:int(n)] + _unescape(rest)
+            except ValueError:
+                raise ValueError("Wrong line {} of {}".format(lineno, fn))
+            if CHECKED in kinds:
+                checked.append(p)
+            if PARTIAL in kinds:
+                partial.append(p)
+            if CHANGED in kinds:
+                changed.append(p)
+            prev = p
+    logger.info("{} checked, {} partially checked and {} changed paths are read from {}".format(
+                len(checked), len(partial), len(changed), fn))
+    return checked, partial, changed
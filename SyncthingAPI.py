@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import copy
 import json
-import requests
 import types
 import urllib
 import re
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import lru_cache
 
 import ItemProperty as iprop
+from IgnorePatterns import IgnoreMatcher
 
 import logging
 logger = logging.getLogger("PySel.SyncthingAPI")
@@ -15,6 +19,73 @@ logger = logging.getLogger("PySel.SyncthingAPI")
 # the following url was used to build API
 # https://www.digitalocean.com/community/tutorials/how-to-use-web-apis-in-python-3
 
+MAX_CONCURRENCY = 16
+# seconds to connect and to wait for the response
+REQUEST_TIMEOUT = (5, 120)
+# seconds a prewarmed response is taken instead of a new request, the folder may change later
+PREWARM_AGE = 30
+
+
+class ConcurrencyLimiter:
+    '''
+    AIMD limit of the requests in flight: it grows by one per window of successful requests
+    and halves on a timeout or a server error, so Syncthing is not overloaded while it scans
+    or syncs itself. A latency far above the moving average of the endpoint holds the growth,
+    an endpoint which is slow as usual does not change the limit.
+    '''
+    def __init__(self, ceiling=8, initial=4, slowfactor=3.0, slack=0.05, alpha=0.2):
+        self._cond = threading.Condition()
+        self._ceiling = ceiling
+        self._limit = float(min(initial, ceiling))
+        self._inflight = 0
+        self._baseline = {}  # endpoint -> exponential moving average of the latency
+        self._lastDecrease = 0.0
+        self._slowfactor = slowfactor
+        self._slack = slack
+        self._alpha = alpha
+
+    @property
+    def limit(self):
+        'current number of requests allowed in flight'
+        with self._cond:
+            return max(1, int(self._limit))
+
+    @property
+    def ceiling(self):
+        return self._ceiling
+
+    def setCeiling(self, ceiling):
+        with self._cond:
+            self._ceiling = max(1, ceiling)
+            self._limit = min(self._limit, self._ceiling)
+            self._cond.notify_all()
+
+    def acquire(self):
+        'waits for a free slot and returns the start time for release'
+        with self._cond:
+            while self._inflight >= max(1, int(self._limit)):
+                self._cond.wait()
+            self._inflight += 1
+        return time.monotonic()
+
+    def release(self, start, endpoint, failed=False):
+        now = time.monotonic()
+        latency = now - start
+        with self._cond:
+            self._inflight -= 1
+            base = self._baseline.get(endpoint)
+            slow = base is not None and latency > self._slowfactor * base + self._slack
+            self._baseline[endpoint] = latency if base is None else base + (latency - base) * self._alpha
+            if failed:
+                # one decrease for the requests sent before it
+                if start > self._lastDecrease:
+                    self._limit = max(1.0, self._limit / 2)
+                    self._lastDecrease = now
+                    logger.debug("Concurrency limit decreased to {0:.1f} by {1}".format(self._limit, endpoint))
+            elif not slow:
+                self._limit = min(float(self._ceiling), self._limit + 1 / self._limit)
+            self._cond.notify_all()
+
 class SyncthingAPI:
     def __init__(self):
         self.api_version = 0
@@ -24,9 +95,19 @@ class SyncthingAPI:
         self.api_hostname = "localhost"
         self.headerSelectStart = '//* Selective sync (generated by pyselective) *//'
         self.headerSelectFinish = '//* ignore all except selected *//'
-        self._ignoreSelectiveList = []
+        # independent requests are sent concurrently through the pool, the limiter decides how many
+        self._executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="PySel.API")
+        self.limiter = ConcurrencyLimiter()
+        self._etagCache = {}  # suffix -> (etag, decoded response)
+        self._prewarmed = {}  # suffix -> (monotonic time of the request, future with the response)
+        self._prewarmLock = threading.Lock()
+        self._inflight = {}  # suffix -> [future of the request being sent, number of waiters]
+        self._inflightLock = threading.Lock()
+        self._counters = {'sent': 0, 'coalesced': 0}
 
     def startSession(self):
+        # requests takes a good part of the startup to import, it is loaded with the first session
+        import requests
         self.session = requests.Session()
         self.session.verify = False
         self.session.headers = {'X-API-Key': self.api_token}
@@ -48,9 +129,89 @@ class SyncthingAPI:
             self.api_port = p
 
     def _getRequest(self, suff):
-        api_url = self.api_url_base + suff
-        response = self.session.get(api_url)
+        '''
+        identical concurrent requests are sent once, the others wait for the same response,
+        every caller gets its own copy as the results are modified in place
+        '''
+        with self._inflightLock:
+            entry = self._inflight.get(suff)
+            leader = entry is None
+            if leader:
+                entry = self._inflight[suff] = [Future(), 0]
+                self._counters['sent'] += 1
+            else:
+                entry[1] += 1
+                self._counters['coalesced'] += 1
+        fut = entry[0]
+        if not leader:
+            logger.debug("Coalesced: {0}".format(suff))
+            return copy.deepcopy(fut.result())
+        try:
+            rv = self._sendGetRequest(suff)
+        except BaseException as e:
+            with self._inflightLock:
+                del self._inflight[suff]
+            fut.set_exception(e)
+            raise
+        # no waiter comes after the entry is removed
+        with self._inflightLock:
+            del self._inflight[suff]
+            waiters = entry[1]
+        fut.set_result(copy.deepcopy(rv) if waiters > 0 else rv)
+        return rv
+
+    def _sendGetRequest(self, suff):
+        response = self._send(self.session.get, suff)
+        return self._parseResponse(response, suff)
+
+    def _send(self, method, suff, **kwargs):
+        'the request through the concurrency limiter'
+        import requests
+        endpoint = suff.partition('?')[0]
+        start = self.limiter.acquire()
+        failed = False
+        try:
+            response = method(self.api_url_base + suff, timeout=REQUEST_TIMEOUT, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        except requests.Timeout:
+            failed = True
+            raise
+        finally:
+            self.limiter.release(start, endpoint, failed)
+
+    def _longPoll(self, suff, timeout):
+        'the request which waits on the server side, it is not limited'
+        response = self.session.get(self.api_url_base + suff, timeout=(REQUEST_TIMEOUT[0], timeout + 30))
+        return self._parseResponse(response, suff)
+
+    def requestCounters(self):
+        'numbers of GET requests sent and of the ones served by a request in flight, the concurrency limit'
+        with self._inflightLock:
+            rv = dict(self._counters)
+        rv['limit'] = self.limiter.limit
+        return rv
 
+    def _getRequestCached(self, suff):
+        'the same as _getRequest, but revalidates the previous response by its ETag'
+        headers = {}
+        cached = self._etagCache.get(suff)
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+        response = self._send(self.session.get, suff, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            logger.debug("Not modified: {0}".format(suff))
+            return cached[1]
+        rv = self._parseResponse(response, suff)
+        etag = response.headers.get('ETag')
+        if etag:
+            self._etagCache[suff] = (etag, rv)
+        else:
+            self._etagCache.pop(suff, None)
+        return rv
+
+    def _parseResponse(self, response, suff):
+        import requests
         if isinstance(response, types.GeneratorType):
             raise ImportError('It seems you use \"yieldfrom.request\" instead of \"requests\"')
 
@@ -71,40 +232,51 @@ class SyncthingAPI:
             raise requests.RequestException('Wrong status code: '+ str(response.status_code) + " (" + suff + ")")
 
     def _postRequest(self, suff, d):
-        api_url = self.api_url_base + suff
-        self.session.post(api_url,  json = d)
+        self._send(self.session.post, suff, json = d)
 
     def _refineBrowseFolderRequest(self, d, rv = None):
         # to avoid copying
         if rv is None:
             rv = []
 
-        if self.api_version >= self.verStr2Num("1.14.0"):
-            return d
+        if self.api_version >= self.verStr2Num("1.14.0") and isinstance(d, list):
+            return [iprop.FileEntry.fromBrowse(v) for v in d]
 
-        # refine dict with list to list of dicts
+        # refine dict with list to list of entries
         # if the version is lower than 1.14.0
         for key in d:
             if isinstance(d[key], dict):
-                rv.append({ 'name' : key, 'type': 'FILE_INFO_TYPE_DIRECTORY', 'children': [] })
-                self._refineBrowseFolderRequest(d[key], rv[-1]['children'])
+                rv.append(iprop.FileEntry(key, iprop.Type.DIRECTORY, []))
+                self._refineBrowseFolderRequest(d[key], rv[-1].children)
             else:
-                rv.append({ 'name' : key, 'type': 'FILE_INFO_TYPE_FILE'})
+                rv.append(iprop.FileEntry(key, iprop.Type.FILE))
         return rv
 
     def getFolderIter(self):
         return self._getRequest('stats/folder').keys()
 
     def getFoldersDict(self):
-        dicts = self._getRequest('stats/folder')
-        cfgd = self._getRequest('system/config')
+        fstats = self._executor.submit(self._getRequest, 'stats/folder')
+        fcfg = self._executor.submit(self._getRequestCached, 'system/config')
+        dicts = fstats.result()
+        cfgfolders = {f['id']: f for f in fcfg.result()['folders']}
         for k in dicts.keys():
-            for f in cfgd['folders']:
-                if f['id'] == k:
-                    dicts[k]['label'] = f['label']
-                    dicts[k]['path'] = f['path']
+            if k in cfgfolders:
+                dicts[k]['label'] = cfgfolders[k]['label']
+                dicts[k]['path'] = cfgfolders[k]['path']
         return dicts
 
+    def prewarmFolders(self, fids):
+        'load the root of the folders in background, browseFolderPartial picks the results up'
+        for fid in fids:
+            self._executor.submit(self.getIgnoreList, fid)
+            for lev in (0, 1):
+                suff = self._browseSuffix(fid, '', lev)
+                with self._prewarmLock:
+                    old = self._prewarmed.get(suff)
+                    if old is None or time.monotonic() - old[0] > PREWARM_AGE:
+                        self._prewarmed[suff] = (time.monotonic(), self._executor.submit(self._getRequest, suff))
+
     @lru_cache(maxsize=100)
     def getIgnoreList(self, fid):
         rv = self._getRequest('db/ignores?folder={0}'.format(fid))['ignore']
@@ -113,7 +285,22 @@ class SyncthingAPI:
             return []
         return rv
 
-    def getIgnoreSelective(self, fid):
+    @lru_cache(maxsize=100)
+    def getIgnoreMatcher(self, fid, root=None):
+        'root: local path of the folder to resolve #include'
+        return IgnoreMatcher(self.getIgnoreList(fid), root)
+
+    def globalIgnoredList(self, fid, paths, root=None):
+        'True for each path ignored by patterns above the selective section'
+        l = self.getIgnoreList(fid)
+        end = l.index(self.headerSelectStart) if self.headerSelectStart in l else len(l)
+        return self.getIgnoreMatcher(fid, root).ignoredBefore(paths, end)
+
+    def getIgnoreSelective(self, fid, fresh=False):
+        'fresh: the list is read again, it can be edited outside since it was loaded'
+        if fresh:
+            self.getIgnoreList.cache_clear()
+            self.getIgnoreMatcher.cache_clear()
         l = self.getIgnoreList(fid)
         if l.count(self.headerSelectStart) == 0 or \
                 l.count(self.headerSelectFinish) == 0:
@@ -122,31 +309,51 @@ class SyncthingAPI:
         indend = l.index(self.headerSelectFinish)
         return l[indstart+1:indend]
 
-    def setIgnoreSelective(self, fid, il):
+    def composeIgnoreList(self, fid, il):
+        'the whole ignore list of the folder with il as the selective section'
         l = self.getIgnoreList(fid)
         logger.debug(l)
         indstart = l.index(self.headerSelectStart)
         indend = l.index(self.headerSelectFinish)
 
+        il = list(il)
         if len(il) > 1 and il[-1].strip() == '':
             il[-1] = '\n'
         else:
             il.append('\n')
 
-        sendlist = l[:indstart+1] + il + l[indend:]
+        return l[:indstart+1] + il + l[indend:]
+
+    def setIgnoreSelective(self, fid, il):
+        # the rest of the list is taken as it is now
+        self.getIgnoreList.cache_clear()
+        sendlist = self.composeIgnoreList(fid, il)
         self._postRequest('db/ignores?folder={0}'.format(fid), {'ignore': sendlist})
+        # the next selection is built on the new list
+        self.getIgnoreList.cache_clear()
+        self.getIgnoreMatcher.cache_clear()
 
     def browseFolder(self, fid):
         d = self._getRequest('db/browse?folder={0}'.format(fid))
-        self._ignoreSelectiveList = self.getIgnoreSelective(fid)
         return self._refineBrowseFolderRequest(d)
 
-    def browseFolderPartial(self, fid, path='', lev=0):
+    def _browseSuffix(self, fid, path, lev):
         if path == '':
-            d = self._getRequest('db/browse?folder={0}&levels={1}'.format(fid, lev))
-        else:
-            d = self._getRequest('db/browse?folder={0}&prefix={1}&levels={2}'.format(fid, path, lev))
-        self._ignoreSelectiveList = self.getIgnoreSelective(fid) # TODO caching
+            return 'db/browse?folder={0}&levels={1}'.format(fid, lev)
+        return 'db/browse?folder={0}&prefix={1}&levels={2}'.format(fid, path, lev)
+
+    def browseFolderTree(self, fid):
+        'the whole global tree of the folder without side effects, safe for background threads'
+        return self._refineBrowseFolderRequest(self._getRequest('db/browse?folder={0}'.format(fid)))
+
+    def browseFolderPartial(self, fid, path='', lev=0):
+        suff = self._browseSuffix(fid, path, lev)
+        with self._prewarmLock:
+            started, fut = self._prewarmed.pop(suff, (None, None))  # every prewarmed result is used once
+        if fut is not None and time.monotonic() - started > PREWARM_AGE:
+            fut.cancel()
+            fut = None
+        d = fut.result() if fut is not None else self._getRequest(suff)
         return self._refineBrowseFolderRequest(d)
 
     @lru_cache(maxsize=100)
@@ -154,28 +361,47 @@ class SyncthingAPI:
         'fn: file name with path relative to the parent folder'
         rv = self._getRequest('db/file?folder={0}&file={1}'.format(fid, urllib.parse.quote(fn)))
         if len(rv) > 0 and (iprop.Type[rv['local']['type']] is iprop.Type.DIRECTORY or rv['local']['type'] == 1):
-            if ("!/" + fn) in self._ignoreSelectiveList:
-                rv['local']['ignored'] = False
-                if ("/" + fn + "/**") in self._ignoreSelectiveList:
-                    ispartial = True
-                else:
-                    ispartial = False
-            else: # assume ignored by default as it is not in the list
-                rv['local']['ignored'] = True
+            rv['local']['ignored'], rv['local']['partial'] = \
+                    self._selectiveState(self.getIgnoreSelective(fid), fn)
+        return rv
+
+    def _selectiveState(self, sel, fn):
+        'ignored and partial flags of the directory fn by the selective list sel'
+        if ("!/" + fn) in sel:
+            ignored = False
+            if ("/" + fn + "/**") in sel:
+                ispartial = True
+            else:
                 ispartial = False
+        else: # assume ignored by default as it is not in the list
+            ignored = True
+            ispartial = False
 
-            for ign in self._ignoreSelectiveList:
-                if ign.startswith("!/" + fn + "/"):
-                    ispartial = True
-                    # there is some content inside, so it can not be ignored
-                    rv['local']['ignored'] = False
-                    break
-                elif ("!/" + fn + "/").startswith(ign + "/") and \
-                        (ign[1:] + "/**") not in self._ignoreSelectiveList:
-                    # the parent is on the SelectiveList, so the item must be fully synced
-                    rv['local']['ignored'] = False
-                    ispartial = False
-            rv['local']['partial'] = ispartial
+        for ign in sel:
+            if ign.startswith("!/" + fn + "/"):
+                ispartial = True
+                # there is some content inside, so it can not be ignored
+                ignored = False
+                break
+            elif ("!/" + fn + "/").startswith(ign + "/") and \
+                    (ign[1:] + "/**") not in sel:
+                # the parent is on the SelectiveList, so the item must be fully synced
+                ignored = False
+                ispartial = False
+        return ignored, ispartial
+
+    def localStates(self, fid, paths, isdirs, root=None):
+        '''
+        (ignored, partial) for each path as getFileInfoExtended reports them, but computed
+        from the ignore list without requests, partial is None for files
+        '''
+        sel = self.getIgnoreSelective(fid)
+        fileign = self.getIgnoreMatcher(fid, root).ignoredList(
+                [p for p, isdir in zip(paths, isdirs) if not isdir])
+        rv = []
+        fileit = iter(fileign)
+        for p, isdir in zip(paths, isdirs):
+            rv.append(self._selectiveState(sel, p) if isdir else (next(fileit), None))
         return rv
 
     def getFileInfoRaw(self, fid, fn):
@@ -195,4 +421,15 @@ class SyncthingAPI:
 
     def clearCache(self):
         self.getIgnoreList.cache_clear()
+        self.getIgnoreMatcher.cache_clear()
         self.getFileInfoExtended.cache_clear()
+        with self._prewarmLock:
+            prewarmed = list(self._prewarmed.values())
+            self._prewarmed.clear()
+        for _, fut in prewarmed:
+            fut.cancel()
+
+    def close(self):
+        logger.info("Requests: {}".format(self.requestCounters()))
+        self.clearCache()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -4,12 +4,16 @@ try:
     from PySide import QtCore
     from PySide import QtGui
     from PySide import QtWidgets
+    from PySide.QtCore import Signal
 except:
     from PyQt5.QtCore import pyqtSlot as Slot
+    from PyQt5.QtCore import pyqtSignal as Signal
     from PyQt5 import QtCore
     from PyQt5 import QtGui
     from PyQt5 import QtWidgets
 
+from functools import lru_cache
+
 import ItemProperty as iprop
 
 import logging
@@ -17,6 +21,74 @@ logger = logging.getLogger("PySel.TreeModel")
 
 # https://doc.qt.io/qt-5/qtwidgets-itemviews-simpletreemodel-example.html
 
+# rows materialized at once, the rest of a wide directory waits for fetchMore
+FETCH_PAGE = 1000
+# materialized items kept by default, collapsed subtrees beyond it are evicted to entries
+ITEM_BUDGET = 500000
+# the items without a remote copy, they are gone with the local one
+_LOCAL_ONLY = (iprop.SyncState.newlocal, iprop.SyncState.globalignore)
+
+
+def _epoch(modified):
+    'sort key of the raw modification time'
+    return iprop.epochNs(modified) or 0
+
+
+@lru_cache(maxsize=4096)
+def _formatModified(modified):
+    'display form of the raw modification time, only the visible cells are formatted'
+    ns = iprop.epochNs(modified)
+    if ns is None:
+        return None
+    return QtCore.QLocale().toString(QtCore.QDateTime.fromMSecsSinceEpoch(ns // 1000000),
+                                    QtCore.QLocale.ShortFormat)
+
+
+class _EvictedEntry(iprop.FileEntry):
+    '''
+    snapshot of an evicted row, the children are snapshots too,
+    summary: the parent state (None, Checked, Unchecked) -> (size, files, selected size, selected files)
+    of the subtree, unfilled is True for a placeholder row which had no state
+    '''
+    __slots__ = ('summary', 'unfilled')
+
+    def __init__(self, name, type=iprop.Type.FILE, children=None, syncstate=None):
+        iprop.FileEntry.__init__(self, name, type, children, syncstate)
+        self.summary = None
+        self.unfilled = False
+
+
+def _entryCheckState(v):
+    'check state of the full entry, the same as TreeModel._fillItemByEntry'
+    ignored = v.ignored if v.ignored is not None else True
+    return QtCore.Qt.PartiallyChecked if v.partial else \
+           QtCore.Qt.Checked if not ignored else QtCore.Qt.Unchecked
+
+
+def _entryAggregates(v, check):
+    'aggregates of the full entry queued under the parent with the pending state check'
+    if check is None or v.syncstate is iprop.SyncState.globalignore:
+        check = None
+        st = _entryCheckState(v)
+    else:
+        st = check
+    if not v.isDir():
+        size = v.size or 0
+        return (size, 1, size, 1) if st == QtCore.Qt.Checked else (size, 1, 0, 0)
+    if isinstance(v, _EvictedEntry) and v.summary is not None:
+        return v.summary[check]
+    return (0, 0, 0, 0)
+
+
+def _summary(entries):
+    rv = {}
+    for check in (None, QtCore.Qt.Checked, QtCore.Qt.Unchecked):
+        agg = (0, 0, 0, 0)
+        for v in entries:
+            agg = tuple(a + b for a, b in zip(agg, _entryAggregates(v, check)))
+        rv[check] = agg
+    return rv
+
 
 class TreeItem:
     def __init__(self, data=[], isfolder=False, parent=None):
@@ -30,18 +102,144 @@ class TreeItem:
         self.syncstatesystem = None
         self.isfolder = isfolder
         self.isinvalid = False
+        self.isexpanded = False
+        self.isloading = False  # the state of the rows is on the way
+        # aggregates of the loaded subtree, files only, directories have no own size
+        self._size = 0
+        self._subtreeSize = 0
+        self._subtreeFiles = 0 if isfolder else 1
+        self._selectedSize = 0
+        self._selectedFiles = 0
+        self._subtreeItems = 1  # materialized items including itself
+        self._lastUsed = 0  # tick of the last expand or collapse
+        self._row = 0
+        # sort keys, the size is the aggregate for folders
+        self._sortName = data[0].casefold() if len(data) > 0 and isinstance(data[0], str) else ''
+        self._sortTime = 0
+        # rows which are not materialized yet: entries counted in the counters and aggregates
+        self._pending = []
+        self._pendingFull = True  # False for placeholders without the state
+        self._pendingCheck = None  # state set by the user to all pending rows
+        self._pendingAvail = 0
 
     def appendChild(self, child):
         if isinstance(child, TreeItem):
             logger.debug("appendChild {}".format(child.data(0)))
+            child._row = len(self._childItems)
             self._childItems.append(child)
             if child.getCheckState() == QtCore.Qt.Checked:
                 self._checkedItemsCount += 1
             if child.getCheckState() == QtCore.Qt.PartiallyChecked:
                 self._checkedPartiallyCount += 1
+            self._addAggregates(child._subtreeSize, child._subtreeFiles,
+                    child._selectedSize, child._selectedFiles, child._subtreeItems)
         else:
             raise TypeError('Child\'s type is {0}, but must be TreeItem'.format(str(type(child))))
 
+    def removeChild(self, row):
+        child = self._childItems.pop(row)
+        for i in range(row, len(self._childItems)):
+            self._childItems[i]._row = i
+        if child.getCheckState() == QtCore.Qt.Checked:
+            self._checkedItemsCount -= 1
+        if child.getCheckState() == QtCore.Qt.PartiallyChecked:
+            self._checkedPartiallyCount -= 1
+        self._addAggregates(-child._subtreeSize, -child._subtreeFiles,
+                -child._selectedSize, -child._selectedFiles, -child._subtreeItems)
+        child._parentItem = None
+        return child
+
+    def _addAggregates(self, dsize, dfiles, dselsize, dselfiles, ditems=0):
+        'apply the delta to the item and all its parents, O(depth)'
+        item = self
+        while item is not None:
+            item._subtreeSize += dsize
+            item._subtreeFiles += dfiles
+            item._selectedSize += dselsize
+            item._selectedFiles += dselfiles
+            item._subtreeItems += ditems
+            item = item._parentItem
+
+    def setSize(self, size):
+        if self.isfolder or size == self._size:
+            return
+        d = size - self._size
+        self._size = size
+        if self._checkstate == QtCore.Qt.Checked:
+            self._addAggregates(d, 0, d, 0)
+        else:
+            self._addAggregates(d, 0, 0, 0)
+
+    def queueChildren(self, entries, full=True):
+        '''
+        keeps entries as rows to be materialized by TreeModel.fetchMore, full is False
+        for placeholders known by name only, entries added to a non-empty queue keep its kind
+        '''
+        if len(self._pending) == 0:
+            self._pendingFull = full
+        self._addPending(entries, 1)
+        self._pending.extend(entries)
+
+    def takePending(self, n=None):
+        'removes the first n pending entries (all by default) and returns them'
+        rv = self._pending[:n] if n is not None else self._pending[:]
+        del self._pending[:len(rv)]
+        self._addPending(rv, -1)
+        if len(self._pending) == 0:
+            self._pendingCheck = None
+        return rv
+
+    def pendingCount(self):
+        return len(self._pending)
+
+    def setPendingCheckState(self, st):
+        'the pending rows are not loaded to be checked one by one'
+        if len(self._pending) == 0:
+            return
+        self._addPending(self._pending, -1)
+        self._pendingCheck = st
+        self._addPending(self._pending, 1)
+
+    def pendingCheckState(self, v):
+        'check state of the pending entry when it is materialized'
+        if v.syncstate is iprop.SyncState.globalignore or self._pendingCheck is None:
+            if not self._pendingFull:
+                return QtCore.Qt.Unchecked
+            return _entryCheckState(v)
+        return self._pendingCheck
+
+    def _addPending(self, entries, sign):
+        checked = partial = avail = size = files = selsize = selfiles = 0
+        for v in entries:
+            st = self.pendingCheckState(v)
+            if st == QtCore.Qt.Checked:
+                checked += 1
+            elif st == QtCore.Qt.PartiallyChecked:
+                partial += 1
+            if v.syncstate is not iprop.SyncState.globalignore:
+                avail += 1
+            if self._pendingFull:
+                # evicted directories bring the aggregates of their subtree
+                dsize, dfiles, dselsize, dselfiles = _entryAggregates(v, self._pendingCheck)
+                size += dsize
+                files += dfiles
+                selsize += dselsize
+                selfiles += dselfiles
+            elif not v.isDir():
+                files += 1
+                if st == QtCore.Qt.Checked:
+                    selfiles += 1
+        self._checkedItemsCount += sign * checked
+        self._checkedPartiallyCount += sign * partial
+        self._pendingAvail += sign * avail
+        self._addAggregates(sign * size, sign * files, sign * selsize, sign * selfiles)
+
+    def subtreeSize(self):
+        return self._subtreeSize
+
+    def subtreeFiles(self):
+        return self._subtreeFiles
+
     def child(self, row):
         if row < -len(self._childItems) or row >= len(self._childItems):
             return None
@@ -55,7 +253,7 @@ class TreeItem:
         for ch in self._childItems:
             if ch.syncstatesystem is iprop.SyncState.globalignore:
                 loccnt += 1
-        return len(self._childItems) - loccnt
+        return len(self._childItems) - loccnt + self._pendingAvail
 
     def childrenAvailableIter(self):
         for ch in self._childItems:
@@ -65,9 +263,11 @@ class TreeItem:
                 yield ch
 
     def childNames(self):
+        'names of the materialized and pending children'
         rv = []
         for ch in self._childItems:
             rv.append(ch._itemData[0])
+        rv.extend(v.name for v in self._pending)
         return rv
 
     def columnCount(self):
@@ -85,9 +285,9 @@ class TreeItem:
         return True
 
     def setCheckState(self, st):
+        # removeChild detaches the item, so the parent is enough to know it is in the tree
         if st != self._checkstate and \
-                self._parentItem is not None and \
-                self in self._parentItem._childItems:
+                self._parentItem is not None:
             if st == QtCore.Qt.Checked:
                 logger.info("Entry \'{0}\' is checked".format(self._itemData[0]))
                 self.setSyncState(iprop.SyncState.syncing, iprop.SyncType.user)
@@ -106,6 +306,11 @@ class TreeItem:
                     self._parentItem._checkedItemsCount -= 1
                 else:
                     self._parentItem._checkedPartiallyCount -= 1
+            if not self.isfolder:
+                if st == QtCore.Qt.Checked:
+                    self._addAggregates(0, 0, self._size, 1)
+                elif self._checkstate == QtCore.Qt.Checked:
+                    self._addAggregates(0, 0, -self._size, -1)
             self._checkstate = st
         elif st == self._checkstate:
             logger.info("Entry \'{0}\' updates syncstate".format(self._itemData[0]))
@@ -114,8 +319,8 @@ class TreeItem:
             elif st == QtCore.Qt.Unchecked:
                 self.setSyncState(iprop.SyncState.ignored, iprop.SyncType.user)
         else:
-            logger.info("CheckState omitted for the entry \'{}\', reason: {} {} {}".format(
-                self._itemData[0], st != self._checkstate, self._parentItem is not None, self in self._parentItem._childItems))
+            logger.info("CheckState omitted for the entry \'{}\', reason: {} {}".format(
+                self._itemData[0], st != self._checkstate, self._parentItem is not None))
 
     def getCheckState(self):
         return self._checkstate
@@ -164,9 +369,7 @@ class TreeItem:
         return False
     
     def row(self):
-        if self._parentItem is not None:
-            return self._parentItem._childItems.index(self)
-        return 0
+        return self._row
     
     def parentItem(self):
         return self._parentItem
@@ -175,8 +378,7 @@ class TreeItem:
         item = {}
         item['name'] = self._itemData[0]
         item['size'] = self._itemData[1]
-        item['modified'] = self._itemData[2].toString(QtCore.Qt.ISODate) if self._itemData[2] \
-                            else None
+        item['modified'] = self._itemData[2]
         item['type'] = iprop.Type.DIRECTORY.name if self.isfolder \
                             else iprop.Type.FILE.name
         item['syncstate'] = self.syncstatesystem.name if self.syncstatesystem else None
@@ -184,17 +386,45 @@ class TreeItem:
         if self.parentItem() is not None:
             item['psyncstate'] = self.parentItem().syncstatesystem.name if self.parentItem().syncstatesystem else None
         item['children'] = len(self._childItems)
+        item['subtreesize'] = self._subtreeSize
+        item['subtreefiles'] = self._subtreeFiles
         return item
 
 
 class TreeModel(QtCore.QAbstractItemModel):
-    def __init__(self, data = [], parent = None):
+    # emits (bytes, files) selected for sync over the loaded tree
+    selectedSizeChanged = Signal(object, object)
+    # render tables, see _initRenderTables
+    _foreground = None
+    _uncheckedUnknown = None
+    _loadingForeground = None
+    _invalidBackground = None
+    _icons = None
+
+    def __init__(self, data = [], parent = None, loading=False):
+        '''
+        loading: the rows of data are shown by names only until setLoading(root, False),
+        their state comes by updateSubSection
+        '''
         QtCore.QAbstractItemModel.__init__(self, parent)
         self._tv = parent
         self._rootItem = TreeItem(['Title', 'Size', 'Modified'])
-        self._changedList = []
-        self._appStyle = QtWidgets.QApplication.style()
-        self._setupModelData(data, self._rootItem)
+        self._changedList = {}  # ordered set of changed paths
+        self._sortColumn = -1
+        self._sortOrder = QtCore.Qt.AscendingOrder
+        self._itemBudget = ITEM_BUDGET
+        self._tick = 0
+        self._initRenderTables()
+        self._roleHandlers = {
+            QtCore.Qt.DisplayRole: self._displayData,
+            QtCore.Qt.CheckStateRole: self._checkStateData,
+            QtCore.Qt.DecorationRole: self._decorationData,
+            QtCore.Qt.ForegroundRole: self._foregroundData,
+            QtCore.Qt.BackgroundRole: self._backgroundData,
+            QtCore.Qt.ToolTipRole: self._toolTipData,
+        }
+        self._rootItem.isloading = loading
+        self._setupModelData(data, self._rootItem, _isrecursive=loading)
 
     def getItem(self, index):
         if index.isValid():
@@ -204,53 +434,74 @@ class TreeModel(QtCore.QAbstractItemModel):
 
         return self._rootItem
 
+    def _initRenderTables(self):
+        'brushes and icons are shared by all cells, data() only looks them up'
+        if TreeModel._foreground is not None:
+            return
+        TreeModel._foreground = {
+            iprop.SyncState.newlocal: QtGui.QBrush(QtCore.Qt.darkGreen),
+            iprop.SyncState.ignored: QtGui.QBrush(QtCore.Qt.darkGray),
+            iprop.SyncState.conflict: QtGui.QBrush(QtCore.Qt.red),
+            iprop.SyncState.exists: QtGui.QBrush(QtCore.Qt.blue),
+            iprop.SyncState.globalignore: QtGui.QBrush(QtGui.QColor(170, 170, 0)),
+        }
+        TreeModel._uncheckedUnknown = QtGui.QBrush(QtCore.Qt.gray)
+        TreeModel._loadingForeground = QtGui.QBrush(QtCore.Qt.lightGray)
+        TreeModel._invalidBackground = QtGui.QBrush(QtCore.Qt.darkRed)
+        style = QtWidgets.QApplication.style()
+        TreeModel._icons = {  # (isfolder, isexpanded)
+            (True, True): style.standardIcon(QtWidgets.QStyle.SP_DirOpenIcon),
+            (True, False): style.standardIcon(QtWidgets.QStyle.SP_DirIcon),
+            (False, True): style.standardIcon(QtWidgets.QStyle.SP_FileIcon),
+            (False, False): style.standardIcon(QtWidgets.QStyle.SP_FileIcon),
+        }
+
     def data(self, index, role):
         if not isinstance(index, QtCore.QModelIndex):
             raise TypeError('Index\'s type is {0}, but must be QModelIndex'.format(str(type(index))))
         if not index.isValid():
             return None
+        handler = self._roleHandlers.get(role)
+        if handler is None:
+            return None
+        return handler(index.internalPointer(), index.column())
 
-        item = index.internalPointer()
-        
-        if role == QtCore.Qt.CheckStateRole and index.column() == 0:
-            return item.getCheckState()
-        
-        if role == QtCore.Qt.DecorationRole and index.column() == 0:
-            if item.isfolder:
-                if self._tv.isExpanded(index):
-                    return self._appStyle.standardIcon(QtWidgets.QStyle.SP_DirOpenIcon)
-                else:
-                    return self._appStyle.standardIcon(QtWidgets.QStyle.SP_DirIcon)
-            else:
-                return self._appStyle.standardIcon(QtWidgets.QStyle.SP_FileIcon)
+    def _displayData(self, item, column):
+        if column == 1 and item.isfolder:
+            return item._subtreeSize if item._subtreeSize > 0 else None
+        if column == 2:
+            return _formatModified(item._itemData[2]) if item._itemData[2] is not None else None
+        return item.data(column)
 
-        # set colors in depends of sync state
-        if role == QtCore.Qt.ForegroundRole:
-            if item.syncstatesystem is None:
-                if item.getCheckState() == QtCore.Qt.Unchecked:
-                    return QtGui.QBrush(QtCore.Qt.gray)
-            else:
-                if item.syncstatesystem is iprop.SyncState.newlocal:
-                    return QtGui.QBrush(QtCore.Qt.darkGreen)
-                elif item.syncstatesystem is iprop.SyncState.ignored:
-                    return QtGui.QBrush(QtCore.Qt.darkGray)
-                elif item.syncstatesystem is iprop.SyncState.conflict:
-                    return QtGui.QBrush(QtCore.Qt.red)
-                elif item.syncstatesystem is iprop.SyncState.exists:
-                    return QtGui.QBrush(QtCore.Qt.blue)
-                elif item.syncstatesystem is iprop.SyncState.globalignore:
-                    return QtGui.QBrush(QtGui.QColor(170, 170, 0))
-                else:
-                    pass
+    def _checkStateData(self, item, column):
+        return item._checkstate if column == 0 else None
 
-        if role == QtCore.Qt.BackgroundRole:
-            if item.isinvalid:
-                return QtGui.QBrush(QtCore.Qt.darkRed)
+    def _decorationData(self, item, column):
+        return self._icons[(item.isfolder, item.isexpanded)] if column == 0 else None
 
-        if role != QtCore.Qt.DisplayRole:
-            return None
+    def _foregroundData(self, item, column):
+        # set colors in depends of sync state
+        if item._parentItem.isloading:
+            return self._loadingForeground
+        if item.syncstatesystem is None:
+            return self._uncheckedUnknown if item._checkstate == QtCore.Qt.Unchecked else None
+        return self._foreground.get(item.syncstatesystem)
+
+    def _backgroundData(self, item, column):
+        return self._invalidBackground if item.isinvalid else None
+
+    def _toolTipData(self, item, column):
+        if column == 0 and item._parentItem.isloading:
+            return "Loading the state..."
+        if column == 1 and item.isfolder:
+            return "{} files in the loaded part".format(item._subtreeFiles)
+        return None
 
-        return item.data(index.column())
+    def selectedSize(self):
+        return self._rootItem._selectedSize, self._rootItem._selectedFiles
+
+    def _emitSelectedSize(self):
+        self.selectedSizeChanged.emit(self._rootItem._selectedSize, self._rootItem._selectedFiles)
 
     def setData(self, index, value, role=QtCore.Qt.EditRole):
         logger.debug("setData value {}, column {} row {}".format(value, index.column(), index.row()))
@@ -260,6 +511,7 @@ class TreeModel(QtCore.QAbstractItemModel):
                 self.setDataStairsDown(index, value)
                 # update parents
                 self.setDataStairsUp(index, value)
+                self._emitSelectedSize()
                 return True
             else:
                 return False
@@ -273,7 +525,7 @@ class TreeModel(QtCore.QAbstractItemModel):
         self._addToChangedList(item)
         if iparent is None:
             self.dataChanged.emit(index, index)
-        elif (self._tv.isExpanded(iparent)):
+        elif self.getItem(iparent).isexpanded:
             self.dataChanged.emit(index, index)
         if value == QtCore.Qt.PartiallyChecked:
             # do not change children in the PartiallyChecked case
@@ -282,6 +534,7 @@ class TreeModel(QtCore.QAbstractItemModel):
             # update children
             for ich in item.childrenAvailableIter():
                 self.setDataStairsDown(self.indexItem(ich, index), value)
+            item.setPendingCheckState(value)
 
     def setDataStairsUp(self, index, value):
         logger.debug("setDataStairsUp")
@@ -294,10 +547,286 @@ class TreeModel(QtCore.QAbstractItemModel):
             self.dataChanged.emit(index, index)
             index = self.parent(index)
 
+    def setCheckStateByRegex(self, rx, value):
+        '''
+        sets value to all loaded items whose path matches the compiled rx and to their content,
+        all changes go in one layout change instead of dataChanged per item,
+        returns the number of matched items. The pending rows of a directory are materialized
+        if one of them or of their known content matches.
+        '''
+        matched = []
+        stack = [(self._rootItem, '')]
+        while stack:
+            item, pref = stack.pop()
+            if item.pendingCount() > 0 and self._pendingMatch(item._pending, pref, rx):
+                index = self.createIndex(item.row(), 0, item) if item is not self._rootItem else QtCore.QModelIndex()
+                self._fetchRows(index, item.pendingCount())
+            for ch in item.childrenAvailableIter():
+                p = pref + ch.data(0)
+                if rx.fullmatch(p):
+                    matched.append(ch)  # the content follows the match
+                elif ch.isfolder:
+                    stack.append((ch, p + '/'))
+        if len(matched) == 0:
+            return 0
+
+        self.layoutAboutToBeChanged.emit()
+        ancestors = {}  # id -> item
+        for item in matched:
+            down = [item]
+            while down:
+                it = down.pop()
+                it.setCheckState(value)
+                self._addToChangedList(it)
+                if it.isfolder:
+                    down.extend(it.childrenAvailableIter())
+                    it.setPendingCheckState(value)
+            parent = item.parentItem()
+            while parent is not self._rootItem and id(parent) not in ancestors:
+                ancestors[id(parent)] = parent
+                parent = parent.parentItem()
+        # the deepest first, as in setDataStairsUp
+        for item in sorted(ancestors.values(), key=self._depth, reverse=True):
+            item.updateCheckState()
+            self._addToChangedList(item)
+        self.layoutChanged.emit()
+        self._emitSelectedSize()
+        logger.info("{} items matched".format(len(matched)))
+        return len(matched)
+
+    def _pendingMatch(self, entries, pref, rx):
+        'one of the entries or of their children matches rx'
+        stack = [(entries, pref)]
+        while stack:
+            entries, pref = stack.pop()
+            for v in entries:
+                p = pref + v.name
+                if rx.fullmatch(p):
+                    return True
+                if v.children:
+                    stack.append((v.children, p + '/'))
+        return False
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        'sorts the loaded children and the pending entries in place by the precomputed keys, column -1 keeps the order'
+        logger.debug("sort by column {} order {}".format(column, order))
+        self._sortColumn = column
+        self._sortOrder = order
+        if column < 0:
+            return
+        pairs = []
+        stack = [(self._rootItem, QtCore.QModelIndex())]
+        while stack:
+            item, index = stack.pop()
+            if item.childCount() > 0 or item.pendingCount() > 0:
+                pairs.append((item, index))
+                stack.extend((ch, self.createIndex(ch.row(), 0, ch)) for ch in item._childItems
+                             if ch.childCount() > 0 or ch.pendingCount() > 0)
+        self._sortChildren(pairs)
+
+    def _itemSortKey(self):
+        if self._sortColumn == 0:
+            return lambda it: it._sortName
+        if self._sortColumn == 1:
+            return lambda it: it._subtreeSize if it.isfolder else it._size
+        return lambda it: it._sortTime
+
+    def _entrySortKey(self, full):
+        'the same keys for pending entries, placeholders have no size and time'
+        if self._sortColumn == 0:
+            return lambda v: v.name.casefold()
+        if self._sortColumn == 1:
+            return lambda v: 0 if not full else (v.size or 0) if not v.isDir() else \
+                             v.summary[None][0] if isinstance(v, _EvictedEntry) and v.summary else 0
+        return lambda v: _epoch(v.modified) if full else 0
+
+    def _sortChildren(self, pairs):
+        '''
+        pairs: (item, index) whose children are sorted in one layout change, the loaded rows
+        are the head of the order of all rows and the pending entries follow them
+        '''
+        if self._sortColumn < 0 or len(pairs) == 0:
+            return
+        reverse = self._sortOrder == QtCore.Qt.DescendingOrder
+        itemkey = self._itemSortKey()
+        for item, index in pairs:
+            if item.pendingCount() > 0:
+                self._sortPending(item, index, itemkey, reverse)
+        pairs = [(item, index) for item, index in pairs if item.childCount() > 1]
+        if len(pairs) == 0:
+            return
+
+        self.layoutAboutToBeChanged.emit()
+        for item, index in pairs:
+            item._childItems.sort(key=itemkey, reverse=reverse)
+            for i, ch in enumerate(item._childItems):
+                ch._row = i
+        oldlist = self.persistentIndexList()
+        newlist = []
+        for i in oldlist:
+            item = self.getItem(i)
+            newlist.append(self.createIndex(item.row(), i.column(), item) if i.isValid() else i)
+        self.changePersistentIndexList(oldlist, newlist)
+        self.layoutChanged.emit()
+
+    def _sortPending(self, item, index, itemkey, reverse):
+        '''
+        sorts the loaded rows and the pending entries together, the loaded rows which fall
+        behind the head are queued again as snapshots and the pending entries in the head
+        are loaded, the head keeps the number of loaded rows
+        '''
+        entrykey = self._entrySortKey(item._pendingFull)
+        if item._pendingCheck is not None:
+            # the pending state set by the user cannot hold other rows, the entries
+            # before the last loaded row are loaded
+            item._pending.sort(key=entrykey, reverse=reverse)
+            if item.childCount() > 0:
+                keys = list(map(itemkey, item._childItems))
+                last = max(keys) if not reverse else min(keys)
+                n = sum(1 for v in item._pending if ((entrykey(v) < last) if not reverse else (entrykey(v) > last)))
+                if n > 0:
+                    self._fetchRows(index, n)
+            return
+        n = item.childCount()
+        def split():
+            rows = [(itemkey(ch), 0, ch) for ch in item._childItems]
+            entries = [(entrykey(v), 1, v) for v in item._pending]
+            merged = sorted(rows + entries, key=lambda t: t[0], reverse=reverse)
+            return [ch for _, kind, ch in merged[n:] if kind == 0], [v for _, kind, v in merged[:n] if kind == 1]
+        demoted, promoted = split()
+        if len(demoted) > 0 and not item._pendingFull:
+            # the snapshots join placeholders queued as the rows they become, see _snapshot
+            item.queueChildren(self._snapshotPending(item.takePending()), True)
+            entrykey = self._entrySortKey(True)
+            demoted, promoted = split()
+        if len(demoted) > 0:
+            snapshots = [self._snapshotRow(ch) for ch in demoted]
+            for row in sorted((ch.row() for ch in demoted), reverse=True):
+                self.beginRemoveRows(index, row, row)
+                item.removeChild(row)
+                self.endRemoveRows()
+            item.queueChildren(snapshots, True)
+        item._pending.sort(key=entrykey, reverse=reverse)
+        if len(promoted) > 0:
+            ids = set(map(id, promoted))
+            item._pending = promoted + [v for v in item._pending if id(v) not in ids]
+            self._fetchRows(index, len(promoted))
+
+    def _depth(self, item):
+        depth = 0
+        while item is not self._rootItem:
+            item = item.parentItem()
+            depth += 1
+        return depth
+
+    def setExpanded(self, index, expanded):
+        'the view state is tracked here as the model can be shown through a proxy'
+        item = self.getItem(index)
+        item.isexpanded = expanded
+        self._tick += 1
+        item._lastUsed = self._tick
+        if not expanded:
+            self._enforceBudget()
+
+    def setItemBudget(self, n):
+        'number of materialized items kept, collapsed subtrees are evicted over it'
+        self._itemBudget = n
+        self._enforceBudget()
+
+    def itemCount(self):
+        return self._rootItem._subtreeItems - 1
+
+    def _enforceBudget(self):
+        '''
+        evicts the least recently used collapsed subtrees without changes of the user
+        till a quarter of the budget is free, they are loaded again by fetchMore
+        '''
+        if self.itemCount() <= self._itemBudget:
+            return
+        # a changed path keeps its ancestors loaded as the changes are taken from the rows
+        changed = set()
+        for path in self._changedList:
+            names = path[1:].split('/')
+            for i in range(1, len(names) + 1):
+                changed.add('/'.join(names[:i]))
+        candidates = []
+        stack = [(self._rootItem, '')]
+        while stack:
+            item, pref = stack.pop()
+            for ch in item._childItems:
+                if not ch.isfolder or ch.childCount() == 0:
+                    continue
+                p = pref + ch._itemData[0]
+                if ch.isexpanded:
+                    stack.append((ch, p + '/'))
+                elif p not in changed and ch._pendingCheck is None:
+                    candidates.append(ch)
+        candidates.sort(key=lambda it: it._lastUsed)
+        target = self._itemBudget * 3 // 4
+        n = 0
+        for item in candidates:
+            if self.itemCount() <= target:
+                break
+            self._evict(item)
+            n += 1
+        logger.info("{} subtrees evicted, {} items are loaded".format(n, self.itemCount()))
+
+    def _evict(self, item):
+        'replaces the rows of the collapsed item by their snapshots, the aggregates stay the same'
+        entries = self._snapshot(item)
+        index = self.createIndex(item.row(), 0, item)
+        self.beginRemoveRows(index, 0, item.childCount() - 1)
+        for row in reversed(range(item.childCount())):
+            item.removeChild(row)
+        item.takePending()
+        self.endRemoveRows()
+        item.queueChildren(entries, True)
+
+    def _snapshot(self, item):
+        'full entries of the rows and the pending entries of the item'
+        rv = [self._snapshotRow(ch) for ch in item._childItems]
+        rv.extend(item._pending if item._pendingFull else self._snapshotPending(item._pending))
+        return rv
+
+    def _snapshotRow(self, ch):
+        v = _EvictedEntry(ch._itemData[0],
+                iprop.Type.DIRECTORY if ch.isfolder else iprop.Type.FILE,
+                None, ch.syncstatesystem)
+        v.size = ch._itemData[1]
+        v.modified = ch._itemData[2]
+        v.ignored = ch._checkstate == QtCore.Qt.Unchecked
+        v.partial = ch._checkstate == QtCore.Qt.PartiallyChecked
+        v.invalid = ch.isinvalid
+        v.unfilled = ch.syncstatesystem is None
+        if ch.isfolder:
+            v.children = self._snapshot(ch)
+            v.summary = _summary(v.children)
+        return v
+
+    def _snapshotPending(self, entries):
+        'placeholders as full entries, the same as materialized placeholders'
+        rv = []
+        for v in entries:
+            v = _EvictedEntry(v.name, v.type, [], iprop.SyncState.unknown)
+            v.ignored = True
+            v.partial = False
+            v.unfilled = True
+            rv.append(v)
+        return rv
+
+    def setLoading(self, index, loading):
+        'marks the rows under index as waiting for their state, all of them are updated at once'
+        item = self.getItem(index)
+        item.isloading = loading
+        if item.childCount() > 0:
+            self.dataChanged.emit(self.index(0, 0, index),
+                    self.index(item.childCount() - 1, self.columnCount(index) - 1, index))
+
+    def isLoading(self, index):
+        return self.getItem(index).isloading
+
     def _addToChangedList(self, item):
-        fn = "/" + self.fullItemName(item)
-        if fn not in self._changedList:
-            self._changedList.append(fn)
+        self._changedList["/" + self.fullItemName(item)] = None
 
     def flags(self, index):
         if not isinstance(index, QtCore.QModelIndex):
@@ -310,7 +839,9 @@ class TreeModel(QtCore.QAbstractItemModel):
         rv = super().flags(index)
         item = index.internalPointer()
         # everything can be checked except items ignored globally as we do not in charge of them
-        if index.column() == 0 and item.syncstatesystem is not iprop.SyncState.globalignore:
+        # and the loading ones as their state is not known yet
+        if index.column() == 0 and item.syncstatesystem is not iprop.SyncState.globalignore and \
+                not item._parentItem.isloading:
             rv |= QtCore.Qt.ItemIsUserCheckable
 
         return rv
@@ -376,6 +907,78 @@ class TreeModel(QtCore.QAbstractItemModel):
             return self.getItem(parent).columnCount()
         return self._rootItem.columnCount()
 
+    def childIndex(self, parent, name, fetch=True):
+        'the pending rows are materialized up to the name if needed, invalid for a pending one without fetch'
+        item = self.getItem(parent)
+        for row, ch in enumerate(item._childItems):
+            if ch._itemData[0] == name:
+                return self.index(row, 0, parent)
+        if not fetch:
+            return QtCore.QModelIndex()
+        pos = next((i for i, v in enumerate(item._pending) if v.name == name), None)
+        if pos is None:
+            return QtCore.QModelIndex()
+        first = item.childCount()
+        while item.childCount() <= first + pos and self.canFetchMore(parent):
+            self.fetchMore(parent)
+        return self.childIndex(parent, name)
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        'evicted rows are pending only'
+        item = self.getItem(parent)
+        return item.childCount() > 0 or item.pendingCount() > 0
+
+    def canFetchMore(self, parent):
+        return self.getItem(parent).pendingCount() > 0
+
+    def fetchMore(self, parent):
+        self._fetchRows(parent, FETCH_PAGE)
+
+    def _fetchRows(self, parent, n):
+        item = self.getItem(parent)
+        check, full = item._pendingCheck, item._pendingFull
+        entries = item.takePending(n)
+        if len(entries) == 0:
+            return
+        logger.debug("fetchMore {} rows, {} are pending".format(len(entries), item.pendingCount()))
+        first = item.childCount()
+        self.beginInsertRows(parent, first, first + len(entries) - 1)
+        self._setupModelData(entries, item, _isrecursive=not full, _paged=False)
+        if check is not None:
+            for ch in item._childItems[first:]:
+                if ch.syncstatesystem is not iprop.SyncState.globalignore:
+                    ch.setCheckState(check)
+                    self._addToChangedList(ch)
+                    if ch.isfolder:
+                        ch.setPendingCheckState(check)
+        self.endInsertRows()
+        self._emitSelectedSize()
+
+    def indexByPath(self, path, fetch=True):
+        'index of the loaded item, invalid if it is not loaded or the path is empty, see childIndex for fetch'
+        index = QtCore.QModelIndex()
+        for name in path.split('/') if path != '' else []:
+            index = self.childIndex(index, name, fetch)
+            if not index.isValid():
+                break
+        return index
+
+    def loadedPaths(self, path=''):
+        'paths of all loaded items under the path relative to the folder root, nothing is fetched'
+        rv = []
+        index = self.indexByPath(path, fetch=False)
+        if path != '' and not index.isValid():
+            return rv
+        stack = [(self.getItem(index), path + '/' if path != '' else '')]
+        while stack:
+            item, pref = stack.pop()
+            for ch in item._childItems:
+                p = pref + ch.data(0)
+                rv.append(p)
+                stack.append((ch, p + '/'))
+            rv.extend(pref + v.name for v in item._pending)
+        return rv
+
     def fullItemName(self, item):
         if not isinstance(item, TreeItem):
             raise TypeError('Index\'s type is {0}, but must be TreeItem'.format(str(type(item))))
@@ -394,41 +997,91 @@ class TreeModel(QtCore.QAbstractItemModel):
         if not isinstance(index, QtCore.QModelIndex):
             raise TypeError('Index\'s type is {0}, but must be QModelIndex'.format(str(type(index))))
         rv = []
-        for ch in self.getItem(index)._childItems:
-            rv.append({\
-                    'name': ch._itemData[0], \
-                    'type': iprop.Type.DIRECTORY.name if ch.isfolder else iprop.Type.FILE.name, \
-                    'syncstate': iprop.SyncState.unknown if ch.syncstatesystem is None else ch.syncstatesystem, \
-                    'children': list(map(lambda x: {'name': x} , ch.childNames()))})
+        item = self.getItem(index)
+        for ch in item._childItems:
+            v = iprop.FileEntry(ch._itemData[0],
+                    iprop.Type.DIRECTORY if ch.isfolder else iprop.Type.FILE,
+                    [iprop.FileEntry(c._itemData[0], iprop.Type.DIRECTORY if c.isfolder else iprop.Type.FILE)
+                        for c in ch._childItems] +
+                    [iprop.FileEntry(c.name, c.type) for c in ch._pending],
+                    iprop.SyncState.unknown if ch.syncstatesystem is None else ch.syncstatesystem)
+            v.size = ch._itemData[1] or 0
+            v.modified = ch._itemData[2]
+            v.ignored = ch.syncstatesystem is not iprop.SyncState.syncing and \
+                        ch.syncstatesystem is not iprop.SyncState.partial
+            v.partial = ch.syncstatesystem is iprop.SyncState.partial
+            v.invalid = ch.isinvalid
+            rv.append(v)
+        for v in item._pending:
+            if not item._pendingFull:
+                # the same as a materialized placeholder
+                v = iprop.FileEntry(v.name, v.type, [], iprop.SyncState.unknown)
+                v.size = 0
+                v.ignored = True
+                v.partial = False
+            else:
+                # a copy as the caller extends the entries while the pending ones are counted
+                v = self._pendingCopy(v)
+            rv.append(v)
+        return rv
+
+    def _pendingCopy(self, v):
+        rv = iprop.FileEntry(v.name, v.type,
+                [iprop.FileEntry(c.name, c.type) for c in v.children] if v.children is not None else None,
+                v.syncstate if v.syncstate is not None else iprop.SyncState.unknown)
+        rv.size = v.size or 0
+        rv.modified = v.modified
+        rv.ignored = v.ignored
+        rv.partial = v.partial
+        rv.invalid = v.invalid
         return rv
 
-    def _fillItemByDict(self, ch, v):
-        logger.debug("_fillItemByDict: fill Item\n{}\nby Dict\n{}".format(ch.toDict(),v))
+    def _fillItemByEntry(self, ch, v):
+        logger.debug("_fillItemByEntry: fill Item\n{}\nby Entry\n{}".format(ch.toDict(),v))
         ch._itemData = [
-                v['name'], 
-                v['size'] if ('size' in v and v['size'] != 0) else None, 
-                v['modified'] if 'modified' in v else None,
+                v.name,
+                v.size if v.size else None,
+                v.modified,
             ]
-        ignored = v['ignored'] if 'ignored' in v else True
-        partial = v['partial'] if 'partial' in v else False
+        ch.setSize(v.size or 0)
+        ch._sortTime = _epoch(v.modified)
+        ignored = v.ignored if v.ignored is not None else True
+        partial = v.partial if v.partial is not None else False
         if not ch.isChanged():
             ch.setCheckState(
                     QtCore.Qt.PartiallyChecked if partial else
                     QtCore.Qt.Checked if not ignored else
                     QtCore.Qt.Unchecked)
-        if 'syncstate' in v:
-            ch.setSyncState(v['syncstate'], iprop.SyncType.system)
+        if v.syncstate is not None:
+            ch.setSyncState(v.syncstate, iprop.SyncType.system)
         elif partial:
             ch.setSyncState(iprop.SyncState.partial, iprop.SyncType.system)
         elif not ignored:
             ch.setSyncState(iprop.SyncState.syncing, iprop.SyncType.system)
         else:
             ch.setSyncState(iprop.SyncState.ignored, iprop.SyncType.system)
-        if 'invalid' in v and not ignored:
-            ch.setInvalid(v['invalid'])
+        if v.invalid is not None and not ignored:
+            ch.setInvalid(v.invalid)
         return ch
 
-    def _setupModelData(self, data, parent=None, _isrecursive=False):
+    def _splitPage(self, parent, data):
+        'entries to materialize now and to queue, a non-empty queue keeps the order of rows'
+        room = FETCH_PAGE if parent.pendingCount() == 0 else 0
+        return data[:room], data[room:]
+
+    def _insertEntries(self, index, data, isrecursive=False):
+        'appends rows for data under index, the rest after the first page waits for fetchMore'
+        item = self.getItem(index)
+        now, later = self._splitPage(item, data)
+        if len(now) > 0:
+            first = item.childCount()
+            self.beginInsertRows(index, first, first + len(now) - 1)
+            self._setupModelData(now, item, _isrecursive=isrecursive, _paged=False)
+            self.endInsertRows()
+        if len(later) > 0:
+            item.queueChildren(later, not isrecursive)
+
+    def _setupModelData(self, data, parent=None, _isrecursive=False, _paged=True):
         logger.debug("_setupModelData _isrecursive {}".format(_isrecursive))
         if parent is None:
             parent = self._rootItem
@@ -438,20 +1091,32 @@ class TreeModel(QtCore.QAbstractItemModel):
         if not isinstance(data, list):
             msg = 'data\'s type is {0}, but must be list'.format(str(type(data)))
             raise TypeError(msg)
-        
-        for v in data:
-            if parent is self._rootItem and v['name'] == '.stignoreglobal':  # additional ignore list may be needed
-                continue
 
-            ch = TreeItem([v['name'], None, None], iprop.Type[v['type']] is iprop.Type.DIRECTORY, parent)
+        if parent is self._rootItem:  # additional ignore list may be needed
+            data = [v for v in data if v.name != '.stignoreglobal']
+        if _paged:
+            data, later = self._splitPage(parent, data)
+            if len(later) > 0:
+                parent.queueChildren(later, not _isrecursive)
+
+        for v in data:
+            ch = TreeItem([v.name, None, None], v.isDir(), parent)
             parent.appendChild(ch)
             if _isrecursive:
                 continue
 
-            self._fillItemByDict(ch, v)
+            if isinstance(v, _EvictedEntry):
+                # the evicted subtree is loaded level by level again
+                if not v.unfilled:
+                    self._fillItemByEntry(ch, v)
+                if v.isDir() and v.children:
+                    ch.queueChildren(v.children, True)
+                continue
 
-            if iprop.Type[v['type']] is iprop.Type.DIRECTORY:
-                self._setupModelData(v['children'], ch, _isrecursive=True)
+            self._fillItemByEntry(ch, v)
+
+            if v.isDir() and v.children:
+                self._setupModelData(v.children, ch, _isrecursive=True)
 
     def updateSubSection(self, index, data):
         logger.debug("updateSubSection at the row {}".format(index.row()))
@@ -463,51 +1128,186 @@ class TreeModel(QtCore.QAbstractItemModel):
         item = self.getItem(index)
         logger.debug("Item {} changed {}, state {}".format(item._itemData[0], item.isChanged(), item.getCheckState()))
         s = item.getCheckState()
-        # use names with string type as python cannot compare items directly
-        chnotfoundnames = self.getItem(index).childNames()[:]
-        # works well as data does not const complex objects
-        newdata = data[:]
+        check = item._pendingCheck
+        # they come back from data as new rows, the evicted ones keep their subtree
+        evicted = {v.name: v for v in item.takePending()
+                   if isinstance(v, _EvictedEntry) and v.isDir() and not v.unfilled}
+        byname = {v.name: v for v in data}
+        found = set()
         for ch in item._childItems:
-            for v in data:  # TODO should be dict of dicts to avoid second for
-                if ch._itemData[0] == v['name']:
-                    if item.isChanged():
-                        logger.debug("Update child {}".format(ch._itemData[0]))
-                        if (s == QtCore.Qt.Checked) or (s == QtCore.Qt.Unchecked):
-                            ch.setCheckState(s)
-                        self._addToChangedList(ch)
-
-                    self._fillItemByDict(ch, v)
-                    chnotfoundnames.remove(ch._itemData[0])
-                    newdata.remove(v)
-
-                    if iprop.Type[v['type']] is iprop.Type.DIRECTORY and len(v['children']) != ch.childCount():
-                        self.beginInsertRows(index, 0, len(v['children']))
-                        self._setupModelData(v['children'], ch, _isrecursive=True)
-                        self.endInsertRows()
+            v = byname.get(ch._itemData[0])
+            if v is None:
+                continue
+            if item.isChanged():
+                logger.debug("Update child {}".format(ch._itemData[0]))
+                if ((s == QtCore.Qt.Checked) or (s == QtCore.Qt.Unchecked)) and \
+                        ch.syncstatesystem is not iprop.SyncState.globalignore:
+                    ch.setCheckState(s)
+                    ch.setPendingCheckState(s)
+                self._addToChangedList(ch)
+
+            self._fillItemByEntry(ch, v)
+            found.add(v.name)
+
+            if v.isDir() and v.children:
+                chnames = set(ch.childNames())
+                newch = [c for c in v.children if c.name not in chnames]
+                if len(newch) > 0:
+                    self._insertEntries(self.indexItem(ch, index), newch, isrecursive=True)
 
         # remove unnecessary items
-        chlist = self.getItem(index)._childItems  # result is the link orig, use it later!
-        for nametorm in chnotfoundnames:
-            for i in range(len(chlist)):
-                if nametorm == chlist[i]._itemData[0]:
-                    self.beginRemoveRows(index, i, i+1)
-                    del chlist[i]
-                    self.endRemoveRows()
-                    break
+        for i in reversed(range(item.childCount())):
+            if item._childItems[i]._itemData[0] not in byname:
+                self.beginRemoveRows(index, i, i)
+                item.removeChild(i)
+                self.endRemoveRows()
 
+        newdata = [v for v in data if v.name not in found]
         # add new items
-        self.beginInsertRows(index, 0, len(newdata))
-        self._setupModelData(newdata, self.getItem(index))
-        self.endInsertRows()
+        if item is self._rootItem:
+            newdata = [v for v in newdata if v.name != '.stignoreglobal']
+        if len(evicted) > 0:
+            newdata = [self._keepEvicted(v, evicted.get(v.name)) for v in newdata]
+        if len(newdata) > 0:
+            first = item.childCount()
+            self._insertEntries(index, newdata)
+            if item.isChanged() and ((s == QtCore.Qt.Checked) or (s == QtCore.Qt.Unchecked)):
+                # the rows pending before had the state of the parent
+                for ch in item._childItems[first:]:
+                    if ch.syncstatesystem is iprop.SyncState.globalignore:
+                        continue
+                    ch.setCheckState(s)
+                    ch.setPendingCheckState(s)
+                    self._addToChangedList(ch)
+                item.setPendingCheckState(s)
+            elif check is not None:
+                # the state set by the user to the pending rows, as in _fetchRows
+                for ch in item._childItems[first:]:
+                    if ch.syncstatesystem is not iprop.SyncState.globalignore:
+                        ch.setCheckState(check)
+                        ch.setPendingCheckState(check)
+                        self._addToChangedList(ch)
+                item.setPendingCheckState(check)
+
+        # merged rows take their place in the current order
+        self._sortChildren([(item, index)])
 
         # update view
-        self.getItem(index).updateCheckState()
+        if index.isValid():
+            self.getItem(index).updateCheckState()
         super().dataChanged.emit(index, index, [QtCore.Qt.DisplayRole])
         
-        indfirst = self.index(0, 0, index)
-        indlast = self.index(self.rowCount(index), self.columnCount(index), index)
-        super().dataChanged.emit(indfirst, indlast, [QtCore.Qt.DisplayRole])
-        
+        if self.rowCount(index) > 0:
+            indfirst = self.index(0, 0, index)
+            indlast = self.index(self.rowCount(index) - 1, self.columnCount(index) - 1, index)
+            super().dataChanged.emit(indfirst, indlast, [QtCore.Qt.DisplayRole])
+        # sizes of the directory and its parents are aggregated
+        parent = index
+        while parent.isValid():
+            ind = self.index(parent.row(), 1, self.parent(parent))
+            super().dataChanged.emit(ind, ind, [QtCore.Qt.DisplayRole])
+            parent = self.parent(parent)
+        self._emitSelectedSize()
+        self._enforceBudget()
+
+    def _keepEvicted(self, v, old):
+        'the new entry of the directory with the evicted subtree of the old one'
+        if old is None or not v.isDir():
+            return v
+        rv = _EvictedEntry(v.name, v.type, old.children, v.syncstate)
+        rv.size = v.size
+        rv.modified = v.modified
+        rv.ignored = v.ignored
+        rv.partial = v.partial
+        rv.invalid = v.invalid
+        rv.summary = old.summary
+        return rv
+
+    def removeLocal(self, index):
+        '''
+        patches the item whose local copy is removed: the row known locally only is dropped,
+        the remote one and its subtree are ignored as the items without a local copy
+        '''
+        item = self.getItem(index)
+        pitem = item.parentItem()
+        parent = self.parent(index)
+        if item.syncstatesystem in _LOCAL_ONLY:
+            path = '/' + self.fullItemName(item)
+            self.beginRemoveRows(parent, item.row(), item.row())
+            pitem.removeChild(item.row())
+            self.endRemoveRows()
+            # nothing is left to submit for them
+            for p in [p for p in self._changedList if p == path or p.startswith(path + '/')]:
+                del self._changedList[p]
+        else:
+            self._dropLocal(item, index)
+            self.dataChanged.emit(index, self.index(index.row(), self.columnCount(parent) - 1, parent))
+        if parent.isValid() and pitem.childCount() + pitem.pendingCount() > 0:
+            pitem.updateCheckState()
+        # sizes of the parents are aggregated
+        while parent.isValid():
+            self.dataChanged.emit(parent, self.index(parent.row(), 1, self.parent(parent)))
+            parent = self.parent(parent)
+        self._emitSelectedSize()
+
+    def _dropLocal(self, item, index):
+        if item.syncstatesystem is iprop.SyncState.exists or \
+                item.syncstatesystem is iprop.SyncState.conflict:
+            item.setSyncState(iprop.SyncState.ignored, iprop.SyncType.system)
+        if not item.isfolder:
+            return
+        removed = False
+        for i in reversed(range(item.childCount())):
+            ch = item._childItems[i]
+            if ch.syncstatesystem in _LOCAL_ONLY:
+                self.beginRemoveRows(index, i, i)
+                item.removeChild(i)
+                self.endRemoveRows()
+                removed = True
+            else:
+                self._dropLocal(ch, self.index(i, 0, index))
+        if item._pendingFull and item.pendingCount() > 0:
+            check = item._pendingCheck
+            pending = item.takePending()
+            kept = [v for v in pending if v.syncstate not in _LOCAL_ONLY]
+            for i, v in enumerate(kept):
+                if (v.syncstate is iprop.SyncState.exists or v.syncstate is iprop.SyncState.conflict) and \
+                        not isinstance(v, _EvictedEntry):
+                    kept[i] = v = self._pendingCopy(v)
+                    v.syncstate = iprop.SyncState.ignored
+            item.queueChildren(kept, True)
+            if check is not None:
+                item.setPendingCheckState(check)
+            removed = removed or len(kept) != len(pending)
+        if removed and index.isValid() and item.childCount() + item.pendingCount() > 0:
+            item.updateCheckState()
+        if item.childCount() > 0:
+            self.dataChanged.emit(self.index(0, 0, index),
+                    self.index(item.childCount() - 1, self.columnCount(index) - 1, index))
+
+    def resolveConflicts(self, index, names):
+        '''
+        the children of names found to have the same content as the global version exist locally,
+        the rows and pending entries which are not in conflict anymore are kept
+        '''
+        item = self.getItem(index)
+        for row, ch in enumerate(item._childItems):
+            if ch._itemData[0] in names and ch.syncstatesystem is iprop.SyncState.conflict:
+                ch.setSyncState(iprop.SyncState.exists, iprop.SyncType.system)
+                self.dataChanged.emit(self.index(row, 0, index),
+                        self.index(row, self.columnCount(index) - 1, index))
+        if item._pendingFull and item.pendingCount() > 0:
+            check = item._pendingCheck
+            pending = item.takePending()
+            for i, v in enumerate(pending):
+                if v.name in names and v.syncstate is iprop.SyncState.conflict and \
+                        not isinstance(v, _EvictedEntry):
+                    pending[i] = v = self._pendingCopy(v)
+                    v.syncstate = iprop.SyncState.exists
+            item.queueChildren(pending, True)
+            if check is not None:
+                item.setPendingCheckState(check)
+
     def checkedStatePathList(self, plist = None, parent = None, pref = '/', state = QtCore.Qt.Checked):
         if plist is None:
             plist = []
@@ -520,10 +1320,23 @@ class TreeModel(QtCore.QAbstractItemModel):
                 plist.append(pref + item.data(0))
             if (state != QtCore.Qt.Checked) or (item.getCheckState() != QtCore.Qt.Checked) and (item.childCount() > 0):
                 self.checkedStatePathList(plist, item, pref + item.data(0) + '/', state)
+        if parent._pendingCheck is not None:
+            # the pending rows take the state set by the user when they are loaded
+            plist.extend(pref + v.name for v in parent._pending if parent.pendingCheckState(v) == state)
         return plist
     
     def changedPathList(self, plist = None, parent = None, pref = '/'):
-        return self._changedList
+        'the changed paths including the pending rows with the state set by the user'
+        rv = list(self._changedList)
+        stack = [(self._rootItem, '/')]
+        while stack:
+            item, pref = stack.pop()
+            if item._pendingCheck is not None:
+                rv.extend(p for p in (pref + v.name for v in item._pending
+                                      if v.syncstate is not iprop.SyncState.globalignore)
+                          if p not in self._changedList)
+            stack.extend((ch, pref + ch.data(0) + '/') for ch in item._childItems if ch.isfolder)
+        return rv
 
 
 
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from PySide2 import QtCore
+    from PySide2.QtCore import Signal
+except:
+    from PyQt5 import QtCore
+    from PyQt5.QtCore import pyqtSignal as Signal
+
+import logging
+logger = logging.getLogger("PySel.Worker")
+
+
+class WorkerSignals(QtCore.QObject):
+    finished = Signal(object)
+    error = Signal(str)
+
+
+class Worker(QtCore.QRunnable):
+    'runs fn(*args, **kwargs) in the global QThreadPool, the result comes back by signals'
+    def __init__(self, fn, *args, **kwargs):
+        QtCore.QRunnable.__init__(self)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            rv = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            logger.exception("Background job {} failed".format(self.fn.__name__))
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.finished.emit(rv)
+
+    def start(self):
+        QtCore.QThreadPool.globalInstance().start(self)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Scrolls an offscreen QTreeView over a flat folder and reports TreeModel.data() calls per second.
+
+    python benchmarks/render.py [--rows 100000] [--steps 300]
+'''
+
+import os
+import sys
+import time
+import argparse
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    from PySide2 import QtCore
+    from PySide2 import QtWidgets
+except:
+    from PyQt5 import QtCore
+    from PyQt5 import QtWidgets
+
+import ItemProperty as iprop
+from TreeModel import TreeModel
+
+STATES = [iprop.SyncState.syncing, iprop.SyncState.ignored, iprop.SyncState.newlocal,
+          iprop.SyncState.conflict, iprop.SyncState.exists, iprop.SyncState.globalignore]
+
+
+def makeEntries(rows):
+    rv = []
+    for i in range(rows):
+        v = iprop.FileEntry('file{:06d}.bin'.format(i), iprop.Type.DIRECTORY if i % 10 == 0 else iprop.Type.FILE)
+        v.size = i
+        v.ignored = i % 3 != 0
+        v.partial = False
+        v.syncstate = STATES[i % len(STATES)]
+        rv.append(v)
+    return rv
+
+
+class CountingModel(TreeModel):
+    calls = 0
+
+    def data(self, index, role):
+        CountingModel.calls += 1
+        return TreeModel.data(self, index, role)
+
+
+def run(rows, steps):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    tv = QtWidgets.QTreeView()
+    tv.resize(800, 1000)
+    tm = CountingModel(makeEntries(rows), tv)
+    root = QtCore.QModelIndex()
+    while tm.canFetchMore(root):
+        tm.fetchMore(root)
+    tv.setModel(tm)
+    tv.show()
+    app.processEvents()
+
+    sb = tv.verticalScrollBar()
+    CountingModel.calls = 0
+    start = time.perf_counter()
+    for i in range(steps):
+        sb.setValue(sb.maximum() * i // max(steps - 1, 1))
+        tv.viewport().repaint()
+    elapsed = time.perf_counter() - start
+    return CountingModel.calls, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--steps', type=int, default=300)
+    namespace = parser.parse_args()
+    calls, elapsed = run(namespace.rows, namespace.steps)
+    print("{} rows, {} scroll steps: {} data() calls in {:.3f} s, {:.0f} calls/s".format(
+        namespace.rows, namespace.steps, calls, elapsed, calls / elapsed))
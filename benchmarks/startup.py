@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Starts the window in fresh offscreen processes and reports the time to import MainWindow,
+to the first paint of the window and to the ready session, the medians of the runs.
+
+    python benchmarks/startup.py [--runs 10] [--import-budget 0.3] [--paint-budget 1.0]
+
+The exit status is 1 if a median exceeds its budget in seconds. The settings and the cache
+of the children are kept in a temporary directory, the ones of the user are not touched.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def child():
+    'one startup, the times from the start of the process are printed as json'
+    start = time.perf_counter()
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    sys.path.insert(0, ROOT)
+    tmp = tempfile.mkdtemp(prefix='pysel-startup-')
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(tmp, 'config')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(tmp, 'cache')
+    try:
+        childRun(start, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def childRun(start, tmp):
+    'the startup with the settings in tmp'
+    try:
+        from PySide2 import QtCore
+        from PySide2 import QtWidgets
+    except:
+        from PyQt5 import QtCore
+        from PyQt5 import QtWidgets
+    from MainWindow import MainWindow
+    rv = {'import': time.perf_counter() - start}
+
+    class PaintFilter(QtCore.QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QtCore.QEvent.Paint and 'paint' not in rv:
+                rv['paint'] = time.perf_counter() - start
+            return False
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    # the window reads QSettings("Syncthing-PySelective", "pysel") of the native format,
+    # files under XDG_CONFIG_HOME or the path set here except for the registry on Windows
+    for fmt in (QtCore.QSettings.NativeFormat, QtCore.QSettings.IniFormat):
+        for scope in (QtCore.QSettings.UserScope, QtCore.QSettings.SystemScope):
+            QtCore.QSettings.setPath(fmt, scope, os.path.join(tmp, 'config'))
+    mw = MainWindow()
+    rv['window'] = time.perf_counter() - start
+    paintFilter = PaintFilter()
+    mw.installEventFilter(paintFilter)
+    mw.show()
+
+    def poll():
+        if 'paint' in rv and getattr(mw.syncapi, 'session', None) is not None:
+            rv['session'] = time.perf_counter() - start
+            app.quit()
+    timer = QtCore.QTimer()
+    timer.timeout.connect(poll)
+    timer.start(1)
+    QtCore.QTimer.singleShot(10000, app.quit)
+    app.exec_()
+    print(json.dumps(rv), flush=True)
+
+
+def run(runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'],
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    keys = ['import', 'window', 'paint', 'session']
+    return {k: statistics.median(s[k] for s in samples) for k in keys if all(k in s for s in samples)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--import-budget', type=float, default=None, help='seconds for the import of MainWindow')
+    parser.add_argument('--paint-budget', type=float, default=None, help='seconds to the first paint')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    namespace = parser.parse_args()
+    if namespace.child:
+        child()
+        sys.exit(0)
+
+    medians = run(namespace.runs)
+    for k, v in medians.items():
+        print("{:8} {:8.1f} ms".format(k, v * 1000))
+    failed = False
+    for k, budget in (('import', namespace.import_budget), ('paint', namespace.paint_budget)):
+        if budget is not None and medians.get(k, float('inf')) > budget:
+            print("{} exceeds the budget of {:.1f} ms".format(k, budget * 1000))
+            failed = True
+    sys.exit(1 if failed else 0)
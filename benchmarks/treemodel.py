@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Times the core operations of TreeModel over synthetic folders of 10k, 100k and 1M items
+with the offscreen platform and prints the seconds as JSON, the best of the repeats.
+
+    python benchmarks/treemodel.py [--sizes 10000 100000 1000000] [--repeat 1]
+                                   [--save results.json] [--baseline results.json] [--threshold 1.25]
+
+A folder of n items has sqrt(n) directories of files at the root, every directory is loaded,
+the budget of items is above n so nothing is evicted. With --baseline the exit status is 1
+if an operation takes more than threshold times its time in the baseline file.
+'''
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    from PySide2 import QtCore
+    from PySide2 import QtWidgets
+except:
+    from PyQt5 import QtCore
+    from PyQt5 import QtWidgets
+
+import ItemProperty as iprop
+from TreeModel import TreeModel
+
+FORMAT = 1
+OPERATIONS = ['setupModelData', 'updateSubSection', 'setData', 'checkedStatePathList',
+              'fullItemName', 'parentRow']
+# faster operations are not compared, their time is mostly noise
+MIN_TIME = 0.005
+
+
+def makeEntry(name, isdir, i, children=None):
+    v = iprop.FileEntry(name, iprop.Type.DIRECTORY if isdir else iprop.Type.FILE, children)
+    v.size = 0 if isdir else i
+    v.ignored = i % 3 != 0
+    v.partial = False
+    v.syncstate = iprop.SyncState.ignored if v.ignored else iprop.SyncState.syncing
+    return v
+
+
+def makeFolder(nodes):
+    'the root entries and the entries of each directory by its name'
+    dirs = max(int(math.sqrt(nodes)), 1)
+    files = max(nodes // dirs - 1, 0)
+    root = []
+    contents = {}
+    for d in range(dirs):
+        name = 'dir{:05d}'.format(d)
+        contents[name] = [makeEntry('file{:05d}.bin'.format(f), False, d + f) for f in range(files)]
+        # the children are known by name before the directory is loaded
+        root.append(makeEntry(name, True, d,
+                [iprop.FileEntry(v.name, v.type) for v in contents[name]]))
+    return root, contents
+
+
+def timed(rv, op, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    rv[op] = min(rv.get(op, float('inf')), time.perf_counter() - start)
+
+
+def runOnce(nodes, rv):
+    root, contents = makeFolder(nodes)
+    tm = TreeModel()
+    tm.setItemBudget(2 * nodes)
+    timed(rv, 'setupModelData', tm._setupModelData, root, None, False, False)
+
+    top = [tm.index(r, 0) for r in range(tm.rowCount())]
+    def update():
+        for index in top:
+            tm.updateSubSection(index, contents[tm.data(index, QtCore.Qt.DisplayRole)])
+    timed(rv, 'updateSubSection', update)
+
+    def toggle():
+        # every directory is checked and unchecked with all its files, then every second is checked
+        for value in (QtCore.Qt.Checked, QtCore.Qt.Unchecked):
+            for index in top:
+                tm.setData(index, value, QtCore.Qt.CheckStateRole)
+        for index in top[::2]:
+            tm.setData(index, QtCore.Qt.Checked, QtCore.Qt.CheckStateRole)
+    timed(rv, 'setData', toggle)
+
+    def checked():
+        tm.checkedStatePathList()
+        tm.checkedStatePathList(state=QtCore.Qt.Unchecked)
+    timed(rv, 'checkedStatePathList', checked)
+
+    leaves = [tm.index(r, 0, index) for index in top for r in range(tm.rowCount(index))]
+    items = [tm.getItem(index) for index in leaves]
+    def names():
+        for item in items:
+            tm.fullItemName(item)
+    timed(rv, 'fullItemName', names)
+
+    def parents():
+        for index in leaves:
+            tm.parent(index)
+        for item in items:
+            item.row()
+    timed(rv, 'parentRow', parents)
+    return tm.itemCount()
+
+
+def run(sizes, repeat):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    results = {}
+    for nodes in sizes:
+        rv = {}
+        for _ in range(repeat):
+            items = runOnce(nodes, rv)
+            # the events left by a run are not handled within the timings of the next one
+            app.processEvents()
+        rv = {op: round(rv[op], 6) for op in OPERATIONS}
+        rv['items'] = items
+        results[str(nodes)] = rv
+    return {'format': FORMAT, 'results': results}
+
+
+def regressions(current, baseline, threshold):
+    rv = []
+    for nodes, ops in current['results'].items():
+        base = baseline.get('results', {}).get(nodes)
+        if base is None:
+            continue
+        for op in OPERATIONS:
+            if op in base and ops[op] >= MIN_TIME and ops[op] > base[op] * threshold:
+                rv.append("{} items, {}: {:.4f} s, {:.4f} s in the baseline".format(nodes, op, ops[op], base[op]))
+    return rv
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--save', default=None, help='write the results into the file')
+    parser.add_argument('--baseline', default=None, help='results to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25, help='allowed ratio to the baseline')
+    namespace = parser.parse_args()
+
+    current = run(namespace.sizes, namespace.repeat)
+    text = json.dumps(current, indent=2, sort_keys=True)
+    print(text)
+    if namespace.save is not None:
+        with open(namespace.save, 'w') as f:
+            f.write(text + '\n')
+    if namespace.baseline is not None:
+        with open(namespace.baseline) as f:
+            failed = regressions(current, json.load(f), namespace.threshold)
+        for line in failed:
+            print("Regression: " + line, file=sys.stderr)
+        sys.exit(1 if failed else 0)
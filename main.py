@@ -5,8 +5,10 @@ import logging
 import argparse
 
 try:
+    from PySide2 import QtCore
     from PySide2 import QtWidgets
 except:
+    from PyQt5 import QtCore
     from PyQt5 import QtWidgets
 
 from MainWindow import MainWindow
@@ -16,8 +18,44 @@ def createParser():
     parser.add_argument('-v', '--verbose', action = 'store_true', help = 'print more info about actions')
     parser.add_argument('-vv', '--debug', action = 'store_true', help = 'output all messages for debug purposes')
     parser.add_argument('-l', '--logfile', nargs='?', default = '', help = 'set log file name (default: pysel.log )')
+    parser.add_argument('--daemon', action = 'store_true', help = 'run without window and keep folder trees warm for attached viewers')
+    parser.add_argument('--attach', action = 'store_true', help = 'use the running daemon instead of connecting to syncthing directly')
+    parser.add_argument('--events', action = 'store_true', help = 'print the snapshot of the running daemon and then its changes')
+    parser.add_argument('--socket', default = None, help = 'socket of the daemon (default: pysel-<user>.sock in the runtime directory or ~/.pysel)')
     return parser
 
+def runDaemon(namespace):
+    from Daemon import SyncthingDaemon
+    daemon = SyncthingDaemon()
+    # the same connection settings as in the window
+    settings = QtCore.QSettings("Syncthing-PySelective", "pysel");
+    settings.beginGroup("Syncthing");
+    daemon.api_url_base = settings.value("apiurl", daemon.api_url_base)
+    daemon.api_token = settings.value("apikey", "None")
+    settings.endGroup();
+    settings.beginGroup("Options");
+    daemon.limiter.setCeiling(settings.value("maxrequests", daemon.limiter.ceiling, type=int))
+    settings.endGroup();
+    daemon.startSession()
+    try:
+        daemon.serve(namespace.socket)
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        logging.getLogger("PySel").error(e)
+        return 1
+
+def printEvents(namespace):
+    import json
+    from Daemon import DaemonAPI
+    api = DaemonAPI(namespace.socket)
+    print(json.dumps(api.snapshot()), flush=True)
+    t = api.subscribe(lambda delta: print(json.dumps(delta), flush=True))
+    try:
+        t.join()
+    except KeyboardInterrupt:
+        pass
+
 if __name__ == "__main__":
     import sys
     parser = createParser()
@@ -39,8 +77,16 @@ if __name__ == "__main__":
 
     logger = logging.getLogger("PySel")
     logger.info('PySelective started')
+    if namespace.daemon:
+        sys.exit(runDaemon(namespace))
+    if namespace.events:
+        sys.exit(printEvents(namespace))
+    syncapi = None
+    if namespace.attach:
+        from Daemon import DaemonAPI
+        syncapi = DaemonAPI(namespace.socket)
     app = QtWidgets.QApplication(sys.argv)
-    mw = MainWindow()
+    mw = MainWindow(syncapi)
     mw.show()
     sys.exit(app.exec_())
 
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+'entries of a synthetic folder shared by the tests'
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ItemProperty as iprop
+
+
+def entry(name, isdir=False, size=1, ignored=True, partial=False, children=None):
+    v = iprop.FileEntry(name, iprop.Type.DIRECTORY if isdir else iprop.Type.FILE, children)
+    v.size = 0 if isdir else size
+    v.ignored = ignored
+    v.partial = partial
+    v.syncstate = iprop.SyncState.partial if partial else \
+                  iprop.SyncState.ignored if ignored else iprop.SyncState.syncing
+    return v
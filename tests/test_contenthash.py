@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import base64
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ItemProperty as iprop
+from ContentHash import ContentVerifier, hashBlocks, blocksHash
+
+# sha256 over the sha256 of each block and its big endian weak hash
+EMPTY = 'd3bfe98e8f1ce891614854569a20f5f4508d6ab4025b872b7b3a8282ef75b12a'
+HELLO = b'hello world\n'
+HELLO_WEAK = '3f239ad116d5263377587b05e995ce95142f530fd76a1e33681bc9b2e34f582b'
+HELLO_NOWEAK = '7168a956d53591ab76a8b04ef592fad8487ed003a0360fe8bdf0d3439131221b'
+
+
+def conflict(name, size, h):
+    v = iprop.FileEntry(name, iprop.Type.FILE, syncstate=iprop.SyncState.conflict)
+    v.size = size
+    v.blockshash = base64.b64encode(bytes.fromhex(h)).decode()
+    return v
+
+
+class BlocksHashTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for name, data in (('empty', b''), ('hello', HELLO)):
+            with open(os.path.join(self.tmp.name, name), 'wb') as f:
+                f.write(data)
+
+    def test_known_digests(self):
+        blocks = hashBlocks(os.path.join(self.tmp.name, 'empty'), 0)
+        self.assertEqual(blocksHash(blocks).hex(), EMPTY)
+        self.assertEqual(blocksHash(blocks, weak=False).hex(), EMPTY)
+        blocks = hashBlocks(os.path.join(self.tmp.name, 'hello'), len(HELLO))
+        self.assertEqual(blocksHash(blocks).hex(), HELLO_WEAK)
+        self.assertEqual(blocksHash(blocks, weak=False).hex(), HELLO_NOWEAK)
+
+    def test_refine(self):
+        verifier = ContentVerifier(os.path.join(self.tmp.name, 'hashes.sqlite'), workers=2)
+        self.addCleanup(verifier.close)
+        l = [conflict('empty', 0, EMPTY), conflict('hello', len(HELLO), HELLO_NOWEAK),
+             conflict('other', len(HELLO), HELLO_WEAK), conflict('gone', 1, EMPTY)]
+        with open(os.path.join(self.tmp.name, 'other'), 'wb') as f:
+            f.write(b'hello World\n')
+        verifier.refineConflicts(l, self.tmp.name)
+        self.assertEqual([v.syncstate for v in l], [iprop.SyncState.exists, iprop.SyncState.exists,
+                                                    iprop.SyncState.conflict, iprop.SyncState.conflict])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SyncthingAPI import SyncthingAPI
+from Daemon import SyncthingDaemon, isListening
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        def get(api, suff):
+            self.sent.append(suff)
+            return {'suff': suff}
+        patcher = mock.patch.object(SyncthingAPI, '_getRequest', get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bounded(self):
+        daemon = SyncthingDaemon(maxcached=2)
+        for suff in ('db/browse?folder=a', 'db/browse?folder=b', 'db/browse?folder=a', 'db/browse?folder=c'):
+            daemon._getRequest(suff)
+        # b was the least recently used one
+        self.assertEqual(list(daemon._cache), ['db/browse?folder=a', 'db/browse?folder=c'])
+        daemon._getRequest('db/browse?folder=b')
+        self.assertEqual(self.sent.count('db/browse?folder=b'), 2)
+        self.assertEqual(self.sent.count('db/browse?folder=a'), 1)
+
+    def test_ignores_not_cached(self):
+        daemon = SyncthingDaemon()
+        daemon._getRequest('db/ignores?folder=a')
+        daemon._getRequest('db/ignores?folder=a')
+        self.assertEqual(self.sent, ['db/ignores?folder=a'] * 2)
+        self.assertEqual(len(daemon._cache), 0)
+
+
+class AccessTest(unittest.TestCase):
+    def setUp(self):
+        self.posted = []
+        def get(api, suff):
+            return {'folders': [{'id': 'a', 'label': 'A', 'path': '/a', 'devices': []}],
+                    'gui': {'apiKey': 'secret'}}
+        for name, fn in (('_getRequest', get), ('_postRequest', lambda api, suff, d: self.posted.append(suff))):
+            patcher = mock.patch.object(SyncthingAPI, name, fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_endpoints(self):
+        daemon = SyncthingDaemon()
+        rv = daemon.handle({'op': 'get', 'suff': 'system/config'})
+        self.assertEqual(rv['data'], {'folders': [{'id': 'a', 'label': 'A', 'path': '/a'}]})
+        self.assertFalse(daemon.handle({'op': 'get', 'suff': 'system/shutdown'})['ok'])
+        self.assertFalse(daemon.handle({'op': 'post', 'suff': 'system/config', 'data': {}})['ok'])
+        self.assertTrue(daemon.handle({'op': 'post', 'suff': 'db/ignores?folder=a', 'data': {}})['ok'])
+        self.assertEqual(self.posted, ['db/ignores?folder=a'])
+
+    def test_token(self):
+        daemon = SyncthingDaemon()
+        self.assertTrue(daemon.authorized({'op': 'get'}))
+        daemon._token = 'abc'
+        self.assertFalse(daemon.authorized({'op': 'get'}))
+        self.assertFalse(daemon.authorized({'op': 'get', 'token': 'abd'}))
+        self.assertTrue(daemon.authorized({'op': 'get', 'token': 'abc'}))
+
+
+class ServeTest(unittest.TestCase):
+    def test_refuses_live_socket(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            address = os.path.join(tmp, 'pysel.sock')
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as other:
+                other.bind(address)
+                other.listen(1)
+                self.assertTrue(isListening(address))
+                with self.assertRaises(RuntimeError):
+                    SyncthingDaemon().serve(address)
+                self.assertTrue(os.path.exists(address))
+            # the socket file of a stopped daemon is stale
+            self.assertFalse(isListening(address))
+
+
+if __name__ == '__main__':
+    unittest.main()
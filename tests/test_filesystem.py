@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ItemProperty as iprop
+from FileSystem import FileSystem, ScanCache, RACY_NS
+
+
+class ScanCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.filename = os.path.join(self.tmp.name, 'scans.sqlite')
+
+    def rows(self):
+        with sqlite3.connect(self.filename) as db:
+            return sorted(v[0] for v in db.execute('SELECT path FROM dirs'))
+
+    def test_pruned_on_opening(self):
+        cache = ScanCache(self.filename)
+        for i in range(5):
+            cache.put('/d{}'.format(i), (1, i, 1), {})
+        cache._db.execute("UPDATE dirs SET used=used-100 WHERE path='/d0'")
+        cache._db.execute("UPDATE dirs SET used=used-10 WHERE path IN ('/d1', '/d2')")
+        cache.close()
+        ScanCache(self.filename, maxage=50).close()
+        self.assertEqual(self.rows(), ['/d1', '/d2', '/d3', '/d4'])
+        ScanCache(self.filename, maxrows=2).close()
+        self.assertEqual(self.rows(), ['/d3', '/d4'])
+
+
+class LazyCacheTest(unittest.TestCase):
+    def test_opened_by_listing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cache', 'scans.sqlite')
+            fs = FileSystem(filename)
+            self.assertFalse(os.path.exists(os.path.dirname(filename)))
+            fs.listDir(tmp)
+            fs.close()
+            self.assertTrue(os.path.exists(filename))
+
+
+class ListingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.local = os.path.join(self.tmp.name, 'local')
+        os.mkdir(self.local)
+        self.fs = FileSystem(os.path.join(self.tmp.name, 'scans.sqlite'))
+        self.addCleanup(self.fs.close)
+
+    def test_cached_new_file_has_current_size(self):
+        fn = os.path.join(self.local, 'new.txt')
+        with open(fn, 'wb') as f:
+            f.write(b'a')
+        old = time.time_ns() - 2 * RACY_NS
+        os.utime(self.local, ns=(old, old))
+        self.assertFalse(self.fs.listDir(self.local)[1])
+        # writing into the file keeps the mtime of the directory
+        with open(fn, 'ab') as f:
+            f.write(b'bc')
+        self.assertTrue(self.fs.listDir(self.local)[1])
+        l = []
+        self.fs.extendByLocal(l, self.local)
+        self.assertEqual([(v.name, v.size, v.syncstate) for v in l], [('new.txt', 3, iprop.SyncState.newlocal)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from IgnorePatterns import IgnoreMatcher, compactSelective
+
+CHILDREN = {'dir': ['a', 'b'], 'dir/a': ['x', 'y']}
+PATHS = ['dir', 'dir/a', 'dir/a/x', 'dir/a/y', 'dir/b', 'other']
+
+
+def synced(lines):
+    'the paths which are not ignored and their parents, as in MainWindow._verifyCompacted'
+    rv = set()
+    for p, ig in zip(PATHS, IgnoreMatcher(lines + ['*']).ignoredList(PATHS)):
+        while not ig and p:
+            rv.add(p)
+            p = p.rpartition('/')[0]
+    return rv
+
+
+class CompactSelectiveTest(unittest.TestCase):
+    def check(self, lines, expected):
+        rv = compactSelective(lines, CHILDREN.get)
+        self.assertEqual(rv, expected)
+        self.assertEqual(synced(rv), synced(lines))
+
+    def test_children_collapse(self):
+        self.check(['!/dir/a', '!/dir/b'], ['!/dir'])
+
+    def test_nested_collapse(self):
+        self.check(['!/dir/a/x', '!/dir/a/y', '!/dir/b'], ['!/dir'])
+
+    def test_lines_under_included_parent(self):
+        self.check(['!/dir', '!/dir/a', '!/dir/b/c'], ['!/dir'])
+
+    def test_legacy_lines_after_children(self):
+        # Syncthing before 1.6: the content of a partial directory is ignored after its children
+        lines = ['!/dir/a', '!/dir/b', '/dir/**', '!/dir']
+        self.check(lines, lines)
+
+    def test_exclude_between_child_and_parent(self):
+        lines = ['!/dir/a', '/dir/a/x', '!/dir']
+        self.check(lines, lines)
+
+    def test_unrelated_exclude(self):
+        self.check(['!/dir/a', '/other', '!/dir/b'], ['!/dir', '/other'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    from PySide2 import QtCore
+    from PySide2 import QtWidgets
+except:
+    from PyQt5 import QtCore
+    from PyQt5 import QtWidgets
+
+import ItemProperty as iprop
+from TreeModel import TreeModel, FETCH_PAGE
+from helpers import entry
+from IgnorePatterns import mergeSelective, selectiveIncludes
+from SelectionSnapshot import writeSelection, readSelection
+
+app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+
+
+class PagedSelectionTest(unittest.TestCase):
+    'the selection of rows which are not materialized is exported from the ignore list'
+
+    def setUp(self):
+        names = ['f{:04d}'.format(i) for i in range(3000)]
+        self.tm = TreeModel([entry('D', True, partial=True, children=[iprop.FileEntry(n) for n in names])])
+        index = self.tm.index(0, 0)
+        self.tm.updateSubSection(index, [entry(n, ignored=n != 'f2500') for n in names])
+        self.assertEqual(self.tm.rowCount(index), 2 * FETCH_PAGE)
+        self.selective = ['!/D/f2500']
+
+    def exported(self, fn):
+        cl = self.tm.changedPathList()
+        il = mergeSelective(self.selective, cl, self.tm.checkedStatePathList(),
+                self.tm.checkedStatePathList(state=QtCore.Qt.PartiallyChecked))
+        checked, partial = selectiveIncludes(il)
+        writeSelection(fn, checked, partial, cl)
+
+    def test_pending_row_is_exported(self):
+        self.assertEqual(self.tm.checkedStatePathList(), [])
+        with tempfile.TemporaryDirectory() as d:
+            fn = os.path.join(d, 'sel.pysel')
+            self.exported(fn)
+            checked, partial, changed = readSelection(fn)
+        self.assertEqual(checked, ['/D/f2500'])
+        self.assertEqual(partial, ['/D'])
+        # the import replaces the section by the saved paths
+        paths = sorted(set(checked) | set(partial) | set(changed))
+        self.assertEqual(mergeSelective([], paths, checked, partial), ['!/D/f2500'])
+
+    def test_changes_of_loaded_rows_are_merged(self):
+        self.tm.setData(self.tm.index(5, 0, self.tm.index(0, 0)), QtCore.Qt.Checked, QtCore.Qt.CheckStateRole)
+        with tempfile.TemporaryDirectory() as d:
+            fn = os.path.join(d, 'sel.pysel.gz')
+            self.exported(fn)
+            checked, partial, changed = readSelection(fn)
+        self.assertEqual(checked, ['/D/f0005', '/D/f2500'])
+        self.assertEqual(partial, ['/D'])
+
+
+class PendingCheckTest(unittest.TestCase):
+    'the state set by the user to the rows which are not materialized is submitted'
+
+    def test_checked_directory_with_pending_rows(self):
+        names = ['f{:04d}'.format(i) for i in range(3 * FETCH_PAGE)]
+        tm = TreeModel([entry('D', True, children=[iprop.FileEntry(n) for n in names])])
+        index = tm.index(0, 0)
+        tm.updateSubSection(index, [entry(n) for n in names])
+        self.assertEqual(tm.getItem(index).pendingCount(), FETCH_PAGE)
+        tm.setData(index, QtCore.Qt.Checked, QtCore.Qt.CheckStateRole)
+        tm.setData(tm.index(0, 0, index), QtCore.Qt.Unchecked, QtCore.Qt.CheckStateRole)
+        il = mergeSelective([], tm.changedPathList(), tm.checkedStatePathList(),
+                tm.checkedStatePathList(state=QtCore.Qt.PartiallyChecked))
+        self.assertEqual(sorted(il), ['!/D/' + n for n in names[1:]])
+        while tm.canFetchMore(index):
+            tm.fetchMore(index)
+        self.assertEqual(sorted(tm.checkedStatePathList()), ['/D/' + n for n in names[1:]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SyncthingAPI import SyncthingAPI, ConcurrencyLimiter, PREWARM_AGE
+
+
+def request(limiter, latency, endpoint='db/browse', failed=False):
+    'a request which took the latency in seconds'
+    limiter.acquire()
+    limiter.release(time.monotonic() - latency, endpoint, failed)
+
+
+class LimiterTest(unittest.TestCase):
+    def test_slow_endpoint_keeps_limit(self):
+        limiter = ConcurrencyLimiter(ceiling=4, initial=4)
+        for _ in range(5):
+            request(limiter, 0.01)
+        for _ in range(50):
+            request(limiter, 2.0)
+            self.assertEqual(limiter.limit, 4)
+
+    def test_slow_response_holds_growth(self):
+        limiter = ConcurrencyLimiter(ceiling=8, initial=2)
+        request(limiter, 0.01)
+        limit = limiter._limit
+        request(limiter, 2.0)
+        self.assertEqual(limiter._limit, limit)
+
+    def test_failure_halves(self):
+        limiter = ConcurrencyLimiter(ceiling=8, initial=8)
+        request(limiter, 0.01, failed=True)
+        self.assertEqual(limiter.limit, 4)
+        # the requests sent before the decrease do not decrease it again
+        limiter.acquire()
+        limiter.release(time.monotonic() - 10, 'db/browse', True)
+        self.assertEqual(limiter.limit, 4)
+
+
+class CoalesceTest(unittest.TestCase):
+    def test_own_copies(self):
+        api = SyncthingAPI()
+        self.addCleanup(api.close)
+        release = threading.Event()
+        def send(suff):
+            release.wait(5)
+            return {'children': [{'name': 'a'}]}
+        api._sendGetRequest = send
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(api._getRequest('db/browse?folder=a')))
+                   for _ in range(3)]
+        for t in threads:
+            t.start()
+        while api.requestCounters()['coalesced'] < 2:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(api.requestCounters()['sent'], 1)
+        self.assertEqual(len(results), 3)
+        results[0]['children'][0]['name'] = 'changed'
+        self.assertEqual([r['children'][0]['name'] for r in results[1:]], ['a', 'a'])
+        self.assertEqual(len({id(r['children']) for r in results}), 3)
+
+
+class PrewarmTest(unittest.TestCase):
+    def setUp(self):
+        self.api = SyncthingAPI()
+        self.addCleanup(self.api.close)
+        self.api.api_version = self.api.verStr2Num('1.14.0')
+        self.sent = []
+        def send(suff):
+            self.sent.append(suff)
+            return {'ignore': []} if suff.startswith('db/ignores') else []
+        self.api._sendGetRequest = send
+
+    def test_used_once(self):
+        self.api.prewarmFolders(['a'])
+        self.api.browseFolderPartial('a')
+        self.api.browseFolderPartial('a')
+        self.assertEqual(self.sent.count('db/browse?folder=a&levels=0'), 2)
+
+    def test_old_result_dropped(self):
+        self.api.prewarmFolders(['a'])
+        self.api._prewarmed['db/browse?folder=a&levels=0'][1].result()
+        with mock.patch('time.monotonic', return_value=time.monotonic() + PREWARM_AGE + 1):
+            self.api.browseFolderPartial('a')
+        self.assertEqual(self.sent.count('db/browse?folder=a&levels=0'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
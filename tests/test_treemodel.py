@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    from PySide2 import QtCore
+    from PySide2 import QtWidgets
+except:
+    from PyQt5 import QtCore
+    from PyQt5 import QtWidgets
+
+import ItemProperty as iprop
+from TreeModel import TreeModel, FETCH_PAGE
+from helpers import entry
+from IgnorePatterns import compileGlob
+
+app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+
+
+class PatternTest(unittest.TestCase):
+    def test_pending_rows_match(self):
+        files = [entry('file{:04d}.{}'.format(i, 'mkv' if i % 2 == 0 else 'txt')) for i in range(2500)]
+        tm = TreeModel(files)
+        self.assertEqual(tm.rowCount(), FETCH_PAGE)
+        self.assertEqual(tm.setCheckStateByRegex(compileGlob('*.mkv'), QtCore.Qt.Checked), 1250)
+        while tm.canFetchMore(QtCore.QModelIndex()):
+            tm.fetchMore(QtCore.QModelIndex())
+        checked = tm.checkedStatePathList()
+        self.assertEqual(len(checked), 1250)
+        self.assertTrue(all(p.endswith('.mkv') for p in checked))
+
+    def test_content_of_pending_directory_matches(self):
+        dirs = [entry('dir{:04d}'.format(i), True, children=[iprop.FileEntry('a.mkv'), iprop.FileEntry('b.txt')])
+                for i in range(FETCH_PAGE + 10)]
+        tm = TreeModel(dirs)
+        self.assertEqual(tm.setCheckStateByRegex(compileGlob('/dir1005/*.mkv'), QtCore.Qt.Checked), 1)
+        self.assertEqual(tm.checkedStatePathList(), ['/dir1005/a.mkv'])
+
+
+class LookupTest(unittest.TestCase):
+    def test_pending_rows_stay_pending(self):
+        dirs = [entry('dir{:04d}'.format(i), True, children=[iprop.FileEntry('a.mkv')]) for i in range(FETCH_PAGE + 10)]
+        tm = TreeModel(dirs)
+        self.assertFalse(tm.indexByPath('dir1005/a.mkv', fetch=False).isValid())
+        self.assertEqual(tm.rowCount(), FETCH_PAGE)
+        self.assertTrue(tm.indexByPath('dir0005', fetch=False).isValid())
+        self.assertTrue(tm.indexByPath('dir1005').isValid())
+        self.assertEqual(tm.rowCount(), FETCH_PAGE + 10)
+
+
+class SortTest(unittest.TestCase):
+    def names(self, tm, parent=QtCore.QModelIndex()):
+        return [tm.data(tm.index(r, 0, parent), QtCore.Qt.DisplayRole) for r in range(tm.rowCount(parent))]
+
+    def test_loaded_rows_are_the_head(self):
+        files = [entry('file{:04d}'.format(i), size=i, ignored=i % 2 == 0) for i in range(5000)]
+        tm = TreeModel(files)
+        selected = tm.selectedSize()
+        tm.sort(1, QtCore.Qt.DescendingOrder)
+        self.assertEqual(tm.itemCount(), FETCH_PAGE)
+        self.assertEqual(self.names(tm), ['file{:04d}'.format(i) for i in range(4999, 4999 - FETCH_PAGE, -1)])
+        self.assertEqual(tm.selectedSize(), selected)
+        tm.fetchMore(QtCore.QModelIndex())
+        self.assertEqual(self.names(tm)[FETCH_PAGE - 1:FETCH_PAGE + 1], ['file{:04d}'.format(4999 - FETCH_PAGE + 1),
+                                                                         'file{:04d}'.format(4999 - FETCH_PAGE)])
+        tm.sort(0, QtCore.Qt.AscendingOrder)
+        self.assertEqual(self.names(tm), ['file{:04d}'.format(i) for i in range(2 * FETCH_PAGE)])
+        while tm.canFetchMore(QtCore.QModelIndex()):
+            tm.fetchMore(QtCore.QModelIndex())
+        self.assertEqual(self.names(tm), ['file{:04d}'.format(i) for i in range(5000)])
+        self.assertEqual(tm.selectedSize(), selected)
+        self.assertEqual(len(tm.checkedStatePathList()), 2500)
+
+    def test_only_pending_rows(self):
+        dirs = [entry('dir{:04d}'.format(i), True, children=[iprop.FileEntry('a.mkv'), iprop.FileEntry('b.txt')])
+                for i in range(3)]
+        tm = TreeModel(dirs)
+        # the collapsed directories keep their rows as pending entries
+        tm.setItemBudget(3)
+        tm.sort(0, QtCore.Qt.DescendingOrder)
+        self.assertEqual(self.names(tm), ['dir0002', 'dir0001', 'dir0000'])
+        index = tm.index(0, 0)
+        self.assertEqual(tm.rowCount(index), 0)
+        tm.fetchMore(index)
+        self.assertEqual(self.names(tm, index), ['b.txt', 'a.mkv'])
+
+
+class ConflictTest(unittest.TestCase):
+    def test_resolved_rows_and_pending(self):
+        files = []
+        for i in range(FETCH_PAGE + 10):
+            v = entry('file{:04d}'.format(i))
+            v.syncstate = iprop.SyncState.conflict
+            files.append(v)
+        tm = TreeModel(files)
+        names = {'file0000', 'file{:04d}'.format(FETCH_PAGE + 5)}
+        tm.resolveConflicts(QtCore.QModelIndex(), names)
+        # the entries of the caller are not changed
+        self.assertTrue(all(v.syncstate is iprop.SyncState.conflict for v in files))
+        while tm.canFetchMore(QtCore.QModelIndex()):
+            tm.fetchMore(QtCore.QModelIndex())
+        states = {tm.getItem(tm.index(i, 0)).data(0): tm.getItem(tm.index(i, 0)).getSyncState()
+                  for i in range(tm.rowCount())}
+        self.assertEqual({n for n, st in states.items() if st is iprop.SyncState.exists}, names)
+        self.assertEqual(len(states), FETCH_PAGE + 10)
+
+
+if __name__ == '__main__':
+    unittest.main()